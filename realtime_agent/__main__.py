@@ -0,0 +1,5 @@
+# Entry point of `python -m realtime_agent server|agent`. multiprocessing does not execute the `__main__`
+# module of a package again in the agent processes, so they do not run the server module.
+from .main import main
+
+main()
@@ -0,0 +1,250 @@
+import abc
+import asyncio
+import importlib
+import json
+import logging
+import os
+import time
+from typing import Any
+
+from .logger import setup_logger
+from .realtime.struct import PCM_SAMPLE_RATE, Response
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+BYTES_PER_S = PCM_SAMPLE_RATE * 2  # pcm16 mono
+
+# Token counters of a session, summed per tenant
+TOKEN_FIELDS = (
+    "input_tokens",
+    "input_text_tokens",
+    "input_audio_tokens",
+    "input_cached_tokens",
+    "output_tokens",
+    "output_text_tokens",
+    "output_audio_tokens",
+    "total_tokens",
+)
+COUNTER_FIELDS = (*TOKEN_FIELDS, "responses", "cancelled_responses", "uplink_s", "downlink_s")
+
+# Price keys of USAGE_PRICES, in currency per million tokens
+PRICE_FIELDS = {
+    "text_input": "input_text_tokens",
+    "cached_input": "input_cached_tokens",
+    "audio_input": "input_audio_tokens",
+    "text_output": "output_text_tokens",
+    "audio_output": "output_audio_tokens",
+}
+
+
+def prices_from_env() -> dict[str, float]:
+    """USAGE_PRICES, e.g. "text_input=5,cached_input=2.5,audio_input=100,text_output=20,audio_output=200"."""
+    prices = {}
+    for entry in os.environ.get("USAGE_PRICES", "").split(","):
+        if "=" in entry:
+            key, value = entry.split("=", 1)
+            if key.strip() not in PRICE_FIELDS:
+                raise ValueError(f"Unknown price {key.strip()}, expected one of {sorted(PRICE_FIELDS)}")
+            prices[key.strip()] = float(value)
+    return prices
+
+
+class SessionUsage:
+    """Token usage and audio duration of one call, from the usage of every response."""
+
+    def __init__(self, channel: str, tenant: str | None = None) -> None:
+        self.channel = channel
+        self.tenant = tenant
+        self.started_at = time.time()
+        self.counters: dict[str, float] = dict.fromkeys(COUNTER_FIELDS, 0)
+
+    def record_response(self, response: Response) -> None:
+        self.counters["responses"] += 1
+        if response.status == "cancelled":
+            self.counters["cancelled_responses"] += 1
+        usage = response.usage
+        if usage is None:
+            return
+        self.counters["input_tokens"] += usage.input_tokens
+        self.counters["output_tokens"] += usage.output_tokens
+        self.counters["total_tokens"] += usage.total_tokens
+        if usage.input_token_details:
+            self.counters["input_text_tokens"] += usage.input_token_details.text_tokens
+            self.counters["input_audio_tokens"] += usage.input_token_details.audio_tokens
+            self.counters["input_cached_tokens"] += usage.input_token_details.cached_tokens
+        if usage.output_token_details:
+            self.counters["output_text_tokens"] += usage.output_token_details.text_tokens
+            self.counters["output_audio_tokens"] += usage.output_token_details.audio_tokens
+
+    def add_uplink(self, data: bytes) -> None:
+        self.counters["uplink_s"] += len(data) / BYTES_PER_S
+
+    def add_downlink(self, data: bytes) -> None:
+        self.counters["downlink_s"] += len(data) / BYTES_PER_S
+
+    def to_dict(self, prices: dict[str, float] | None = None) -> dict[str, Any]:
+        counters = self.counters
+        record = {
+            "kind": "session",
+            "channel": self.channel,
+            "tenant": self.tenant,
+            "started_at": self.started_at,
+            "ended_at": time.time(),
+            **{name: round(value, 3) for name, value in counters.items()},
+            # context growth shows as input tokens per response, silence sent to the model as audio tokens per uplink minute
+            "input_tokens_per_response": round(counters["input_tokens"] / counters["responses"]) if counters["responses"] else 0,
+            "input_audio_tokens_per_uplink_minute": (
+                round(counters["input_audio_tokens"] / counters["uplink_s"] * 60) if counters["uplink_s"] else 0
+            ),
+        }
+        if prices:
+            record["cost"] = _cost(record, prices)
+        return record
+
+
+class UsageExporter(abc.ABC):
+    """Destination of the usage records."""
+
+    @abc.abstractmethod
+    async def export(self, records: list[dict[str, Any]]) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class JsonlUsageExporter(UsageExporter):
+    """Appends the usage records to a JSON lines file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    async def export(self, records: list[dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._write, records)
+
+    def _write(self, records: list[dict[str, Any]]) -> None:
+        with open(self.path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+
+def create_usage_exporter() -> UsageExporter | None:
+    """The exporter selected by USAGE_EXPORTER ("module:factory") or USAGE_EXPORT_FILE, None if neither is set."""
+    if factory := os.environ.get("USAGE_EXPORTER"):
+        module_name, _, name = factory.partition(":")
+        return getattr(importlib.import_module(module_name), name)()
+    if path := os.environ.get("USAGE_EXPORT_FILE"):
+        return JsonlUsageExporter(path)
+    return None
+
+
+class UsageLedger:
+    """Collects the usage of finished sessions and exports it in batches.
+
+    Session records are buffered and exported every `flush_interval_s`, or
+    as soon as `batch_size` are buffered. Each export also carries one
+    "tenant" record per tenant with the sessions of the batch summed up.
+    """
+
+    def __init__(
+        self,
+        exporter: UsageExporter | None,
+        *,
+        flush_interval_s: float = 60.0,
+        batch_size: int = 100,
+        prices: dict[str, float] | None = None,
+    ) -> None:
+        self.exporter = exporter
+        self.flush_interval_s = flush_interval_s
+        self.batch_size = batch_size
+        self.prices = prices or {}
+        self._records: list[dict[str, Any]] = []
+        self._period_start = time.time()
+        self._task: asyncio.Task[None] | None = None
+        self._flushes: set[asyncio.Task[None]] = set()
+
+    @classmethod
+    def from_env(cls) -> "UsageLedger":
+        return cls(
+            create_usage_exporter(),
+            flush_interval_s=float(os.environ.get("USAGE_FLUSH_INTERVAL_S", "60")),
+            batch_size=int(os.environ.get("USAGE_BATCH_SIZE", "100")),
+            prices=prices_from_env(),
+        )
+
+    def start(self) -> None:
+        if self.exporter:
+            self._task = asyncio.create_task(self._flush_periodically())
+
+    def record(self, session: dict[str, Any]) -> None:
+        if self.prices and "cost" not in session:
+            session = {**session, "cost": _cost(session, self.prices)}
+        logger.info(
+            f"Usage of channel {session['channel']}: {session['total_tokens']} tokens in {session['responses']} responses, "
+            f"{session['uplink_s']:.0f}s uplink, {session['downlink_s']:.0f}s downlink"
+        )
+        if not self.exporter:
+            return
+        self._records.append(session)
+        if len(self._records) >= self.batch_size:
+            # kept until done, the loop only holds weak references to its tasks
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._on_flush_done)
+
+    async def flush(self) -> None:
+        records, self._records = self._records, []
+        period_start, self._period_start = self._period_start, time.time()
+        if not records or not self.exporter:
+            return
+        tenants: dict[str | None, dict[str, Any]] = {}
+        for record in records:
+            tenant = tenants.setdefault(
+                record.get("tenant"),
+                {
+                    "kind": "tenant",
+                    "tenant": record.get("tenant"),
+                    "period_start": period_start,
+                    "period_end": self._period_start,
+                    "sessions": 0,
+                    **dict.fromkeys(COUNTER_FIELDS, 0),
+                    **({"cost": 0.0} if self.prices else {}),
+                },
+            )
+            tenant["sessions"] += 1
+            for name in COUNTER_FIELDS + (("cost",) if self.prices else ()):
+                tenant[name] = round(tenant[name] + record.get(name, 0), 6)
+        try:
+            await self.exporter.export(records + list(tenants.values()))
+        except Exception as e:
+            logger.error(f"Failed to export {len(records)} usage records: {e}")
+            # retried with the next batch
+            self._records = records + self._records
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
+        if self.exporter:
+            await self.exporter.close()
+
+    def _on_flush_done(self, task: asyncio.Task[None]) -> None:
+        self._flushes.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("Failed to flush the usage records", exc_info=task.exception())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            await self.flush()
+
+
+def _cost(record: dict[str, Any], prices: dict[str, float]) -> float:
+    # cached input tokens are part of the text / audio input tokens, billed at the cached price
+    billed = {key: record.get(field, 0) for key, field in PRICE_FIELDS.items()}
+    if "cached_input" in prices:
+        billed["text_input"] = max(billed["text_input"] - billed["cached_input"], 0)
+    return round(sum(billed[key] * price for key, price in prices.items()) / 1_000_000, 6)
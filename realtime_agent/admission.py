@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable
+
+import psutil
+from attr import dataclass
+
+from .logger import setup_logger
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+
+@dataclass(frozen=True, kw_only=True)
+class AdmissionDecision:
+    admitted: bool
+    reason: str = ""
+    # 429 when the session limit or the queue is full, 503 when the host is overloaded
+    status: int = 200
+    retry_after_s: float = 0.0
+
+
+class AdmissionController:
+    """Decides whether a new agent can start given the live load of the host.
+
+    A new agent is admitted while the number of sessions is below
+    `max_sessions`, host CPU usage below `max_cpu_percent`, host memory usage
+    below `max_memory_percent` and the summed RSS of the agent processes below
+    `max_rss_mb`, and while the API key has more than
+    `min_rate_limit_headroom` of its rate limits left, as last reported by
+    an agent. When over capacity a request can wait up to `queue_timeout_s`
+    in a bounded queue for a session to finish, otherwise it is rejected right
+    away with a retry-after hint.
+
+    An admitted request holds a slot until `release()` is called once its
+    agent process is registered, so concurrent requests cannot overshoot
+    `max_sessions` while the agent is being started.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_sessions: int | None = None,
+        max_cpu_percent: float = 90.0,
+        max_memory_percent: float = 90.0,
+        max_rss_mb: float | None = None,
+        queue_size: int = 0,
+        queue_timeout_s: float = 0.0,
+        retry_after_s: float = 5.0,
+        min_rate_limit_headroom: float = 0.0,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.max_cpu_percent = max_cpu_percent
+        self.max_memory_percent = max_memory_percent
+        self.max_rss_mb = max_rss_mb
+        self.queue_size = queue_size
+        self.queue_timeout_s = queue_timeout_s
+        self.retry_after_s = retry_after_s
+        self.min_rate_limit_headroom = min_rate_limit_headroom
+        self._rate_limits: dict[str, Any] | None = None
+        self._waiting = 0
+        self._starting = 0
+        self._changed = asyncio.Event()
+        # the first call only starts the measurement interval
+        psutil.cpu_percent(interval=None)
+        self._cpu_percent = 0.0
+        self._cpu_sampled_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_sessions=int(os.environ.get("AGENT_MAX_SESSIONS", "0")) or None,
+            max_cpu_percent=float(os.environ.get("ADMISSION_MAX_CPU_PERCENT", "90")),
+            max_memory_percent=float(os.environ.get("ADMISSION_MAX_MEMORY_PERCENT", "90")),
+            max_rss_mb=float(os.environ.get("ADMISSION_MAX_RSS_MB", "0")) or None,
+            queue_size=int(os.environ.get("ADMISSION_QUEUE_SIZE", "0")),
+            queue_timeout_s=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_S", "0")),
+            retry_after_s=float(os.environ.get("ADMISSION_RETRY_AFTER_S", "5")),
+            min_rate_limit_headroom=float(os.environ.get("ADMISSION_MIN_RATE_LIMIT_HEADROOM", "0.05")),
+        )
+
+    def check(self, active_sessions: int, pids: list[int]) -> AdmissionDecision:
+        """Admission decision for the current load, without waiting."""
+        active_sessions += self._starting
+        if self.max_sessions is not None and active_sessions >= self.max_sessions:
+            return self._reject(f"{active_sessions} agents running, the limit is {self.max_sessions}", 429)
+
+        cpu_percent = self._sample_cpu()
+        if cpu_percent >= self.max_cpu_percent:
+            return self._reject(f"CPU usage is {cpu_percent:.0f}%", 503)
+
+        memory_percent = psutil.virtual_memory().percent
+        if memory_percent >= self.max_memory_percent:
+            return self._reject(f"memory usage is {memory_percent:.0f}%", 503)
+
+        if self.max_rss_mb is not None:
+            rss_mb = _rss(pids) / (1024 * 1024)
+            if rss_mb >= self.max_rss_mb:
+                return self._reject(f"agents use {rss_mb:.0f} MB", 503)
+
+        rate_limits = self._rate_limits
+        if rate_limits and rate_limits["reset_at"] > time.time():
+            if rate_limits["headroom"] < self.min_rate_limit_headroom:
+                return AdmissionDecision(
+                    admitted=False,
+                    reason=f"{rate_limits['headroom']:.0%} of the API rate limits left",
+                    status=429,
+                    retry_after_s=max(rate_limits["reset_at"] - time.time(), self.retry_after_s),
+                )
+
+        return AdmissionDecision(admitted=True)
+
+    async def admit(
+        self, active_sessions: Callable[[], int], pids: Callable[[], list[int]]
+    ) -> AdmissionDecision:
+        """Admission decision, waiting in the queue for capacity if it is enabled.
+
+        `active_sessions` and `pids` are callables so the load is re-read
+        every time the decision is re-evaluated.
+        """
+        decision = self.check(active_sessions(), pids())
+        if decision.admitted:
+            self._starting += 1
+            return decision
+        if self.queue_timeout_s <= 0:
+            return decision
+        if self._waiting >= self.queue_size:
+            return self._reject(f"{decision.reason}, and the queue is full", 429)
+
+        self._waiting += 1
+        deadline = time.monotonic() + self.queue_timeout_s
+        try:
+            while not decision.admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return decision
+                self._changed.clear()
+                try:
+                    # woken up when a session ends, CPU and memory are re-checked every second
+                    async with asyncio.timeout(min(remaining, 1.0)):
+                        await self._changed.wait()
+                except TimeoutError:
+                    pass
+                decision = self.check(active_sessions(), pids())
+            self._starting += 1
+            return decision
+        finally:
+            self._waiting -= 1
+
+    def release(self) -> None:
+        """Give back the slot of an admitted request once its agent is started or failed to start."""
+        self._starting -= 1
+        self._changed.set()
+
+    def update_rate_limits(self, rate_limits: dict[str, Any]) -> None:
+        """Rate limit status of the API key reported by an agent, see RateLimitBudget.status."""
+        self._rate_limits = rate_limits
+        self._changed.set()
+
+    def session_ended(self) -> None:
+        self._changed.set()
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _sample_cpu(self) -> float:
+        # usage since the previous call, which is meaningless over a too short interval
+        now = time.monotonic()
+        if now - self._cpu_sampled_at >= 1.0:
+            self._cpu_percent = psutil.cpu_percent(interval=None)
+            self._cpu_sampled_at = now
+        return self._cpu_percent
+
+    def _reject(self, reason: str, status: int) -> AdmissionDecision:
+        return AdmissionDecision(admitted=False, reason=reason, status=status, retry_after_s=self.retry_after_s)
+
+
+def _rss(pids: list[int]) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            total += psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            # the process exited in the meantime
+            pass
+    return total
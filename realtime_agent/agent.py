@@ -1,23 +1,52 @@
 import asyncio
 import base64
+import json
 import logging
 import os
-from builtins import anext
-from typing import Any
+import signal
+import time
+from collections import deque
+from dataclasses import asdict
+from typing import Any, Coroutine
 
 from agora.rtc.rtc_connection import RTCConnection, RTCConnInfo
-from attr import dataclass
+from attr import evolve
 
 from agora_realtime_ai_api.rtc import Channel, ChatMessage, RtcEngine, RtcOptions
 
 from .logger import setup_logger
-from .realtime.struct import ErrorMessage, FunctionCallOutputItemParam, InputAudioBufferCommitted, InputAudioBufferSpeechStarted, InputAudioBufferSpeechStopped, InputAudioTranscription, ItemCreate, ItemCreated, ItemInputAudioTranscriptionCompleted, RateLimitsUpdated, ResponseAudioDelta, ResponseAudioDone, ResponseAudioTranscriptDelta, ResponseAudioTranscriptDone, ResponseContentPartAdded, ResponseContentPartDone, ResponseCreate, ResponseCreated, ResponseDone, ResponseFunctionCallArgumentsDelta, ResponseFunctionCallArgumentsDone, ResponseOutputItemAdded, ResponseOutputItemDone, ServerVADUpdateParams, SessionUpdate, SessionUpdateParams, SessionUpdated, Voices, to_json
+from .realtime.struct import ErrorMessage, FunctionCallOutputItemParam, InputAudioBufferClear, InputAudioBufferCommit, InputAudioBufferCommitted, InputAudioBufferSpeechStarted, InputAudioBufferSpeechStopped, ItemCreate, ItemCreated, ItemDelete, ItemDeleted, ItemInputAudioTranscriptionCompleted, ItemTruncated, RateLimitsUpdated, ResponseAudioDelta, ResponseAudioDone, ResponseAudioTranscriptDelta, ResponseAudioTranscriptDone, ResponseCancel, ResponseContentPartAdded, ResponseContentPartDone, ResponseCreate, ResponseCreateParams, ResponseCreated, ResponseDone, ResponseFunctionCallArgumentsDelta, ResponseFunctionCallArgumentsDone, ResponseOutputItemAdded, ResponseOutputItemDone, ResponseTextDelta, ResponseTextDone, ServerToClientMessage, SessionCreated, SessionUpdate, SessionUpdated, UserMessageItemParam, to_json
 from .realtime.connection import RealtimeApiConnection
+from .realtime.pool import RealtimeConnectionPool
+from .realtime.uplink import UplinkSender
+from .conversation import ConversationStore
 from .tools import ClientToolCallResponse, ToolContext
-from .utils import PCMWriter
+from .accounting import SessionUsage, UsageLedger
+from .audio_capture import SessionAudioCapture
+from .config import CLIENT, TEXT_OUTPUT, InferenceConfig
+from .clips import FILLER, GREETING, ClipPlayer, get_clip_cache
+from .control import ControlChannel, ControlMessage
+from .datastream import CancelResponse, ChunkAssembler, DataStreamError, SetMuted, SetOutput, TextBatcher, TextInput, UpdateSession, parse_message
+from .dispatch import AUDIO, CONTROL, LANES, TRANSCRIPT, LaneDispatcher
+from .handlers import HandlerRegistry
+from .endpointer import EndpointEvent, Endpointer
+from .event_loop import LoopMonitor
+from .presets import get_preset_store
+from .rate_limits import RateLimitBudget
+from .mixer import UplinkMixer
+from .recording import CallRecorder
+from .remote_audio import USER_OFFLINE_QUIT, RemoteAudio
+from .utils import StartupTimings
 
 # Set up the logger with color and timestamp support
 logger = setup_logger(name=__name__, log_level=logging.INFO)
+def _log_exception(t: asyncio.Task[Any]) -> None:
+    if not t.cancelled() and t.exception():
+        logger.error(
+            "unhandled exception",
+            exc_info=t.exception(),
+        )
+
 
 def _monitor_queue_size(queue: asyncio.Queue, queue_name: str, threshold: int = 5) -> None:
     queue_size = queue.qsize()
@@ -25,32 +54,60 @@ def _monitor_queue_size(queue: asyncio.Queue, queue_name: str, threshold: int =
         logger.warning(f"Queue {queue_name} size exceeded {threshold}: current size {queue_size}")
 
 
-async def wait_for_remote_user(channel: Channel) -> int:
-    remote_users = list(channel.remote_users.keys())
-    if len(remote_users) > 0:
-        return remote_users[0]
-
-    future = asyncio.Future[int]()
+def _timeout_from_env(name: str, default: str) -> float | None:
+    timeout = float(os.environ.get(name, default))
+    return timeout if timeout > 0 else None
 
-    channel.once("user_joined", lambda conn, user_id: future.set_result(user_id))
 
+async def wait_for_remote_user(remote_audio: RemoteAudio) -> int:
     try:
-        # Wait for the remote user with a timeout of 30 seconds
-        remote_user = await asyncio.wait_for(future, timeout=15.0)
-        return remote_user
-    except KeyboardInterrupt:
-        future.cancel()
-        
+        return await remote_audio.wait_for_user(timeout=_timeout_from_env("AGENT_REMOTE_USER_TIMEOUT_S", "15"))
     except Exception as e:
         logger.error(f"Error waiting for remote user: {e}")
         raise
 
 
-@dataclass(frozen=True, kw_only=True)
-class InferenceConfig:
-    system_message: str | None = None
-    turn_detection: ServerVADUpdateParams | None = None  # MARK: CHECK!
-    voice: Voices | None = None
+def create_realtime_connection() -> RealtimeApiConnection:
+    return RealtimeApiConnection(
+        base_uri=os.getenv("REALTIME_API_BASE_URI", "wss://api.openai.com"),
+        api_key=os.getenv("OPENAI_API_KEY"),
+        verbose=False,
+        reconnect_attempts=int(os.environ.get("REALTIME_RECONNECT_ATTEMPTS", "5")),
+        reconnect_base_delay=float(os.environ.get("REALTIME_RECONNECT_BASE_DELAY_S", "0.5")),
+        uplink_buffer_ms=int(os.environ.get("REALTIME_UPLINK_BUFFER_MS", "2000")),
+    )
+
+
+def session_voice(inference_config: InferenceConfig) -> str:
+    voice = inference_config.voice or (inference_config.preset or get_preset_store().get()).params.voice
+    return getattr(voice, "value", voice)
+
+
+def _delay_from_env(name: str, default: str) -> float | None:
+    # a negative delay disables the clip
+    delay_ms = float(os.environ.get(name, default))
+    return delay_ms / 1000 if delay_ms >= 0 else None
+
+
+def build_session_update(
+    inference_config: InferenceConfig, tools: ToolContext | None, max_output_tokens: int | None = None
+) -> SessionUpdate:
+    preset = inference_config.preset or get_preset_store().get()
+    # the preset's session is encoded once, only the overridden fields are encoded per call
+    return preset.session_update(
+        {
+            "instructions": inference_config.system_message,
+            "voice": inference_config.voice,
+            "turn_detection": inference_config.turn_detection,
+            "tools": tools.model_description() if tools else None,
+            "max_response_output_tokens": max_output_tokens,
+            # text-only responses are not synthesized, the preset's modalities otherwise
+            "modalities": ["text"] if inference_config.output == TEXT_OUTPUT else None,
+        },
+        encoded={"tools": tools.model_description_json()} if tools else None,
+        # without server VAD the agent commits the input audio and creates the responses
+        unset=("turn_detection",) if inference_config.turn_detection_mode == CLIENT else (),
+    )
 
 
 class RealtimeKitAgent:
@@ -77,38 +134,49 @@ class RealtimeKitAgent:
         options: RtcOptions,
         inference_config: InferenceConfig,
         tools: ToolContext | None,
+        connection_pool: RealtimeConnectionPool | None = None,
+        control: ControlChannel | None = None,
     ) -> None:
-        channel = engine.create_channel(options)
-        await channel.connect()
-
-        try:
-            async with RealtimeApiConnection(
-                base_uri=os.getenv("REALTIME_API_BASE_URI", "wss://api.openai.com"),
-                api_key=os.getenv("OPENAI_API_KEY"),
-                verbose=False,
-            ) as connection:
-                await connection.send_request(
-                    SessionUpdate(
-                        session=SessionUpdateParams(
-                            # MARK: check this
-                            turn_detection=inference_config.turn_detection,
-                            tools=tools.model_description() if tools else [],
-                            tool_choice="auto",
-                            input_audio_format="pcm16",
-                            output_audio_format="pcm16",
-                            instructions=inference_config.system_message,
-                            voice=inference_config.voice,
-                            model=os.environ.get("OPENAI_MODEL", "gpt-4o-realtime-preview"),
-                            modalities=["text", "audio"],
-                            temperature=0.8,
-                            max_response_output_tokens="inf",
-                            input_audio_transcription=InputAudioTranscription(model="whisper-1")
-                        )
-                    )
-                )
+        startup_timings = StartupTimings()
+        # stalls of the event loop delay the audio, watch for them during the whole session
+        loop_monitor = LoopMonitor.from_env()
+        if loop_monitor:
+            loop_monitor.start()
+        # a stop requested while starting up is applied once the agent runs
+        stop_requested: list[ControlMessage] = []
+        if control:
+            control.start(lambda message: stop_requested.append(message) if message["type"] == "stop" else None)
 
-                start_session_message = await anext(connection.listen())
-                # assert isinstance(start_session_message, messages.StartSession)
+        channel = engine.create_channel(options)
+        remote_audio = RemoteAudio(channel)
+        session_update = build_session_update(inference_config, tools)
+        connection: RealtimeApiConnection | None = None
+
+        async def join_channel() -> int:
+            with startup_timings.phase("rtc_join"):
+                await channel.connect()
+            with startup_timings.phase("remote_user"):
+                logger.info("Waiting for remote user to join")
+                return await wait_for_remote_user(remote_audio)
+
+        async def open_model_session() -> None:
+            nonlocal connection
+            with startup_timings.phase("model_connect"):
+                if connection_pool:
+                    connection = await connection_pool.acquire()
+                else:
+                    connection = create_realtime_connection()
+                    await connection.connect()
+
+            with startup_timings.phase("session_configure"):
+                if connection_pool:
+                    # the pooled session is configured with the pool defaults, the
+                    # per-call update is applied in order before any audio is sent
+                    if session_update.session != connection_pool.session_update.session:
+                        await connection.send_request(session_update)
+                    return
+
+                start_session_message = await connection.configure(session_update)
                 if isinstance(start_session_message, SessionUpdated):
                     logger.info(
                         f"Session started: {start_session_message.session.id} model: {start_session_message.session.model}"
@@ -118,16 +186,44 @@ class RealtimeKitAgent:
                         f"Error: {start_session_message.error}"
                     )
 
-                agent = cls(
-                    connection=connection,
-                    tools=tools,
-                    channel=channel,
-                )
-                await agent.run()
+        try:
+            # The RTC join and the model session setup are independent, run them
+            # concurrently; if either fails the other one is cancelled
+            async with asyncio.TaskGroup() as task_group:
+                remote_user_task = task_group.create_task(join_channel())
+                task_group.create_task(open_model_session())
+                # the greeting and filler clips of the voice, usually already loaded by the warm worker
+                if clips := get_clip_cache():
+                    task_group.create_task(clips.prepare(session_voice(inference_config)))
+
+            agent = cls(
+                connection=connection,
+                tools=tools,
+                channel=channel,
+                remote_audio=remote_audio,
+            )
+            agent.startup_timings = startup_timings
+            agent.inference_config = inference_config
+            agent.control = control
+            agent.usage.tenant = inference_config.tenant
+            if inference_config.turn_detection_mode == CLIENT:
+                agent.endpointer = Endpointer.from_env()
+            if control:
+                control.set_handler(agent._on_control_message)
+                for message in stop_requested:
+                    agent._on_control_message(message)
+            await agent.run(remote_user=remote_user_task.result())
 
         finally:
+            remote_audio.close()
             await channel.disconnect()
-            await connection.close()
+            if connection:
+                await connection.close()
+            if loop_monitor:
+                await loop_monitor.stop()
+                logger.info(f"Event loop lag: {loop_monitor.stats()}")
+                if loop_monitor.stalls:
+                    await loop_monitor.export(prefix=f"loop_{options.channel_name}")
 
     def __init__(
         self,
@@ -135,46 +231,134 @@ class RealtimeKitAgent:
         connection: RealtimeApiConnection,
         tools: ToolContext | None,
         channel: Channel,
+        remote_audio: RemoteAudio | None = None,
     ) -> None:
         self.connection = connection
         self.tools = tools
         self._client_tool_futures = {}
         self.channel = channel
+        self.remote_audio = remote_audio or RemoteAudio(channel)
         self.subscribe_user = None
+        self.startup_timings: StartupTimings | None = None
+        # kept to rebuild the session.update when the tools change
+        self.inference_config: InferenceConfig | None = None
+        # client-managed turn detection, set when the server VAD is disabled
+        self.endpointer: Endpointer | None = None
+        # (audio_start_ms, audio_end_ms) of the turns committed locally, until the server acknowledges them
+        self._committed_turns: deque[tuple[int | None, int | None]] = deque()
+        self._response_id: str | None = None
+        self._cancelled_responses: set[str] = set()
+        # paces the responses and trims their output by the rate limits of the API key
+        self.rate_limits = RateLimitBudget.from_env()
+        self._output_token_limit: int | None = None
+        self.control: ControlChannel | None = None
+        self.usage = SessionUsage(channel.channelId)
+        self._stopping = False
+        # set while no response is being generated, used to stop gracefully
+        self._response_idle = asyncio.Event()
+        self._response_idle.set()
+        self._tool_tasks: set[asyncio.Task[None]] = set()
+        # response requested at the end of a locally detected turn, waiting for the rate limits
+        self._pending_response: asyncio.Task[None] | None = None
+        self.conversation = ConversationStore.from_env()
+        self.connection.replay = self._replay_conversation
+        self.uplink = UplinkSender.from_env(connection)
+        # pre-generated greeting and filler clips, played while the model has not answered yet
+        self.clips = get_clip_cache()
+        self.clip_player = ClipPlayer(channel)
+        self._clip_tasks: set[asyncio.Task[None]] = set()
+        self._model_audio_at = 0.0
+        # text and control input sent by the client over the RTC data stream
+        self._stream_chunks = ChunkAssembler()
+        self.text_batcher = TextBatcher.from_env(self._send_text_turn)
+        self._stream_tasks: set[asyncio.Task[None]] = set()
+        self.muted = False
         self.write_pcm = os.environ.get("WRITE_AGENT_PCM", "false") == "true"
         logger.info(f"Write PCM: {self.write_pcm}")
+        self.recorder = CallRecorder.from_env(prefix=f"call_{channel.channelId}") if self.write_pcm else None
+        # last N seconds of audio kept in memory, exported on errors or on request
+        self.audio_capture = SessionAudioCapture.from_env()
+        # multi-participant mode, the audio of several users is combined into the uplink
+        self.mixer = UplinkMixer.from_env()
+        self.max_participants = int(os.environ.get("AGENT_MAX_PARTICIPANTS", "4"))
+        self._participant_tasks: dict[Any, asyncio.Task[None]] = {}
+        # handlers subscribe per message type, plugins can add their own
+        self.handlers = HandlerRegistry.from_env()
+        self._register_handlers()
+        self.handlers.load_plugins(self)
+        self.dispatcher = LaneDispatcher[ServerToClientMessage](
+            self.handlers.lane_of, {lane: self.handlers.dispatch for lane in LANES}
+        )
 
-    async def run(self) -> None:
+    async def run(self, remote_user: int | None = None) -> None:
+        loop = asyncio.get_running_loop()
         try:
-
-            def log_exception(t: asyncio.Task[Any]) -> None:
-                if not t.cancelled() and t.exception():
-                    logger.error(
-                        "unhandled exception",
-                        exc_info=t.exception(),
-                    )
-
             def on_stream_message(agora_local_user, user_id, stream_id, data, length) -> None:
-                logger.info(f"Received stream message with length: {length}")
+                self._on_stream_message(user_id, data)
 
             self.channel.on("stream_message", on_stream_message)
 
-            logger.info("Waiting for remote user to join")
-            self.subscribe_user = await wait_for_remote_user(self.channel)
+            if self.tools:
+                self.tools.add_listener(self._on_tools_changed)
+
+            # stop gracefully, the server kills the process if it takes too long
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(
+                    signum,
+                    lambda: asyncio.create_task(self.stop()).add_done_callback(_log_exception),
+                )
+
+            if remote_user is None:
+                logger.info("Waiting for remote user to join")
+                remote_user = await wait_for_remote_user(self.remote_audio)
+            self.subscribe_user = remote_user
             logger.info(f"Subscribing to user {self.subscribe_user}")
-            await self.channel.subscribe_audio(self.subscribe_user)
+            subscribe_timeout = _timeout_from_env("AGENT_SUBSCRIBE_TIMEOUT_S", "10")
+            if self.startup_timings:
+                with self.startup_timings.phase("subscribe_audio"):
+                    await self.remote_audio.subscribe(self.subscribe_user, subscribe_timeout)
+                logger.info(f"Startup timings: {self.startup_timings}")
+                if self.control:
+                    self.control.send({"type": "startup", "timings": self.startup_timings.as_dict()})
+            else:
+                await self.remote_audio.subscribe(self.subscribe_user, subscribe_timeout)
+            self._schedule_clip(GREETING, _delay_from_env("AGENT_GREETING_DELAY_MS", "0"))
+
+            async def wait_for_rejoin(user_id: int) -> None:
+                try:
+                    await self.remote_audio.wait_for_user(
+                        user_id, timeout=_timeout_from_env("AGENT_REJOIN_TIMEOUT_S", "15")
+                    )
+                    logger.info(f"Subscribed user {user_id} rejoined, resubscribing")
+                    await self.remote_audio.subscribe(user_id, subscribe_timeout)
+                except TimeoutError:
+                    logger.info(f"Subscribed user {user_id} did not rejoin, disconnecting")
+                    await self.channel.disconnect()
 
             async def on_user_left(
                 agora_rtc_conn: RTCConnection, user_id: int, reason: int
             ):
                 logger.info(f"User left: {user_id}")
-                if self.subscribe_user == user_id:
+                if self.mixer or self.subscribe_user != user_id:
+                    # participants are removed from the mix when their stream ends
+                    return
+                if reason == USER_OFFLINE_QUIT or self._stopping:
                     self.subscribe_user = None
                     logger.info("Subscribed user left, disconnecting")
                     await self.channel.disconnect()
+                else:
+                    # e.g. dropped by a network change, rtc_to_model resumes once it is back
+                    logger.info("Subscribed user dropped, waiting for it to rejoin")
+                    await wait_for_rejoin(user_id)
 
             self.channel.on("user_left", on_user_left)
 
+            if self.mixer:
+                self.channel.on("user_joined", lambda agora_rtc_conn, user_id: self._add_participant(user_id))
+                self._add_participant(self.subscribe_user)
+                for user_id in list(self.channel.remote_users):
+                    self._add_participant(user_id)
+
             disconnected_future = asyncio.Future[None]()
 
             def callback(agora_rtc_conn: RTCConnection, conn_info: RTCConnInfo, reason):
@@ -185,11 +369,11 @@ class RealtimeKitAgent:
 
             self.channel.on("connection_state_changed", callback)
 
-            asyncio.create_task(self.rtc_to_model()).add_done_callback(log_exception)
-            asyncio.create_task(self.model_to_rtc()).add_done_callback(log_exception)
+            asyncio.create_task(self.rtc_to_model()).add_done_callback(_log_exception)
+            asyncio.create_task(self.model_to_rtc()).add_done_callback(_log_exception)
 
             asyncio.create_task(self._process_model_messages()).add_done_callback(
-                log_exception
+                _log_exception
             )
 
             await disconnected_future
@@ -198,54 +382,345 @@ class RealtimeKitAgent:
             logger.info("Agent cancelled")
         except Exception as e:
             logger.error(f"Error running agent: {e}")
+            await self.dump_audio("error")
             raise
+        finally:
+            if self.tools:
+                self.tools.remove_listener(self._on_tools_changed)
+            logger.info(f"Uplink: {self.uplink.stats()}")
+            await self._report_usage()
+            if self.recorder:
+                # Write any remaining audio before exiting
+                await self.recorder.close()
+            if self.mixer:
+                self.mixer.close()
+            if self.audio_capture:
+                # the audio tasks may still write a frame, they skip a missing capture
+                audio_capture, self.audio_capture = self.audio_capture, None
+                audio_capture.close()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(signum)
+
+    async def _report_usage(self) -> None:
+        record = self.usage.to_dict()
+        if self.control:
+            # aggregated per tenant and exported by the server
+            self.control.send({"type": "usage", "usage": record})
+            return
+        ledger = UsageLedger.from_env()
+        ledger.record(record)
+        await ledger.close()
+
+    def _on_control_message(self, message: ControlMessage) -> None:
+        match message["type"]:
+            case "stop":
+                asyncio.create_task(self.stop(message.get("grace_s"))).add_done_callback(_log_exception)
+            case "dump_audio":
+                asyncio.create_task(self.dump_audio("requested")).add_done_callback(_log_exception)
+            case "reload_tools":
+                if self.tools:
+                    self.tools.reload_modules()
+            case "set_output":
+                asyncio.create_task(self._set_output(message["output"])).add_done_callback(_log_exception)
+            case _:
+                logger.warning(f"Unhandled control message {message=}")
+
+    def _on_stream_message(self, user_id: Any, data: bytes) -> None:
+        if str(user_id) != str(self.subscribe_user) and not (self.mixer and user_id in self._participant_tasks):
+            logger.info(f"Ignoring stream message from user {user_id}")
+            return
+        try:
+            payload = self._stream_chunks.add(data)
+            if payload is None:
+                return
+            message = parse_message(payload)
+        except DataStreamError as e:
+            logger.warning(f"Invalid stream message from user {user_id}: {e}")
+            return
+
+        match message:
+            case TextInput(text=text):
+                self.text_batcher.add(text)
+            case CancelResponse():
+                self._start_stream_task(self._cancel_response())
+            case SetMuted(muted=muted):
+                self._start_stream_task(self._set_muted(muted))
+            case UpdateSession():
+                self._start_stream_task(self._update_session(message))
+            case SetOutput(output=output):
+                self._start_stream_task(self._set_output(output))
+
+    def _start_stream_task(self, coro: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coro)
+        self._stream_tasks.add(task)
+        task.add_done_callback(self._stream_tasks.discard)
+        task.add_done_callback(_log_exception)
+
+    async def _send_text_turn(self, texts: list[str]) -> None:
+        if self._stopping:
+            return
+        logger.info(f"Text input: {len(texts)} messages in one turn")
+        # the new user message supersedes the answer in progress
+        await self._cancel_response()
+        await self.connection.send_request(
+            ItemCreate(item=UserMessageItemParam(content=[{"type": "input_text", "text": text} for text in texts]))
+        )
+        await self._create_response()
+
+    async def _cancel_response(self) -> None:
+        if self._response_idle.is_set() or not self._response_id:
+            return
+        self._cancelled_responses.add(self._response_id)
+        await self.connection.send_request(ResponseCancel())
+        await self._interrupt_playback()
+
+    async def _set_muted(self, muted: bool) -> None:
+        if muted == self.muted:
+            return
+        self.muted = muted
+        logger.info(f"User audio {'muted' if muted else 'unmuted'}")
+        if muted:
+            # drop the partial turn, the turn detection would otherwise wait for its end
+            await self.connection.send_request(InputAudioBufferClear())
+            if self.endpointer:
+                self.endpointer.reset()
+        else:
+            # the audio dropped while muted is not lag
+            self.uplink.reset_clock()
+
+    async def _update_session(self, message: UpdateSession) -> None:
+        if self.inference_config is None:
+            return
+        changes = {"system_message": message.instructions, "voice": message.voice}
+        self.inference_config = evolve(
+            self.inference_config, **{name: value for name, value in changes.items() if value is not None}
+        )
+        logger.info(f"Updating the session: {', '.join(name for name, value in changes.items() if value is not None)}")
+        await self.connection.send_request(
+            build_session_update(self.inference_config, self.tools, self._output_token_limit)
+        )
+        if message.voice and self.clips:
+            await self.clips.prepare(session_voice(self.inference_config))
+
+    async def _set_output(self, output: str) -> None:
+        if self.inference_config is None or output == self.inference_config.output:
+            return
+        logger.info(f"Switching responses to {output} output")
+        self.inference_config = evolve(self.inference_config, output=output)
+        await self.connection.send_request(
+            build_session_update(self.inference_config, self.tools, self._output_token_limit)
+        )
+        if output == TEXT_OUTPUT:
+            # the rest of the response in progress is only sent as text
+            await self._interrupt_playback()
+
+    @property
+    def text_output(self) -> bool:
+        return self.inference_config is not None and self.inference_config.output == TEXT_OUTPUT
+
+    def _on_tools_changed(self) -> None:
+        if self.inference_config is None:
+            return
+        logger.info("Tools changed, updating the session")
+        session_update = build_session_update(self.inference_config, self.tools, self._output_token_limit)
+        asyncio.create_task(self.connection.send_request(session_update)).add_done_callback(_log_exception)
+
+    async def stop(self, grace_s: float | None = None) -> None:
+        """Stop gracefully: stop sending user audio, let the current response (and pending
+        tool calls) finish playing within `grace_s`, then leave the channel."""
+        if self._stopping:
+            return
+        self._stopping = True
+        self.text_batcher.close()
+        if grace_s is None:
+            grace_s = float(os.environ.get("AGENT_STOP_GRACE_S", "10"))
+        logger.info(f"Stopping agent, waiting up to {grace_s}s for the current response")
 
-    async def rtc_to_model(self) -> None:
-        while self.subscribe_user is None or self.channel.get_audio_frames(self.subscribe_user) is None:
-            await asyncio.sleep(0.1)
+        try:
+            async with asyncio.timeout(grace_s):
+                # requests of the client that already arrived, e.g. a cancel
+                await asyncio.gather(*self._stream_tasks, return_exceptions=True)
+                while self._tool_tasks or not self._response_idle.is_set():
+                    await asyncio.gather(*self._tool_tasks, return_exceptions=True)
+                    await self._response_idle.wait()
+                await self.audio_queue.join()
+        except TimeoutError:
+            logger.warning("Timed out waiting for the current response, stopping anyway")
+        for task in self._stream_tasks:
+            task.cancel()
+
+        await self.channel.disconnect()
+
+    async def dump_audio(self, reason: str) -> list[str]:
+        """Export the captured audio of this session, if capture is enabled."""
+        if not self.audio_capture:
+            return []
+        logger.info(f"Dumping captured audio ({reason})")
+        return await self.audio_capture.export(prefix=f"capture_{self.channel.channelId}_{reason}")
 
-        audio_frames = self.channel.get_audio_frames(self.subscribe_user)
+    async def rtc_to_model(self) -> None:
+        if self.mixer:
+            async for frame in self.mixer.frames():
+                await self._send_uplink(frame)
+                await asyncio.sleep(0)  # Yield control to allow other tasks to run
+            return
 
-        # Initialize PCMWriter for receiving audio
-        pcm_writer = PCMWriter(prefix="rtc_to_model", write_pcm=self.write_pcm)
+        while True:
+            # resolves once the user is subscribed, and again after it rejoined
+            audio_frames = await self.remote_audio.audio_stream(self.subscribe_user)
+            self.uplink.reset_clock()
 
-        try:
             async for audio_frame in audio_frames:
-                # Process received audio (send to model)
-                _monitor_queue_size(self.audio_queue, "audio_queue")
-                await self.connection.send_audio_data(audio_frame.data)
-
-                # Write PCM data if enabled
-                await pcm_writer.write(audio_frame.data)
+                if self._stopping:
+                    # do not start new turns while finishing the current response
+                    continue
 
+                await self._send_uplink(audio_frame.data)
                 await asyncio.sleep(0)  # Yield control to allow other tasks to run
 
-        except asyncio.CancelledError:
-            # Write any remaining PCM data before exiting
-            await pcm_writer.flush()
-            raise  # Re-raise the exception to propagate cancellation
-
-    async def model_to_rtc(self) -> None:
-        # Initialize PCMWriter for sending audio
-        pcm_writer = PCMWriter(prefix="model_to_rtc", write_pcm=self.write_pcm)
-
+            logger.info(f"Audio stream of user {self.subscribe_user} ended")
+
+    async def _send_uplink(self, data: bytes) -> None:
+        # Process received audio (send to model), audio that is too late is shed
+        _monitor_queue_size(self.audio_queue, "audio_queue")
+        if self.muted:
+            return
+        if not await self.uplink.send(data):
+            return
+        if self.mixer:
+            # only the audio the model received counts for the offsets of its transcripts
+            self.mixer.commit()
+        self.usage.add_uplink(data)
+        if self.endpointer:
+            for event in self.endpointer.process(data):
+                await self._on_endpoint(event)
+
+        # Record the uplink if enabled
+        if self.audio_capture:
+            self.audio_capture.write_uplink(data)
+        if self.recorder:
+            await self.recorder.write_uplink(data)
+
+    async def _on_endpoint(self, event: EndpointEvent) -> None:
+        if event == EndpointEvent.SPEECH_STARTED:
+            logger.info(f"Local endpointer: speech started at {self.endpointer.speech_start_ms}ms")
+            if self._pending_response:
+                # the user kept talking, the turn is answered once it ends
+                self._pending_response.cancel()
+            # barge-in, the server does not detect it without server VAD
+            await self._cancel_response()
+            return
+
+        logger.info(f"Local endpointer: end of turn at {self.endpointer.speech_end_ms}ms")
+        self._committed_turns.append((self.endpointer.speech_start_ms, self.endpointer.speech_end_ms))
+        # committed in order with the appended audio, the response may wait for the rate limits
+        # and is created off the uplink path
+        await self.connection.send_request(InputAudioBufferCommit())
+        self._schedule_clip(FILLER, _delay_from_env("AGENT_TURN_FILLER_DELAY_MS", "-1"))
+        if self._pending_response:
+            self._pending_response.cancel()
+        self._pending_response = asyncio.create_task(self._create_response())
+        self._pending_response.add_done_callback(_log_exception)
+
+    async def _interrupt_playback(self) -> None:
+        for task in self._clip_tasks:
+            task.cancel()
+        await self.clip_player.stop(fade=False)
+        # clear the audio queue so audio stops playing
+        self.dispatcher.clear(AUDIO)
+        self._clear_audio_queue()
+        await self.channel.clear_sender_audio_buffer()
+        if self.recorder:
+            self.recorder.clear_downlink()
+
+    def _add_participant(self, uid: Any) -> None:
+        if uid in self._participant_tasks:
+            return
+        if len(self._participant_tasks) >= self.max_participants:
+            logger.info(f"{self.max_participants} participants reached, not subscribing to user {uid}")
+            return
+        self.mixer.add(uid)
+        task = asyncio.create_task(self._read_participant(uid))
+        self._participant_tasks[uid] = task
+        task.add_done_callback(_log_exception)
+
+    async def _read_participant(self, uid: Any) -> None:
         try:
-            while True:
-                # Get audio frame from the model output
-                frame = await self.audio_queue.get()
-
-                # Process sending audio (to RTC)
-                await self.channel.push_audio_frame(frame)
-
-                # Write PCM data if enabled
-                await pcm_writer.write(frame)
+            audio_frames = await self.remote_audio.subscribe(
+                uid, _timeout_from_env("AGENT_SUBSCRIBE_TIMEOUT_S", "10")
+            )
+            logger.info(f"Participant {uid} added, {len(self._participant_tasks)} participants")
+            async for audio_frame in audio_frames:
+                if not self._stopping:
+                    self.mixer.write(uid, audio_frame.data)
+        except TimeoutError:
+            logger.warning(f"Timed out subscribing to participant {uid}")
+        finally:
+            self._participant_tasks.pop(uid, None)
+            self.mixer.remove(uid)
+            logger.info(f"Participant {uid} removed, {len(self._participant_tasks)} participants")
+
+        if self._stopping:
+            return
+        # a slot is free, subscribe to users left out by the participant cap
+        for user_id in list(self.channel.remote_users):
+            if user_id != uid:
+                self._add_participant(user_id)
+        if not self._participant_tasks:
+            await self._wait_for_participants()
+
+    async def _wait_for_participants(self) -> None:
+        logger.info("No participants left, waiting for a user to join")
+        try:
+            user_id = await self.remote_audio.wait_for_user(
+                timeout=_timeout_from_env("AGENT_REJOIN_TIMEOUT_S", "15")
+            )
+            self._add_participant(user_id)
+        except TimeoutError:
+            logger.info("No user joined, disconnecting")
+            await self.channel.disconnect()
 
-        except asyncio.CancelledError:
-            # Write any remaining PCM data before exiting
-            await pcm_writer.flush()
-            raise  # Re-raise the cancelled exception to properly exit the task
+    async def model_to_rtc(self) -> None:
+        while True:
+            # Get audio frame from the model output
+            frame = await self.audio_queue.get()
+            self._model_audio_at = time.monotonic()
+            if self.clip_player.playing:
+                # the model's answer takes over, the clip fades out
+                await self.clip_player.stop()
+
+            # Process sending audio (to RTC)
+            await self.channel.push_audio_frame(frame)
+            self.audio_queue.task_done()
+            self.usage.add_downlink(frame)
+
+            # Record the downlink if enabled
+            if self.audio_capture:
+                self.audio_capture.write_downlink(frame)
+            if self.recorder:
+                await self.recorder.write_downlink(frame)
+
+    def _schedule_clip(self, kind: str, delay_s: float | None) -> None:
+        """Play a clip of `kind` after `delay_s`, unless the model has produced audio by then."""
+        if not self.clips or delay_s is None or not self.inference_config or self.text_output:
+            return
+        scheduled_at = time.monotonic()
+        voice = session_voice(self.inference_config)
+
+        async def play_if_silent() -> None:
+            await asyncio.sleep(delay_s)
+            if self._stopping or self._model_audio_at > scheduled_at or not self.audio_queue.empty():
+                return
+            if clip := self.clips.get(voice, kind):
+                logger.info(f"Playing {kind} clip, no model audio after {delay_s * 1000:.0f}ms")
+                self.clip_player.play(clip)
+
+        task = asyncio.create_task(play_if_silent())
+        self._clip_tasks.add(task)
+        task.add_done_callback(self._clip_tasks.discard)
 
     async def handle_funtion_call(self, message: ResponseFunctionCallArgumentsDone) -> None:
+        self._schedule_clip(FILLER, _delay_from_env("AGENT_FILLER_DELAY_MS", "700"))
         function_call_response = await self.tools.execute_tool(message.name, message.arguments)
         logger.info(f"Function call response: {function_call_response}")
         await self.connection.send_request(
@@ -256,88 +731,215 @@ class RealtimeKitAgent:
                 )
             )
         )
-        await self.connection.send_request(
-            ResponseCreate()
+        await self._create_response()
+
+    async def _create_response(self) -> None:
+        """Request a response, once the rate limits of the API key leave room for it."""
+        # the response counts as in progress from now on
+        self._response_idle.clear()
+        try:
+            await self.rate_limits.wait_for_capacity()
+        except asyncio.CancelledError:
+            self._response_idle.set()
+            raise
+        params = None
+        if self._output_token_limit is not None:
+            params = ResponseCreateParams(max_response_output_tokens=self._output_token_limit)
+        await self.connection.send_request(ResponseCreate(response=params))
+
+    async def _apply_output_token_limit(self) -> None:
+        limit = self.rate_limits.output_token_limit()
+        if limit == self._output_token_limit:
+            return
+        logger.info(f"Limiting response output to {limit if limit is not None else 'the preset'} tokens")
+        self._output_token_limit = limit
+        if self.endpointer is None and self.inference_config is not None:
+            # responses are created by the server VAD, limit them through the session
+            await self.connection.send_request(
+                build_session_update(self.inference_config, self.tools, self._output_token_limit)
+            )
+
+    def _attributed_transcript(self, message: ItemInputAudioTranscriptionCompleted) -> str:
+        """The transcript message, with the uid of the speaker of the item in multi-participant mode."""
+        if not self.mixer:
+            return to_json(message)
+        speaker = self.mixer.speaker_between(*self.conversation.audio_span(message.item_id))
+        return json.dumps({**asdict(message), "speaker_uid": speaker})
+
+    def _clear_audio_queue(self) -> None:
+        while not self.audio_queue.empty():
+            self.audio_queue.get_nowait()
+            self.audio_queue.task_done()
+
+    def _replay_conversation(self) -> list[ItemCreate]:
+        # the in-flight response is lost with the old session
+        self.dispatcher.clear(AUDIO)
+        self._clear_audio_queue()
+        self._response_idle.set()
+        items = self.conversation.replay_items(
+            max_items=int(os.environ.get("REALTIME_RECONNECT_REPLAY_ITEMS", "10"))
         )
+        logger.info(f"Replaying {len(items)} conversation items after reconnect")
+        return [ItemCreate(item=item) for item in items]
+
+    async def _evict_conversation_items(self) -> None:
+        for item_id in self.conversation.evict():
+            request = ItemDelete(item_id=item_id)
+            self.conversation.on_delete_sent(item_id, request.event_id)
+            await self.connection.send_request(request)
 
     async def _process_model_messages(self) -> None:
-        async for message in self.connection.listen():
-            # logger.info(f"Received message {message=}")
-            match message:
-                case ResponseAudioDelta():
-                    # logger.info("Received audio message")
-                    self.audio_queue.put_nowait(base64.b64decode(message.delta))
-                    # loop.call_soon_threadsafe(self.audio_queue.put_nowait, base64.b64decode(message.delta))
-                    logger.debug(f"TMS:ResponseAudioDelta: response_id:{message.response_id},item_id: {message.item_id}")
-                case ResponseAudioTranscriptDelta():
-                    # logger.info(f"Received text message {message=}")
-                    asyncio.create_task(self.channel.chat.send_message(
-                        ChatMessage(
-                            message=to_json(message), msg_id=message.item_id
-                        )
-                    ))
-
-                case ResponseAudioTranscriptDone():
-                    logger.info(f"Text message done: {message=}")
-                    asyncio.create_task(self.channel.chat.send_message(
-                        ChatMessage(
-                            message=to_json(message), msg_id=message.item_id
-                        )
-                    ))
-                case InputAudioBufferSpeechStarted():
-                    await self.channel.clear_sender_audio_buffer()
-                    # clear the audio queue so audio stops playing
-                    while not self.audio_queue.empty():
-                        self.audio_queue.get_nowait()
-                    logger.info(f"TMS:InputAudioBufferSpeechStarted: item_id: {message.item_id}")
-                case InputAudioBufferSpeechStopped():
-                    logger.info(f"TMS:InputAudioBufferSpeechStopped: item_id: {message.item_id}")
-                    pass
-                case ItemInputAudioTranscriptionCompleted():
-                    logger.info(f"ItemInputAudioTranscriptionCompleted: {message=}")
-                    asyncio.create_task(self.channel.chat.send_message(
-                        ChatMessage(
-                            message=to_json(message), msg_id=message.item_id
-                        )
-                    ))
-                #  InputAudioBufferCommitted
-                case InputAudioBufferCommitted():
-                    pass
-                case ItemCreated():
-                    pass
-                # ResponseCreated
-                case ResponseCreated():
-                    pass
-                # ResponseDone
-                case ResponseDone():
-                    pass
-
-                # ResponseOutputItemAdded
-                case ResponseOutputItemAdded():
-                    pass
-
-                # ResponseContenPartAdded
-                case ResponseContentPartAdded():
-                    pass
-                # ResponseAudioDone
-                case ResponseAudioDone():
-                    pass
-                # ResponseContentPartDone
-                case ResponseContentPartDone():
-                    pass
-                # ResponseOutputItemDone
-                case ResponseOutputItemDone():
-                    pass
-                case SessionUpdated():
-                    pass
-                case RateLimitsUpdated():
-                    pass
-                case ResponseFunctionCallArgumentsDone():
-                    asyncio.create_task(
-                        self.handle_funtion_call(message)
-                    )
-                case ResponseFunctionCallArgumentsDelta():
-                    pass
+        # the reader only parses and queues, the lanes handle the messages concurrently
+        self.dispatcher.start()
+        try:
+            async for message in self.connection.listen():
+                if isinstance(message, InputAudioBufferSpeechStarted):
+                    # audio queued before the barge-in would be cleared with the response anyway
+                    self.dispatcher.clear(AUDIO)
+                self.dispatcher.put(message)
+        finally:
+            await self.dispatcher.close()
+            logger.info(f"Message lanes: {self.dispatcher.stats()}")
+            logger.info(f"Message handling by event type: {self.handlers.stats()}")
+
+        if self.connection.websocket is None:
+            logger.error("Realtime API connection lost, disconnecting")
+            await self.dump_audio("connection_lost")
+            await self.channel.disconnect()
+
+    def _register_handlers(self) -> None:
+        on = self.handlers.on
+        on(ResponseAudioDelta, self._on_audio_delta, lane=AUDIO)
+        on(InputAudioBufferSpeechStarted, self._on_speech_started, lane=CONTROL)
+        on(InputAudioBufferSpeechStopped, self._on_speech_stopped, lane=CONTROL)
+        on(InputAudioBufferCommitted, self._on_input_committed, lane=CONTROL)
+        on(ItemCreated, self._on_item_created, lane=CONTROL)
+        on(ItemTruncated, self._on_item_truncated, lane=CONTROL)
+        on(ItemDeleted, self._on_item_deleted, lane=CONTROL)
+        on(ErrorMessage, self._on_error, lane=CONTROL)
+        on(ResponseCreated, self._on_response_created, lane=CONTROL)
+        on(ResponseDone, self._on_response_done, lane=CONTROL)
+        on(RateLimitsUpdated, self._on_rate_limits_updated, lane=CONTROL)
+        on(ResponseOutputItemAdded, self._on_output_item_added, lane=CONTROL)
+        on(ResponseOutputItemDone, self._on_output_item_done, lane=CONTROL)
+        on(ResponseFunctionCallArgumentsDone, self._on_function_call_arguments_done, lane=CONTROL)
+        on(ResponseAudioTranscriptDelta, self._on_transcript_delta, lane=TRANSCRIPT)
+        on(ResponseAudioTranscriptDone, self._on_transcript_done, lane=TRANSCRIPT)
+        on(ResponseTextDelta, self._on_transcript_delta, lane=TRANSCRIPT)
+        on(ResponseTextDone, self._on_text_done, lane=TRANSCRIPT)
+        on(ItemInputAudioTranscriptionCompleted, self._on_input_transcription_completed, lane=TRANSCRIPT)
+        self.handlers.ignore(
+            ResponseContentPartAdded, ResponseAudioDone, ResponseContentPartDone,
+            SessionCreated, SessionUpdated, ResponseFunctionCallArgumentsDelta,
+        )
+
+    async def _on_audio_delta(self, message: ResponseAudioDelta) -> None:
+        if message.response_id in self._cancelled_responses or self.text_output:
+            # still in flight when the response was cancelled, or the output switched to text
+            return
+        self.audio_queue.put_nowait(base64.b64decode(message.delta))
+        logger.debug(f"TMS:ResponseAudioDelta: response_id:{message.response_id},item_id: {message.item_id}")
+
+    async def _on_speech_started(self, message: InputAudioBufferSpeechStarted) -> None:
+        self.conversation.on_speech_started(message.item_id, message.audio_start_ms)
+        await self._interrupt_playback()
+        logger.info(f"TMS:InputAudioBufferSpeechStarted: item_id: {message.item_id}")
+
+    async def _on_speech_stopped(self, message: InputAudioBufferSpeechStopped) -> None:
+        logger.info(f"TMS:InputAudioBufferSpeechStopped: item_id: {message.item_id}")
+        self.conversation.on_speech_stopped(message.item_id, message.audio_end_ms)
+        self._schedule_clip(FILLER, _delay_from_env("AGENT_TURN_FILLER_DELAY_MS", "-1"))
+
+    async def _on_input_committed(self, message: InputAudioBufferCommitted) -> None:
+        if not self._committed_turns:
+            return
+        # the speech offsets of a locally committed turn, the server VAD reports them otherwise
+        audio_start_ms, audio_end_ms = self._committed_turns.popleft()
+        self.conversation.on_speech_started(message.item_id, audio_start_ms)
+        self.conversation.on_speech_stopped(message.item_id, audio_end_ms)
+
+    async def _on_item_created(self, message: ItemCreated) -> None:
+        self.conversation.on_item_created(message.item, message.previous_item_id)
+        await self._evict_conversation_items()
+
+    async def _on_item_truncated(self, message: ItemTruncated) -> None:
+        self.conversation.on_item_truncated(message.item_id, message.audio_end_ms)
+
+    async def _on_item_deleted(self, message: ItemDeleted) -> None:
+        self.conversation.on_item_deleted(message.item_id)
+
+    async def _on_error(self, message: ErrorMessage) -> None:
+        logger.error(f"Error from the Realtime API: {message.error}")
+        if self.conversation.on_error(message.error.event_id):
+            # selected again by the next eviction
+            logger.warning("Deleting a conversation item failed")
+
+    async def _on_response_created(self, message: ResponseCreated) -> None:
+        self.conversation.on_response_created(message.response.id)
+        self._response_id = message.response.id
+        self._response_idle.clear()
+
+    async def _on_response_done(self, message: ResponseDone) -> None:
+        self.conversation.on_response_done(message.response.id)
+        self._cancelled_responses.discard(message.response.id)
+        if self._response_id == message.response.id:
+            self._response_id = None
+        self._response_idle.set()
+        self.rate_limits.record_usage(message.response.usage)
+        self.usage.record_response(message.response)
+        await self._evict_conversation_items()
+        await self._apply_output_token_limit()
+
+    async def _on_rate_limits_updated(self, message: RateLimitsUpdated) -> None:
+        self.rate_limits.update(message.rate_limits)
+        if self.control:
+            # the server does not admit new agents while the limits of the key are nearly exhausted
+            self.control.send({"type": "status", "rate_limits": self.rate_limits.status()})
+        await self._apply_output_token_limit()
+
+    async def _on_output_item_added(self, message: ResponseOutputItemAdded) -> None:
+        self.conversation.on_output_item_added(message.response_id, message.item)
+
+    async def _on_output_item_done(self, message: ResponseOutputItemDone) -> None:
+        self.conversation.on_output_item_done(message.response_id, message.item)
+
+    async def _on_function_call_arguments_done(self, message: ResponseFunctionCallArgumentsDone) -> None:
+        task = asyncio.create_task(
+            self.handle_funtion_call(message)
+        )
+        self._tool_tasks.add(task)
+        task.add_done_callback(self._tool_tasks.discard)
 
-                case _:
-                    logger.warning(f"Unhandled message {message=}")
+    async def _on_transcript_delta(self, message: ResponseAudioTranscriptDelta | ResponseTextDelta) -> None:
+        await self.channel.chat.send_message(
+            ChatMessage(
+                message=to_json(message), msg_id=message.item_id
+            )
+        )
+
+    async def _on_transcript_done(self, message: ResponseAudioTranscriptDone) -> None:
+        logger.info(f"Text message done: {message=}")
+        self.conversation.set_transcript(message.item_id, message.transcript)
+        await self.channel.chat.send_message(
+            ChatMessage(
+                message=to_json(message), msg_id=message.item_id
+            )
+        )
+
+    async def _on_text_done(self, message: ResponseTextDone) -> None:
+        logger.info(f"Text message done: {message=}")
+        self.conversation.set_transcript(message.item_id, message.text)
+        await self.channel.chat.send_message(
+            ChatMessage(
+                message=to_json(message), msg_id=message.item_id
+            )
+        )
+
+    async def _on_input_transcription_completed(self, message: ItemInputAudioTranscriptionCompleted) -> None:
+        logger.info(f"ItemInputAudioTranscriptionCompleted: {message=}")
+        self.conversation.set_transcript(message.item_id, message.transcript)
+        await self.channel.chat.send_message(
+            ChatMessage(
+                message=self._attributed_transcript(message), msg_id=message.item_id
+            )
+        )
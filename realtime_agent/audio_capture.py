@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import mmap
+import os
+import wave
+
+from .logger import setup_logger
+from .realtime.struct import PCM_SAMPLE_RATE
+from .utils import generate_file_name
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+
+class AudioRingBuffer:
+    """Fixed-size ring buffer over an anonymous memory map holding the most recent audio.
+
+    Writes copy the frame straight into the mapping through a memoryview, no
+    intermediate buffers are allocated, and memory use stays constant.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._mmap = mmap.mmap(-1, capacity)
+        self._view = memoryview(self._mmap)
+        self._position = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, data: bytes | bytearray | memoryview) -> None:
+        data = memoryview(data).cast("B")
+        if len(data) >= self.capacity:
+            # only the tail fits
+            data = data[-self.capacity:]
+        first = min(len(data), self.capacity - self._position)
+        self._view[self._position:self._position + first] = data[:first]
+        rest = len(data) - first
+        if rest:
+            self._view[:rest] = data[first:]
+        self._position = (self._position + len(data)) % self.capacity
+        self._size = min(self._size + len(data), self.capacity)
+
+    def snapshot(self) -> bytes:
+        """Contents from oldest to newest."""
+        start = (self._position - self._size) % self.capacity
+        if start + self._size <= self.capacity:
+            return self._view[start:start + self._size].tobytes()
+        return self._view[start:].tobytes() + self._view[:self._position].tobytes()
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+
+def _write_wav(file_name: str, data: bytes, sample_rate: int) -> None:
+    with wave.open(file_name, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(data)
+
+
+class SessionAudioCapture:
+    """Keeps the last `seconds` of uplink and downlink audio of a session for on-demand export."""
+
+    def __init__(self, seconds: float, *, sample_rate: int = PCM_SAMPLE_RATE, directory: str = "") -> None:
+        self.sample_rate = sample_rate
+        self.directory = directory
+        capacity = int(seconds * sample_rate) * 2
+        self.uplink = AudioRingBuffer(capacity)
+        self.downlink = AudioRingBuffer(capacity)
+
+    @classmethod
+    def from_env(cls) -> "SessionAudioCapture | None":
+        seconds = float(os.environ.get("AUDIO_CAPTURE_SECONDS", "0"))
+        if seconds <= 0:
+            return None
+        return cls(seconds, directory=os.environ.get("AUDIO_CAPTURE_DIR", ""))
+
+    def write_uplink(self, data: bytes) -> None:
+        self.uplink.write(data)
+
+    def write_downlink(self, data: bytes) -> None:
+        self.downlink.write(data)
+
+    async def export(self, prefix: str) -> list[str]:
+        """Write the captured audio of both directions to WAV files, returns their names."""
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            prefix = os.path.join(self.directory, prefix)
+
+        # snapshot on the loop so the rings are not written while being read
+        captures = {
+            "rtc_to_model": self.uplink.snapshot(),
+            "model_to_rtc": self.downlink.snapshot(),
+        }
+        file_names = []
+        for direction, data in captures.items():
+            file_name = generate_file_name(f"{prefix}_{direction}", extension="wav")
+            await asyncio.to_thread(_write_wav, file_name, data, self.sample_rate)
+            file_names.append(file_name)
+        logger.info(f"Exported captured audio to {file_names}")
+        return file_names
+
+    def close(self) -> None:
+        self.uplink.close()
+        self.downlink.close()
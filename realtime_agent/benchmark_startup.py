@@ -0,0 +1,83 @@
+# Measures the cold start of the server and the time to spawn an agent process, per start method:
+#   python -m realtime_agent.benchmark_startup --runs 5 --methods spawn,forkserver
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+from multiprocessing.connection import Connection
+
+from .control import WORKER_MODULE
+
+SERVER_MODULE = "realtime_agent.main"
+
+
+def import_time_ms(module: str) -> float:
+    """Time to import `module` in a fresh interpreter."""
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    # importing the server module requires the app id
+    env = {"AGORA_APP_ID": "benchmark", **os.environ}
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}: {result.stderr.strip().splitlines()[-1]}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def interpreter_start_ms() -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def _ready(module: str, connection: Connection) -> None:
+    # what an agent process does before it can join a call: have the worker module imported
+    importlib.import_module(module)
+    connection.send(True)
+    connection.close()
+
+
+def spawn_times_ms(method: str, module: str, runs: int) -> list[float]:
+    """Time from starting a process until it has imported `module`, for `runs` processes in a row."""
+    context = multiprocessing.get_context(method)
+    if method == "forkserver":
+        context.set_forkserver_preload([module])
+    times = []
+    for _ in range(runs):
+        parent, child = context.Pipe()
+        started = time.perf_counter()
+        process = context.Process(target=_ready, args=(module, child))
+        process.start()
+        child.close()
+        parent.recv()
+        times.append((time.perf_counter() - started) * 1000)
+        process.join()
+        parent.close()
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the server cold start and the agent process spawn time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--methods", default="spawn,forkserver", help="comma-separated multiprocessing start methods")
+    parser.add_argument("--module", default=WORKER_MODULE, help="module an agent process imports before it is ready")
+    args = parser.parse_args()
+
+    results = {
+        "interpreter_start_ms": statistics.median(interpreter_start_ms() for _ in range(args.runs)),
+        "server_import_ms": statistics.median(import_time_ms(SERVER_MODULE) for _ in range(args.runs)),
+        "worker_import_ms": statistics.median(import_time_ms(args.module) for _ in range(args.runs)),
+    }
+    for method in args.methods.split(","):
+        # the first forkserver process includes starting the forkserver and its preloading
+        times = spawn_times_ms(method, args.module, args.runs + 1)
+        results[f"{method}_first_spawn_ms"] = times[0]
+        results[f"{method}_spawn_ms"] = statistics.median(times[1:])
+    print(json.dumps({name: round(value, 1) for name, value in results.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
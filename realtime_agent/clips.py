@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import time
+
+import numpy as np
+
+from agora_realtime_ai_api.rtc import Channel
+
+from .logger import setup_logger
+from .realtime.connection_manager import get_connection_manager
+from .realtime.struct import PCM_SAMPLE_RATE
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+SAMPLE_WIDTH = 2  # pcm16
+
+GREETING = "greeting"
+FILLER = "filler"
+
+DEFAULT_TEXTS = {
+    GREETING: ["Hi there! How can I help you today?"],
+    FILLER: ["One moment.", "Let me check that for you."],
+}
+
+
+class ClipCache:
+    """Short pre-generated audio clips per voice, greetings and fillers.
+
+    A clip is stored as raw pcm16 at PCM_SAMPLE_RATE in
+    `directory/<voice>/<kind>_<hash of the text>.pcm`, so it is generated
+    once with the text-to-speech API and only again when its text changes.
+    `prepare` loads the clips of a voice into memory, generating the missing
+    ones; the clips of a kind are then handed out in turn. A voice whose
+    clips could not all be loaded is prepared again on the next call.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        texts: dict[str, list[str]],
+        *,
+        generate: bool = True,
+        tts_url: str = "https://api.openai.com/v1/audio/speech",
+        tts_model: str = "tts-1",
+    ) -> None:
+        self.directory = directory
+        self.texts = texts
+        self.generate = generate
+        self.tts_url = tts_url
+        self.tts_model = tts_model
+        self._clips: dict[tuple[str, str], list[bytes]] = {}
+        self._turns: dict[tuple[str, str], itertools.cycle] = {}
+        self._prepared: dict[str, asyncio.Task[bool]] = {}
+
+    @classmethod
+    def from_env(cls) -> "ClipCache | None":
+        directory = os.environ.get("CLIPS_DIR", "")
+        if not directory:
+            return None
+        texts = dict(DEFAULT_TEXTS)
+        for kind in DEFAULT_TEXTS:
+            if value := os.environ.get(f"CLIPS_{kind.upper()}_TEXTS"):
+                texts[kind] = [text.strip() for text in value.split("|") if text.strip()]
+        return cls(
+            directory,
+            texts,
+            generate=os.environ.get("CLIPS_GENERATE", "true") == "true",
+            tts_url=os.environ.get("CLIPS_TTS_URL", "https://api.openai.com/v1/audio/speech"),
+            tts_model=os.environ.get("CLIPS_TTS_MODEL", "tts-1"),
+        )
+
+    async def prepare(self, voice: str) -> None:
+        """Load the clips of `voice`, generating the missing ones; concurrent calls share the work."""
+        task = self._prepared.get(voice)
+        if task is None:
+            task = self._prepared[voice] = asyncio.create_task(self._prepare(voice))
+            task.add_done_callback(lambda t: self._forget_failed(voice, t))
+        await asyncio.shield(task)
+
+    def _forget_failed(self, voice: str, task: asyncio.Task[bool]) -> None:
+        if task.cancelled() or task.exception() is not None or not task.result():
+            if self._prepared.get(voice) is task:
+                del self._prepared[voice]
+
+    def get(self, voice: str, kind: str) -> bytes | None:
+        key = (voice, kind)
+        if key not in self._turns:
+            return None
+        return next(self._turns[key])
+
+    async def _prepare(self, voice: str) -> bool:
+        """Returns whether every clip of `voice` was loaded."""
+        started = time.monotonic()
+        complete = True
+        for kind, texts in self.texts.items():
+            clips = []
+            for text in texts:
+                try:
+                    clip = await self._load(voice, kind, text)
+                except Exception as e:
+                    logger.error(f"Failed to prepare {kind} clip {text!r} for voice {voice}: {e}")
+                    complete = False
+                    continue
+                if clip:
+                    clips.append(clip)
+                else:
+                    complete = False
+            if clips:
+                self._clips[(voice, kind)] = clips
+                self._turns[(voice, kind)] = itertools.cycle(clips)
+        logger.info(
+            f"Prepared {sum(len(clips) for (v, _), clips in self._clips.items() if v == voice)} clips "
+            f"for voice {voice} in {(time.monotonic() - started) * 1000:.0f}ms"
+        )
+        return complete
+
+    async def _load(self, voice: str, kind: str, text: str) -> bytes | None:
+        digest = hashlib.sha1(f"{self.tts_model}:{text}".encode()).hexdigest()[:12]
+        file_name = os.path.join(self.directory, voice, f"{kind}_{digest}.pcm")
+        if os.path.exists(file_name):
+            return await asyncio.to_thread(_read, file_name)
+        if not self.generate:
+            return None
+        clip = await self._synthesize(voice, text)
+        await asyncio.to_thread(_write, file_name, clip)
+        logger.info(f"Generated {kind} clip {text!r} for voice {voice}")
+        return clip
+
+    async def _synthesize(self, voice: str, text: str) -> bytes:
+        # the "pcm" format of the speech API is pcm16 mono at 24kHz, the rate of the agent audio
+        async with get_connection_manager().session.post(
+            self.tts_url,
+            headers={"Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}"},
+            json={"model": self.tts_model, "voice": voice, "input": text, "response_format": "pcm"},
+        ) as response:
+            response.raise_for_status()
+            return await response.read()
+
+
+def _read(file_name: str) -> bytes:
+    with open(file_name, "rb") as f:
+        return f.read()
+
+
+def _write(file_name: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    # written under a temporary name, so concurrent workers never read a partial clip
+    with open(f"{file_name}.{os.getpid()}.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{file_name}.{os.getpid()}.tmp", file_name)
+
+
+class ClipPlayer:
+    """Plays a clip on the channel, paced in real time so it can be stopped at any point.
+
+    Frames are pushed at most `lead_ms` ahead of playback; stopping pushes a
+    `fade_ms` fade-out of the next frame instead of cutting the clip off.
+    """
+
+    def __init__(self, channel: Channel, *, frame_ms: int = 20, lead_ms: int = 100, fade_ms: int = 10) -> None:
+        self.channel = channel
+        self.frame_bytes = PCM_SAMPLE_RATE * frame_ms // 1000 * SAMPLE_WIDTH
+        self.lead_s = lead_ms / 1000
+        self.fade_bytes = PCM_SAMPLE_RATE * fade_ms // 1000 * SAMPLE_WIDTH
+        self._task: asyncio.Task[None] | None = None
+        self._clip = b""
+        self._position = 0
+
+    @property
+    def playing(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def play(self, clip: bytes) -> None:
+        if self.playing:
+            return
+        self._clip, self._position = clip, 0
+        self._task = asyncio.create_task(self._play())
+
+    async def stop(self, fade: bool = True) -> None:
+        if not self.playing:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        tail = self._clip[self._position:self._position + self.fade_bytes]
+        if fade and tail:
+            samples = np.frombuffer(tail, dtype=np.int16)
+            ramp = np.linspace(1.0, 0.0, len(samples), dtype=np.float32)
+            await self.channel.push_audio_frame((samples * ramp).astype(np.int16).tobytes())
+
+    async def _play(self) -> None:
+        started = time.monotonic()
+        while self._position < len(self._clip):
+            ahead_s = self._position / (PCM_SAMPLE_RATE * SAMPLE_WIDTH) - (time.monotonic() - started)
+            if ahead_s > self.lead_s:
+                await asyncio.sleep(ahead_s - self.lead_s)
+            frame = self._clip[self._position:self._position + self.frame_bytes]
+            await self.channel.push_audio_frame(frame)
+            self._position += len(frame)
+
+
+_clip_cache: ClipCache | None = None
+_clip_cache_loaded = False
+
+
+def get_clip_cache() -> ClipCache | None:
+    global _clip_cache, _clip_cache_loaded
+    if not _clip_cache_loaded:
+        _clip_cache = ClipCache.from_env()
+        _clip_cache_loaded = True
+    return _clip_cache
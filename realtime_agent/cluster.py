@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import socket
+from typing import Any, Callable
+
+import aiohttp
+from aiohttp import web
+
+from .logger import setup_logger
+from .realtime.connection_manager import get_connection_manager
+from .registry import NodeInfo, SessionRegistry, create_session_registry
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+# Set on requests forwarded between nodes, a forwarded request is never forwarded again
+FORWARDED_BY_HEADER = "X-Forwarded-By-Node"
+
+
+class ClusterNode:
+    """This server's membership in the cluster.
+
+    Holds a lease in the session registry for every channel with an agent on
+    this node and renews them, together with the node's advertised capacity,
+    from a heartbeat task. Leases of a node that dies expire after
+    `lease_ttl_s`, after which the channel can be started on another node.
+    """
+
+    def __init__(
+        self,
+        registry: SessionRegistry,
+        *,
+        node_id: str,
+        url: str,
+        lease_ttl_s: float = 30.0,
+        max_sessions: int | None = None,
+    ) -> None:
+        self.registry = registry
+        self.node_id = node_id
+        self.url = url.rstrip("/")
+        self.lease_ttl_s = lease_ttl_s
+        self.max_sessions = max_sessions
+        self._heartbeat_task: asyncio.Task[None] | None = None
+
+    @classmethod
+    def from_env(cls, port: int) -> "ClusterNode":
+        node_id = os.environ.get("NODE_ID") or f"{socket.gethostname()}:{port}"
+        return cls(
+            create_session_registry(os.environ.get("SESSION_REGISTRY_URL")),
+            node_id=node_id,
+            url=os.environ.get("NODE_URL") or f"http://{socket.gethostname()}:{port}",
+            lease_ttl_s=float(os.environ.get("SESSION_LEASE_TTL_S", "30")),
+            max_sessions=int(os.environ.get("AGENT_MAX_SESSIONS", "0")) or None,
+        )
+
+    async def claim(self, channel_name: str) -> str:
+        """Take the lease of the channel, returns the id of the node owning it."""
+        return await self.registry.acquire(channel_name, self.node_id, self.lease_ttl_s)
+
+    async def claim_new(self, channel_name: str) -> str | None:
+        """Take the lease of a channel without an agent, returns the node already owning it (this one too) or None."""
+        return await self.registry.create(channel_name, self.node_id, self.lease_ttl_s)
+
+    async def release(self, channel_name: str) -> None:
+        try:
+            await self.registry.release(channel_name, self.node_id)
+        except Exception as e:
+            logger.warning(f"Failed to release lease for channel {channel_name}: {e}")
+
+    async def owner(self, channel_name: str) -> str | None:
+        return await self.registry.owner(channel_name)
+
+    async def node_url(self, node_id: str) -> str | None:
+        for node in await self.registry.nodes():
+            if node.node_id == node_id:
+                return node.url
+        return None
+
+    async def pick_node(self) -> NodeInfo | None:
+        """The least loaded node with free capacity, other than this one."""
+        candidates = [
+            node for node in await self.registry.nodes()
+            if node.node_id != self.node_id and node.has_capacity
+        ]
+        return min(candidates, key=lambda node: node.load, default=None)
+
+    async def forward(self, url: str, path: str, payload: dict[str, Any]) -> web.Response:
+        """Replay a request on another node and relay its response."""
+        logger.info(f"Forwarding {path} to {url}")
+        try:
+            async with get_connection_manager().session.post(
+                f"{url}{path}",
+                json=payload,
+                headers={FORWARDED_BY_HEADER: self.node_id},
+                timeout=aiohttp.ClientTimeout(total=10),
+            ) as response:
+                return web.json_response(await response.json(), status=response.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Failed to forward {path} to {url}: {e}")
+            return web.json_response({"error": f"Failed to reach node at {url}"}, status=502)
+
+    def start(
+        self,
+        channels: Callable[[], list[str]],
+        node_info: Callable[[], NodeInfo],
+        on_lease_lost: Callable[[str], None],
+    ) -> None:
+        self._heartbeat_task = asyncio.create_task(self._heartbeat(channels, node_info, on_lease_lost))
+
+    def info(self, active_sessions: int, draining: bool) -> NodeInfo:
+        return NodeInfo(
+            node_id=self.node_id,
+            url=self.url,
+            active_sessions=active_sessions,
+            max_sessions=self.max_sessions,
+            draining=draining,
+        )
+
+    async def close(self, channels: list[str]) -> None:
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        for channel_name in channels:
+            await self.release(channel_name)
+        await self.registry.close()
+
+    async def _heartbeat(
+        self,
+        channels: Callable[[], list[str]],
+        node_info: Callable[[], NodeInfo],
+        on_lease_lost: Callable[[str], None],
+    ) -> None:
+        while True:
+            try:
+                await self.registry.publish_node(node_info(), self.lease_ttl_s)
+                for channel_name in channels():
+                    if await self.registry.renew(channel_name, self.node_id, self.lease_ttl_s):
+                        continue
+                    # expired, e.g. the registry was unreachable for longer than the ttl
+                    owner = await self.claim(channel_name)
+                    if owner != self.node_id:
+                        logger.error(f"Lease for channel {channel_name} was taken by node {owner}")
+                        on_lease_lost(channel_name)
+            except Exception as e:
+                logger.warning(f"Session registry heartbeat failed: {e}")
+            await asyncio.sleep(self.lease_ttl_s / 3)
@@ -0,0 +1,53 @@
+import os
+
+from attr import dataclass
+
+from .presets import DEFAULT_PRESET, SessionPreset, get_preset_store
+from .realtime.struct import ServerVADUpdateParams, Voices
+
+# Turn detection: server VAD, or the agent's endpointer commits the audio and creates the responses
+SERVER = "server"
+CLIENT = "client"
+
+# Response output: spoken with its transcript, or text only
+AUDIO_OUTPUT = "audio"
+TEXT_OUTPUT = "text"
+
+
+@dataclass(frozen=True, kw_only=True)
+class InferenceConfig:
+    """Session preset and the per-call overrides of its fields, None keeps the preset's value."""
+
+    preset: SessionPreset | None = None
+    system_message: str | None = None
+    turn_detection: ServerVADUpdateParams | None = None  # MARK: CHECK!
+    # "server" for server VAD, "client" to detect the end of turns locally and commit the audio
+    turn_detection_mode: str = SERVER
+    # tenant the usage of the session is accounted to
+    tenant: str | None = None
+    voice: Voices | None = None
+    # "text" while the client does not play the audio, e.g. muted or in a text-only view
+    output: str = AUDIO_OUTPUT
+
+
+def default_inference_config(
+    preset: str = DEFAULT_PRESET,
+    system_message: str | None = None,
+    voice: Voices | None = None,
+    turn_detection_mode: str = "",
+    tenant: str | None = None,
+    output: str = AUDIO_OUTPUT,
+) -> InferenceConfig:
+    turn_detection_mode = turn_detection_mode or os.environ.get("AGENT_TURN_DETECTION", SERVER)
+    if turn_detection_mode not in (SERVER, CLIENT):
+        raise ValueError(f"Invalid turn detection: {turn_detection_mode}")
+    if output not in (AUDIO_OUTPUT, TEXT_OUTPUT):
+        raise ValueError(f"Invalid output: {output}")
+    return InferenceConfig(
+        preset=get_preset_store().get(preset),
+        system_message=system_message,
+        voice=voice,
+        turn_detection_mode=turn_detection_mode,
+        tenant=tenant,
+        output=output,
+    )
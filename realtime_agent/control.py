@@ -0,0 +1,152 @@
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable
+
+from .logger import setup_logger
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+# Control messages are plain dicts with a "type" key, sent over a duplex pipe:
+#   server -> worker: {"type": "assign", ...}, {"type": "stop", "grace_s": float}, {"type": "dump_audio"},
+#                     {"type": "reload_tools"}, {"type": "set_output", "output": "audio" | "text"}
+#   worker -> server: {"type": "status", "rate_limits": {...}}, {"type": "usage", "usage": {...}},
+#                     {"type": "startup", "timings": {phase: ms, ..., "total": ms}}
+ControlMessage = dict[str, Any]
+
+# Module of the agent process entry points; the forkserver imports it (and the SDKs it imports) once,
+# every agent process is forked from it with the imports done
+WORKER_MODULE = "realtime_agent.worker"
+
+_worker_context: BaseContext | None = None
+
+
+def worker_context() -> BaseContext:
+    """Multiprocessing context of the agent processes, AGENT_START_METHOD (forkserver by default)."""
+    global _worker_context
+    if _worker_context is None:
+        method = os.environ.get("AGENT_START_METHOD", "forkserver")
+        _worker_context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            # Preloading __main__ has no effect, the forkserver is never told the path of the main
+            # module. Every agent process runs the main module again as __mp_main__ unless it is the
+            # `__main__` of a package, hence `python -m realtime_agent` and a main.py without side effects.
+            preload = os.environ.get("AGENT_PRELOAD_MODULES", WORKER_MODULE)
+            _worker_context.set_forkserver_preload([name for name in preload.split(",") if name])
+        logger.info(f"Starting agent processes with the {method} start method")
+    return _worker_context
+
+
+def run_worker(entry_point: str, *args: Any) -> None:
+    """Target of the agent processes, runs `entry_point` of the worker module; the server never imports it."""
+    getattr(importlib.import_module(WORKER_MODULE), entry_point)(*args)
+
+
+class ControlChannel:
+    """Worker side of the control pipe, dispatching messages on the event loop."""
+
+    def __init__(self, connection: Connection) -> None:
+        self.connection = connection
+        self._handler: Callable[[ControlMessage], None] | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self, handler: Callable[[ControlMessage], None]) -> None:
+        self._handler = handler
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop.add_reader(self.connection.fileno(), self._on_readable)
+
+    def set_handler(self, handler: Callable[[ControlMessage], None]) -> None:
+        self._handler = handler
+
+    def send(self, message: ControlMessage) -> None:
+        try:
+            self.connection.send(message)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to send control message: {e}")
+
+    def close(self) -> None:
+        if self._loop is not None:
+            self._loop.remove_reader(self.connection.fileno())
+            self._loop = None
+
+    def _on_readable(self) -> None:
+        try:
+            while self.connection.poll():
+                message = self.connection.recv()
+                if self._handler:
+                    self._handler(message)
+        except (EOFError, OSError):
+            # the server went away, treat it as a request to stop
+            logger.warning("Control channel closed by the server")
+            self.close()
+            if self._handler:
+                self._handler({"type": "stop"})
+
+
+class AgentWorker:
+    """Server side handle of an agent process and its control pipe."""
+
+    def __init__(self, process: BaseProcess, control: Connection) -> None:
+        self.process = process
+        self.control = control
+        # startup phase durations in milliseconds, once the agent has joined the call
+        self.startup_timings: dict[str, float] | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._handler: Callable[[ControlMessage], None] | None = None
+
+    def listen(self, handler: Callable[[ControlMessage], None]) -> None:
+        """Dispatch the messages sent by the agent to `handler`, on the running event loop."""
+        self._handler = handler
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.control.fileno(), self._on_readable)
+
+    @property
+    def pid(self) -> int | None:
+        return self.process.pid
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def send(self, message: ControlMessage) -> bool:
+        try:
+            self.control.send(message)
+            return True
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to send control message to agent process {self.pid}: {e}")
+            return False
+
+    async def stop(self, grace_s: float) -> None:
+        """Ask the agent to finish its current response and exit, kill it if it does not within `grace_s`."""
+        if self.is_alive() and self.send({"type": "stop", "grace_s": grace_s}):
+            # leave the agent some time to flush recordings and leave the channel
+            await asyncio.to_thread(self.process.join, grace_s + 5.0)
+        if self.is_alive():
+            logger.warning(f"Agent process {self.pid} did not stop gracefully, killing it")
+            await asyncio.to_thread(os.kill, self.process.pid, signal.SIGKILL)
+            await asyncio.to_thread(self.process.join)
+        if self._loop is not None:
+            # messages sent by the agent right before it exited
+            self._on_readable()
+        self._stop_listening()
+        self.control.close()
+
+    def _on_readable(self) -> None:
+        try:
+            while self.control.poll():
+                self._handler(self.control.recv())
+        except (EOFError, OSError):
+            # the agent process exited
+            self._stop_listening()
+
+    def _stop_listening(self) -> None:
+        if self._loop is not None:
+            self._loop.remove_reader(self.control.fileno())
+            self._loop = None
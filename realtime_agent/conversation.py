@@ -0,0 +1,320 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any
+
+from attr import dataclass
+
+from .logger import setup_logger
+from .realtime.struct import AssistantMessageItemParam, ItemParam, SystemMessageItemParam, UserMessageItemParam
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+
+@dataclass(kw_only=True)
+class ConversationItem:
+    """Compact local view of a server-side conversation item."""
+
+    item_id: str
+    type: str
+    role: str | None = None
+    response_id: str | None = None
+    previous_item_id: str | None = None
+    text: str = ""
+    audio_start_ms: int | None = None
+    audio_end_ms: int | None = None
+    status: str = "in_progress"
+    created_at: float = 0.0
+    deleting: bool = False
+    # when the conversation.item.delete was sent
+    deleting_at: float = 0.0
+
+
+def _item_text(item: dict[str, Any]) -> str:
+    """Extract the transcript / text of an item without keeping the raw content parts."""
+    match item.get("type"):
+        case "function_call":
+            return f"{item.get('name', '')}({item.get('arguments') or ''})"
+        case "function_call_output":
+            return item.get("output") or ""
+
+    parts = []
+    for part in item.get("content") or []:
+        text = part.get("text") or part.get("transcript")
+        if text:
+            parts.append(text)
+    return " ".join(parts)
+
+
+class ConversationStore:
+    """Incrementally maintained model of the server-side conversation.
+
+    Items are indexed by item id (in server order) and by response id. When
+    `max_items` or `max_age_s` are exceeded, `evict` returns the ids of the
+    oldest items that should be deleted on the server with
+    `conversation.item.delete`; they are dropped locally once the server
+    confirms with `conversation.item.deleted`. A delete the server rejects,
+    or does not confirm within `delete_timeout_s`, is selected again.
+
+    Audio offsets and transcripts reported before their item was created are
+    kept for at most `pending_ttl_s` and `max_pending` items.
+    """
+
+    def __init__(
+        self,
+        max_items: int | None = None,
+        max_age_s: float | None = None,
+        *,
+        delete_timeout_s: float = 10.0,
+        pending_ttl_s: float = 60.0,
+        max_pending: int = 64,
+    ) -> None:
+        self.max_items = max_items
+        self.max_age_s = max_age_s
+        self.delete_timeout_s = delete_timeout_s
+        self.pending_ttl_s = pending_ttl_s
+        self.max_pending = max_pending
+        self._items: OrderedDict[str, ConversationItem] = OrderedDict()
+        self._responses: dict[str, list[str]] = {}
+        self._active_responses: set[str] = set()
+        # audio offsets reported by the VAD before the item itself is created
+        self._pending_audio: dict[str, tuple[int | None, int | None]] = {}
+        # input transcripts handled before the item itself is created, they are on another lane
+        self._pending_transcripts: dict[str, str] = {}
+        # when the first pending value of an item was reported, in reporting order
+        self._pending_at: dict[str, float] = {}
+        # event id of the conversation.item.delete -> item id
+        self._deletes: dict[str, str] = {}
+
+    @classmethod
+    def from_env(cls) -> "ConversationStore":
+        max_items = int(os.environ.get("CONVERSATION_MAX_ITEMS", "0"))
+        max_age_s = float(os.environ.get("CONVERSATION_MAX_AGE_S", "0"))
+        return cls(max_items=max_items or None, max_age_s=max_age_s or None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, item_id: str) -> ConversationItem | None:
+        return self._items.get(item_id)
+
+    def items(self) -> list[ConversationItem]:
+        return list(self._items.values())
+
+    def items_for_response(self, response_id: str) -> list[ConversationItem]:
+        return [self._items[i] for i in self._responses.get(response_id, []) if i in self._items]
+
+    def _upsert(self, item: dict[str, Any], response_id: str | None, previous_item_id: str | None) -> ConversationItem | None:
+        item_id = item.get("id")
+        if not item_id:
+            return None
+
+        entry = self._items.get(item_id)
+        if entry is None:
+            entry = ConversationItem(
+                item_id=item_id,
+                type=item.get("type", "message"),
+                role=item.get("role"),
+                previous_item_id=previous_item_id,
+                created_at=time.monotonic(),
+            )
+            self._items[item_id] = entry
+            self._pending_at.pop(item_id, None)
+            audio_start_ms, audio_end_ms = self._pending_audio.pop(item_id, (None, None))
+            entry.audio_start_ms = audio_start_ms
+            entry.audio_end_ms = audio_end_ms
+            entry.text = self._pending_transcripts.pop(item_id, "")
+
+        if response_id and entry.response_id is None:
+            entry.response_id = response_id
+            self._responses.setdefault(response_id, []).append(item_id)
+
+        text = _item_text(item)
+        if text:
+            entry.text = text
+        if item.get("status"):
+            entry.status = item["status"]
+        return entry
+
+    def on_item_created(self, item: dict[str, Any], previous_item_id: str | None = None) -> None:
+        self._upsert(item, None, previous_item_id)
+
+    def on_output_item_added(self, response_id: str, item: dict[str, Any] | None) -> None:
+        if item:
+            self._upsert(item, response_id, None)
+
+    def on_output_item_done(self, response_id: str, item: dict[str, Any] | None) -> None:
+        if item:
+            entry = self._upsert(item, response_id, None)
+            if entry and entry.status == "in_progress":
+                entry.status = "completed"
+
+    def on_response_created(self, response_id: str) -> None:
+        self._active_responses.add(response_id)
+
+    def on_response_done(self, response_id: str) -> None:
+        self._active_responses.discard(response_id)
+
+    def set_transcript(self, item_id: str, text: str) -> None:
+        entry = self._items.get(item_id)
+        if entry:
+            entry.text = text
+        else:
+            self._add_pending(item_id)
+            self._pending_transcripts[item_id] = text
+
+    def audio_span(self, item_id: str) -> tuple[int | None, int | None]:
+        """Audio offsets of an item, including the ones reported before the item was created."""
+        entry = self._items.get(item_id)
+        if entry:
+            return entry.audio_start_ms, entry.audio_end_ms
+        return self._pending_audio.get(item_id, (None, None))
+
+    def on_speech_started(self, item_id: str, audio_start_ms: int) -> None:
+        entry = self._items.get(item_id)
+        if entry:
+            entry.audio_start_ms = audio_start_ms
+        else:
+            self._add_pending(item_id)
+            self._pending_audio[item_id] = (audio_start_ms, None)
+
+    def on_speech_stopped(self, item_id: str | None, audio_end_ms: int) -> None:
+        if not item_id:
+            return
+        entry = self._items.get(item_id)
+        if entry:
+            entry.audio_end_ms = audio_end_ms
+        else:
+            self._add_pending(item_id)
+            audio_start_ms, _ = self._pending_audio.get(item_id, (None, None))
+            self._pending_audio[item_id] = (audio_start_ms, audio_end_ms)
+
+    def _add_pending(self, item_id: str) -> None:
+        now = time.monotonic()
+        self._pending_at.setdefault(item_id, now)
+        # the item was never created, e.g. its audio was cleared
+        while self._pending_at:
+            oldest, reported_at = next(iter(self._pending_at.items()))
+            if now - reported_at <= self.pending_ttl_s and len(self._pending_at) <= self.max_pending:
+                break
+            self._drop_pending(oldest)
+
+    def _drop_pending(self, item_id: str) -> None:
+        self._pending_at.pop(item_id, None)
+        self._pending_audio.pop(item_id, None)
+        self._pending_transcripts.pop(item_id, None)
+
+    def on_item_truncated(self, item_id: str, audio_end_ms: int) -> None:
+        entry = self._items.get(item_id)
+        if entry:
+            entry.audio_end_ms = audio_end_ms
+            entry.status = "truncated"
+
+    def on_delete_sent(self, item_id: str, event_id: str) -> None:
+        self._deletes[event_id] = item_id
+
+    def on_error(self, event_id: str | None) -> bool:
+        """A client event failed; a rejected delete is selected again. Returns whether it was a delete."""
+        item_id = self._deletes.pop(event_id, None) if event_id else None
+        if item_id is None:
+            return False
+        entry = self._items.get(item_id)
+        if entry:
+            entry.deleting = False
+        return True
+
+    def _forget_delete(self, item_id: str) -> None:
+        for event_id in [event_id for event_id, deleting in self._deletes.items() if deleting == item_id]:
+            del self._deletes[event_id]
+
+    def on_item_deleted(self, item_id: str) -> None:
+        entry = self._items.pop(item_id, None)
+        self._drop_pending(item_id)
+        self._forget_delete(item_id)
+        if entry and entry.response_id:
+            response_items = self._responses.get(entry.response_id)
+            if response_items and item_id in response_items:
+                response_items.remove(item_id)
+            if not response_items:
+                self._responses.pop(entry.response_id, None)
+
+    def reset(self) -> None:
+        self._items.clear()
+        self._responses.clear()
+        self._active_responses.clear()
+        self._pending_audio.clear()
+        self._pending_transcripts.clear()
+        self._pending_at.clear()
+        self._deletes.clear()
+
+    def replay_items(self, max_items: int = 10, summary_chars: int = 2000) -> list[ItemParam]:
+        """Build the items that re-create this conversation on a fresh session.
+
+        The most recent `max_items` messages are replayed as text items, older
+        messages are condensed into a single system message of at most
+        `summary_chars` characters. The store is reset, the server reports the
+        replayed items again with new ids.
+        """
+        messages = [
+            entry for entry in self._items.values()
+            if entry.type == "message" and entry.text and not entry.deleting
+        ]
+        recent = messages[-max_items:] if max_items > 0 else []
+        older = messages[:len(messages) - len(recent)]
+
+        replay: list[ItemParam] = []
+        if older and summary_chars > 0:
+            summary = " ".join(f"{entry.role}: {entry.text}" for entry in older)
+            if len(summary) > summary_chars:
+                summary = "..." + summary[-summary_chars:]
+            replay.append(SystemMessageItemParam(
+                content=[{"type": "input_text", "text": f"Summary of the earlier conversation: {summary}"}]
+            ))
+        for entry in recent:
+            if entry.role == "assistant":
+                replay.append(AssistantMessageItemParam(content=[{"type": "text", "text": entry.text}]))
+            elif entry.role == "user":
+                replay.append(UserMessageItemParam(content=[{"type": "input_text", "text": entry.text}]))
+
+        self.reset()
+        return replay
+
+    def evict(self, now: float | None = None) -> list[str]:
+        """Select the oldest items exceeding the size / age bounds for deletion.
+
+        Items belonging to a response that is still in progress are never evicted.
+        The returned items are marked as deleting so they are not selected twice,
+        until the delete fails or is not confirmed within `delete_timeout_s`.
+        """
+        if self.max_items is None and self.max_age_s is None:
+            return []
+
+        now = time.monotonic() if now is None else now
+        for entry in self._items.values():
+            if entry.deleting and now - entry.deleting_at > self.delete_timeout_s:
+                logger.warning(f"Deleting conversation item {entry.item_id} was not confirmed, retrying")
+                self._forget_delete(entry.item_id)
+                entry.deleting = False
+        live = sum(1 for entry in self._items.values() if not entry.deleting)
+        evicted = []
+        for entry in self._items.values():
+            if entry.deleting:
+                continue
+            if entry.response_id in self._active_responses:
+                break
+
+            over_size = self.max_items is not None and live > self.max_items
+            over_age = self.max_age_s is not None and now - entry.created_at > self.max_age_s
+            if not (over_size or over_age):
+                break
+
+            entry.deleting = True
+            entry.deleting_at = now
+            live -= 1
+            evicted.append(entry.item_id)
+
+        if evicted:
+            logger.info(f"Evicting {len(evicted)} conversation items, {live} remaining")
+        return evicted
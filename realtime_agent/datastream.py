@@ -0,0 +1,196 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from attr import dataclass
+
+from .logger import setup_logger
+from .realtime.struct import Voices
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+# Inbound data stream messages are JSON objects with a "type" key:
+#   {"type": "text", "text": str}                           a user message, answered by the model
+#   {"type": "cancel"}                                      stop the current response
+#   {"type": "mute", "muted": bool}                         stop / resume sending the user's audio to the model
+#   {"type": "session", "instructions": str, "voice": str}  change the session, both fields optional
+#   {"type": "output", "output": "audio" | "text"}          spoken or text-only responses
+# sent as they are, or split into "<msg_id>|<part>|<total parts>|<base64 chunk>" parts like the agent's messages.
+
+
+class DataStreamError(ValueError):
+    pass
+
+
+@dataclass(frozen=True, kw_only=True)
+class TextInput:
+    text: str
+
+
+@dataclass(frozen=True, kw_only=True)
+class CancelResponse:
+    pass
+
+
+@dataclass(frozen=True, kw_only=True)
+class SetMuted:
+    muted: bool
+
+
+@dataclass(frozen=True, kw_only=True)
+class UpdateSession:
+    instructions: str | None = None
+    voice: Voices | None = None
+
+
+@dataclass(frozen=True, kw_only=True)
+class SetOutput:
+    output: str
+
+
+DataStreamMessage = TextInput | CancelResponse | SetMuted | UpdateSession | SetOutput
+
+
+def parse_message(payload: str) -> DataStreamMessage:
+    try:
+        message = json.loads(payload)
+    except json.JSONDecodeError as e:
+        raise DataStreamError(f"Invalid JSON: {e}") from e
+    if not isinstance(message, dict):
+        raise DataStreamError("Expected a JSON object")
+
+    match message.get("type"):
+        case "text":
+            text = message.get("text")
+            if not isinstance(text, str) or not text.strip():
+                raise DataStreamError("text requires a non-empty text")
+            return TextInput(text=text)
+        case "cancel":
+            return CancelResponse()
+        case "mute":
+            if not isinstance(message.get("muted", True), bool):
+                raise DataStreamError("mute requires a boolean muted")
+            return SetMuted(muted=message.get("muted", True))
+        case "session":
+            instructions = message.get("instructions")
+            if instructions is not None and not isinstance(instructions, str):
+                raise DataStreamError("session instructions must be a string")
+            voice = message.get("voice")
+            if voice is not None and voice not in Voices.__members__.values():
+                raise DataStreamError(f"Invalid voice: {voice}")
+            if instructions is None and voice is None:
+                raise DataStreamError("session requires instructions or voice")
+            return UpdateSession(instructions=instructions, voice=Voices(voice) if voice is not None else None)
+        case "output":
+            if message.get("output") not in ("audio", "text"):
+                raise DataStreamError("output must be audio or text")
+            return SetOutput(output=message["output"])
+        case other:
+            raise DataStreamError(f"Unknown message type {other!r}")
+
+
+class ChunkAssembler:
+    """Reassembles the messages split into parts, parts of incomplete messages are dropped after `timeout_s`."""
+
+    def __init__(self, *, timeout_s: float = 5.0, max_pending: int = 16) -> None:
+        self.timeout_s = timeout_s
+        self.max_pending = max_pending
+        self._pending: dict[str, tuple[float, dict[int, str]]] = {}
+
+    def add(self, data: bytes | str) -> str | None:
+        """Feed a data stream message, returns the payload once it is complete."""
+        text = data.decode("utf-8") if isinstance(data, (bytes, bytearray)) else data
+        if text.lstrip().startswith("{"):
+            return text
+        try:
+            msg_id, part, total, chunk = text.split("|", 3)
+            part, total = int(part), int(total)
+        except ValueError as e:
+            raise DataStreamError("Expected a JSON object or a message part") from e
+        if not 1 <= part <= total:
+            raise DataStreamError(f"Invalid part {part} of {total}")
+
+        now = time.monotonic()
+        for expired in [key for key, (started, _) in self._pending.items() if now - started > self.timeout_s]:
+            logger.warning(f"Dropping incomplete data stream message {expired}")
+            del self._pending[expired]
+        if msg_id not in self._pending and len(self._pending) >= self.max_pending:
+            raise DataStreamError(f"Too many incomplete messages, dropping {msg_id}")
+
+        parts = self._pending.setdefault(msg_id, (now, {}))[1]
+        parts[part] = chunk
+        if len(parts) < total:
+            return None
+        del self._pending[msg_id]
+        try:
+            return base64.b64decode("".join(parts[index] for index in range(1, total + 1))).decode("utf-8")
+        except (KeyError, ValueError) as e:
+            raise DataStreamError(f"Invalid message {msg_id}: {e}") from e
+
+
+class TextBatcher:
+    """Batches bursts of text input into one model turn.
+
+    Texts are held until none arrived for `debounce_ms`, and at most
+    `max_wait_ms` after the first one, then handed to `flush` together, so a
+    client sending several messages in a row gets one response instead of
+    one per message.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[list[str]], Awaitable[None]],
+        *,
+        debounce_ms: int = 300,
+        max_wait_ms: int = 1500,
+    ) -> None:
+        self.flush = flush
+        self.debounce_s = debounce_ms / 1000
+        self.max_wait_s = max_wait_ms / 1000
+        self._texts: list[str] = []
+        self._first_at = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task[None]] = set()
+
+    @classmethod
+    def from_env(cls, flush: Callable[[list[str]], Awaitable[None]]) -> "TextBatcher":
+        return cls(
+            flush,
+            debounce_ms=int(os.environ.get("DATASTREAM_TEXT_DEBOUNCE_MS", "300")),
+            max_wait_ms=int(os.environ.get("DATASTREAM_TEXT_MAX_WAIT_MS", "1500")),
+        )
+
+    def add(self, text: str) -> None:
+        loop = asyncio.get_running_loop()
+        if not self._texts:
+            self._first_at = loop.time()
+        self._texts.append(text)
+        if self._timer:
+            self._timer.cancel()
+        delay_s = min(self.debounce_s, self._first_at + self.max_wait_s - loop.time())
+        self._timer = loop.call_later(max(delay_s, 0), self._on_timer)
+
+    def close(self) -> None:
+        """Drop the held texts and cancel the flushes still running."""
+        if self._timer:
+            self._timer.cancel()
+        self._texts = []
+        for task in self._flushes:
+            task.cancel()
+
+    def _on_timer(self) -> None:
+        texts, self._texts, self._timer = self._texts, [], None
+        task = asyncio.create_task(self.flush(texts))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+        task.add_done_callback(_log_exception)
+
+
+def _log_exception(t: asyncio.Task[Any]) -> None:
+    if not t.cancelled() and t.exception():
+        logger.error("Failed to send the text input", exc_info=t.exception())
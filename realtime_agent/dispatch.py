@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+from .logger import setup_logger
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+T = TypeVar("T")
+
+# Lanes in priority order
+AUDIO = "audio"
+CONTROL = "control"
+TRANSCRIPT = "transcript"
+TELEMETRY = "telemetry"
+LANES = (AUDIO, CONTROL, TRANSCRIPT, TELEMETRY)
+
+_CLOSED = object()
+
+
+class _Lane(Generic[T]):
+    def __init__(self, name: str, handler: Callable[[T], Awaitable[None]], warn_depth: int) -> None:
+        self.name = name
+        self.handler = handler
+        self.warn_depth = warn_depth
+        # (enqueue time, message)
+        self.queue: asyncio.Queue[tuple[float, Any]] = asyncio.Queue()
+        self.task: asyncio.Task[None] | None = None
+        self.max_depth = 0
+        self.handled = 0
+        self.dropped = 0
+        self.wait_total_s = 0.0
+        self.max_wait_s = 0.0
+        self.handle_total_s = 0.0
+        self.warned = False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "handled": self.handled,
+            "dropped": self.dropped,
+            "mean_wait_ms": round(self.wait_total_s / self.handled * 1000, 3) if self.handled else 0.0,
+            "max_wait_ms": round(self.max_wait_s * 1000, 3),
+            "mean_handle_ms": round(self.handle_total_s / self.handled * 1000, 3) if self.handled else 0.0,
+        }
+
+
+class LaneDispatcher(Generic[T]):
+    """Hands the messages read from a stream to one consumer task per lane.
+
+    The reader only classifies each message with `lane_of` and queues it, so
+    reading never waits for a handler. Messages of a lane are handled in
+    order; lanes are independent, so slow transcript publishing or logging
+    does not hold back audio or barge-in handling. A consumer yields to the
+    event loop before each message while a higher priority lane has messages
+    waiting, and the depth and queueing delay of each lane are tracked.
+    """
+
+    def __init__(
+        self,
+        lane_of: Callable[[T], str],
+        handlers: dict[str, Callable[[T], Awaitable[None]]],
+        *,
+        warn_depth: int = 50,
+    ) -> None:
+        self.lane_of = lane_of
+        self._lanes = {name: _Lane(name, handlers[name], warn_depth) for name in LANES if name in handlers}
+        self._order = list(self._lanes.values())
+
+    def start(self) -> None:
+        for lane in self._order:
+            lane.task = asyncio.create_task(self._consume(lane), name=f"lane-{lane.name}")
+
+    def put(self, message: T) -> None:
+        lane = self._lanes[self.lane_of(message)]
+        lane.queue.put_nowait((time.monotonic(), message))
+        depth = lane.queue.qsize()
+        lane.max_depth = max(lane.max_depth, depth)
+        if depth > lane.warn_depth and not lane.warned:
+            lane.warned = True
+            logger.warning(f"Lane {lane.name} is backed up: {depth} messages waiting")
+        elif depth <= lane.warn_depth // 2:
+            lane.warned = False
+
+    def clear(self, name: str) -> int:
+        """Drop the messages waiting in a lane, returns how many were dropped."""
+        lane = self._lanes[name]
+        dropped = 0
+        while not lane.queue.empty():
+            lane.queue.get_nowait()
+            lane.queue.task_done()
+            dropped += 1
+        lane.dropped += dropped
+        return dropped
+
+    def depths(self) -> dict[str, int]:
+        return {name: lane.queue.qsize() for name, lane in self._lanes.items()}
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {name: lane.stats() for name, lane in self._lanes.items()}
+
+    async def close(self, drain: bool = True) -> None:
+        """Stop the consumers, after the queued messages were handled if `drain` is set."""
+        for lane in self._order:
+            if not drain:
+                self.clear(lane.name)
+            lane.queue.put_nowait((time.monotonic(), _CLOSED))
+        await asyncio.gather(*(lane.task for lane in self._order if lane.task), return_exceptions=True)
+
+    async def _consume(self, lane: _Lane[T]) -> None:
+        higher = self._order[:self._order.index(lane)]
+        while True:
+            queued_at, message = await lane.queue.get()
+            if message is _CLOSED:
+                lane.queue.task_done()
+                return
+            if any(not other.queue.empty() for other in higher):
+                await asyncio.sleep(0)
+            started = time.monotonic()
+            try:
+                await lane.handler(message)
+            except Exception:
+                logger.exception(f"Error handling message in lane {lane.name}")
+            finally:
+                lane.queue.task_done()
+            finished = time.monotonic()
+            wait_s = started - queued_at
+            lane.handled += 1
+            lane.wait_total_s += wait_s
+            lane.max_wait_s = max(lane.max_wait_s, wait_s)
+            lane.handle_total_s += finished - started
@@ -0,0 +1,105 @@
+import os
+from enum import Enum
+
+import numpy as np
+
+from .realtime.struct import PCM_SAMPLE_RATE
+
+SAMPLE_WIDTH = 2  # pcm16
+
+class EndpointEvent(str, Enum):
+    SPEECH_STARTED = "speech_started"
+    SPEECH_ENDED = "speech_ended"
+
+
+class Endpointer:
+    """Streaming energy-based endpointer for client-managed turn detection.
+
+    The uplink audio is cut into `frame_ms` frames. A frame is speech when its
+    RMS energy is above `threshold_rms` and `noise_ratio` times the noise
+    floor, which follows the energy of the non-speech frames. Speech starts
+    after `start_ms` of consecutive speech frames, so short noises (coughs,
+    clicks) do not start a turn, and the turn ends after `silence_ms` of
+    non-speech frames.
+
+    Offsets are in milliseconds of audio fed since the start, matching the
+    audio_start_ms / audio_end_ms the server reports for the input buffer.
+    """
+
+    def __init__(
+        self,
+        *,
+        sample_rate: int = PCM_SAMPLE_RATE,
+        frame_ms: int = 10,
+        threshold_rms: float = 500.0,
+        noise_ratio: float = 3.0,
+        start_ms: int = 150,
+        silence_ms: int = 350,
+        noise_smoothing: float = 0.05,
+    ) -> None:
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * SAMPLE_WIDTH
+        self.threshold_rms = threshold_rms
+        self.noise_ratio = noise_ratio
+        self.start_frames = max(start_ms // frame_ms, 1)
+        self.silence_frames = max(silence_ms // frame_ms, 1)
+        self.noise_smoothing = noise_smoothing
+        self.noise_floor = 0.0
+        self.in_speech = False
+        self.speech_start_ms: int | None = None
+        self.speech_end_ms: int | None = None
+        self._buffer = bytearray()
+        self._offset_ms = 0
+        self._speech_frames = 0
+        self._silence_frames = 0
+
+    @classmethod
+    def from_env(cls) -> "Endpointer":
+        return cls(
+            threshold_rms=float(os.environ.get("ENDPOINTER_THRESHOLD_RMS", "500")),
+            noise_ratio=float(os.environ.get("ENDPOINTER_NOISE_RATIO", "3")),
+            start_ms=int(os.environ.get("ENDPOINTER_START_MS", "150")),
+            silence_ms=int(os.environ.get("ENDPOINTER_SILENCE_MS", "350")),
+        )
+
+    def process(self, data: bytes) -> list[EndpointEvent]:
+        """Feed uplink audio, returns the speech start / end of turn events it completes."""
+        self._buffer.extend(data)
+        events = []
+        while len(self._buffer) >= self.frame_bytes:
+            frame = np.frombuffer(self._buffer, dtype=np.int16, count=self.frame_bytes // SAMPLE_WIDTH)
+            rms = float(np.sqrt(np.mean(np.square(frame, dtype=np.float32))))
+            del frame
+            del self._buffer[:self.frame_bytes]
+            event = self._process_frame(rms)
+            self._offset_ms += self.frame_ms
+            if event:
+                events.append(event)
+        return events
+
+    def reset(self) -> None:
+        """Forget the current turn, e.g. after the input buffer was cleared."""
+        self.in_speech = False
+        self._speech_frames = self._silence_frames = 0
+
+    def _process_frame(self, rms: float) -> EndpointEvent | None:
+        is_speech = rms >= max(self.threshold_rms, self.noise_floor * self.noise_ratio)
+        if not is_speech:
+            self.noise_floor += self.noise_smoothing * (rms - self.noise_floor)
+
+        if not self.in_speech:
+            self._speech_frames = self._speech_frames + 1 if is_speech else 0
+            if self._speech_frames < self.start_frames:
+                return None
+            self.in_speech = True
+            self._silence_frames = 0
+            self.speech_start_ms = self._offset_ms - (self._speech_frames - 1) * self.frame_ms
+            self.speech_end_ms = None
+            return EndpointEvent.SPEECH_STARTED
+
+        self._silence_frames = 0 if is_speech else self._silence_frames + 1
+        if self._silence_frames < self.silence_frames:
+            return None
+        self.reset()
+        self.speech_end_ms = self._offset_ms - (self.silence_frames - 1) * self.frame_ms
+        return EndpointEvent.SPEECH_ENDED
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Any, Callable, Coroutine, TypeVar
+
+from attr import dataclass
+
+from .logger import setup_logger
+from .utils import generate_file_name
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+T = TypeVar("T")
+
+# Upper bounds of the scheduling lag histogram, in milliseconds
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def event_loop_factory() -> Callable[[], asyncio.AbstractEventLoop] | None:
+    """uvloop's loop factory when AGENT_USE_UVLOOP is set and uvloop is installed, else the default."""
+    if os.environ.get("AGENT_USE_UVLOOP", "false") != "true":
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("AGENT_USE_UVLOOP is set but uvloop is not installed, using the default event loop")
+        return None
+    return uvloop.new_event_loop
+
+
+def run(main: Coroutine[Any, Any, T]) -> T:
+    """Like asyncio.run, on the event loop selected by `event_loop_factory`."""
+    with asyncio.Runner(loop_factory=event_loop_factory()) as runner:
+        return runner.run(main)
+
+
+@dataclass(frozen=True, kw_only=True)
+class Stall:
+    """A period the event loop did not run scheduled callbacks, with where it was stuck."""
+
+    at: float
+    duration_ms: float
+    # (number of samples, stack) for every distinct stack seen while stalled, most frequent first
+    samples: list[tuple[int, list[str]]]
+
+
+class LoopMonitor:
+    """Measures the scheduling lag of the event loop and samples the stack while it is blocked.
+
+    A task sleeps for `interval_s` and records how late it wakes up. A
+    watchdog thread checks that the task keeps waking up; once it has not for
+    longer than `threshold_ms`, the watchdog samples the stack of the loop
+    thread every `threshold_ms / 4` until the loop runs again. Each lag over
+    the threshold is kept as a `Stall` with the stacks it spent its time in.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold_ms: float = 100.0,
+        interval_s: float = 0.05,
+        max_stalls: int = 50,
+        directory: str = "",
+    ) -> None:
+        self.threshold_s = threshold_ms / 1000
+        self.interval_s = interval_s
+        self.max_stalls = max_stalls
+        self.directory = directory
+        self.stalls: list[Stall] = []
+        self.lag_histogram = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.max_lag_ms = 0.0
+        self._lag_total_ms = 0.0
+        self._ticks = 0
+        self._heartbeat = time.monotonic()
+        self._samples: Counter[tuple[str, ...]] = Counter()
+        self._samples_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+
+    @classmethod
+    def from_env(cls) -> "LoopMonitor | None":
+        threshold_ms = float(os.environ.get("LOOP_LAG_THRESHOLD_MS", "100"))
+        if threshold_ms <= 0:
+            return None
+        return cls(threshold_ms=threshold_ms, directory=os.environ.get("LOOP_MONITOR_DIR", ""))
+
+    def start(self) -> None:
+        """Start monitoring the running loop, must be called from the loop thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "ticks": self._ticks,
+            "mean_lag_ms": round(self._lag_total_ms / self._ticks, 3) if self._ticks else 0.0,
+            "max_lag_ms": round(self.max_lag_ms, 3),
+            "lag_histogram_ms": {
+                f"<={bound}" if bound else f">{LAG_BUCKETS_MS[-1]}": count
+                for bound, count in zip((*LAG_BUCKETS_MS, None), self.lag_histogram)
+            },
+            "stalls": len(self.stalls),
+        }
+
+    async def export(self, prefix: str) -> str:
+        """Write the lag statistics and the stalls with their stack samples to a JSON file."""
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            prefix = os.path.join(self.directory, prefix)
+        file_name = generate_file_name(prefix, extension="json")
+        report = {
+            "stats": self.stats(),
+            "stalls": [
+                {
+                    "at": stall.at,
+                    "duration_ms": round(stall.duration_ms, 3),
+                    "samples": [{"count": count, "stack": stack} for count, stack in stall.samples],
+                }
+                for stall in self.stalls
+            ],
+        }
+        await asyncio.to_thread(_write_json, file_name, report)
+        logger.info(f"Exported event loop report to {file_name}")
+        return file_name
+
+    async def _tick(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            now = time.monotonic()
+            self._heartbeat = now
+            self._record(max(now - expected, 0.0))
+
+    def _record(self, lag_s: float) -> None:
+        lag_ms = lag_s * 1000
+        self._ticks += 1
+        self._lag_total_ms += lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        self.lag_histogram[_bucket(lag_ms)] += 1
+
+        with self._samples_lock:
+            samples, self._samples = self._samples, Counter()
+        if lag_s < self.threshold_s:
+            return
+
+        stall = Stall(
+            at=time.time() - lag_s,
+            duration_ms=lag_ms,
+            samples=[(count, list(stack)) for stack, count in samples.most_common()],
+        )
+        top = f", mostly in:\n{''.join(stall.samples[0][1][-5:])}" if stall.samples else ""
+        logger.warning(f"Event loop blocked for {lag_ms:.0f}ms{top}")
+        if len(self.stalls) < self.max_stalls:
+            self.stalls.append(stall)
+
+    def _watch(self) -> None:
+        poll_s = self.threshold_s / 4
+        while not self._stopped.wait(poll_s):
+            if time.monotonic() - self._heartbeat < self.interval_s + self.threshold_s:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = tuple(traceback.format_stack(frame, limit=30))
+            del frame
+            with self._samples_lock:
+                self._samples[stack] += 1
+
+
+def _bucket(lag_ms: float) -> int:
+    for index, bound in enumerate(LAG_BUCKETS_MS):
+        if lag_ms <= bound:
+            return index
+    return len(LAG_BUCKETS_MS)
+
+
+def _write_json(file_name: str, data: dict[str, Any]) -> None:
+    with open(file_name, "w") as f:
+        json.dump(data, f, indent=2)
@@ -0,0 +1,140 @@
+import importlib
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+from .dispatch import TELEMETRY
+from .logger import setup_logger
+from .realtime.struct import ServerToClientMessage
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+M = TypeVar("M", bound=ServerToClientMessage)
+
+Handler = Callable[[Any], Awaitable[None]]
+# middleware(message, call_next) wraps the handling of every message
+Middleware = Callable[[ServerToClientMessage, Callable[[], Awaitable[None]]], Awaitable[None]]
+
+# Upper bounds of the handling time histogram, in milliseconds
+HANDLE_BUCKETS_MS = (0.05, 0.1, 0.5, 1, 5, 10, 50, 100)
+
+
+def event_type(message_type: type) -> str:
+    """The Realtime API event type of a message class, e.g. "response.audio.delta"."""
+    value = getattr(message_type, "type", message_type.__name__)
+    return getattr(value, "value", value)
+
+
+class _EventStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.histogram = [0] * (len(HANDLE_BUCKETS_MS) + 1)
+
+    def record(self, elapsed_s: float) -> None:
+        self.count += 1
+        self.total_s += elapsed_s
+        self.max_s = max(self.max_s, elapsed_s)
+        elapsed_ms = elapsed_s * 1000
+        for index, bound in enumerate(HANDLE_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.histogram[index] += 1
+                return
+        self.histogram[-1] += 1
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_s * 1000, 3),
+            "mean_ms": round(self.total_s / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max_s * 1000, 3),
+            "histogram_ms": {
+                f"<={bound}" if bound else f">{HANDLE_BUCKETS_MS[-1]}": count
+                for bound, count in zip((*HANDLE_BUCKETS_MS, None), self.histogram)
+            },
+        }
+
+
+class HandlerRegistry:
+    """Handlers of the server messages, subscribed per message type.
+
+    Handlers run in the order they were added, inside the middlewares added
+    with `use`. The lane a message type is dispatched on is given with its
+    first handler, types without a handler go to the telemetry lane. Every
+    dispatch is counted and timed per event type, including the types
+    without handlers, so `stats()` shows where the handling time goes.
+    Event types listed in AGENT_DISABLED_HANDLERS are not handled.
+    """
+
+    def __init__(self, disabled: set[str] | None = None) -> None:
+        self.disabled = disabled or set()
+        self._handlers: dict[type, list[Handler]] = {}
+        self._lanes: dict[type, str] = {}
+        self._ignored: set[type] = set()
+        self._middlewares: list[Middleware] = []
+        self._stats: dict[str, _EventStats] = {}
+
+    @classmethod
+    def from_env(cls) -> "HandlerRegistry":
+        disabled = os.environ.get("AGENT_DISABLED_HANDLERS", "")
+        return cls({name.strip() for name in disabled.split(",") if name.strip()})
+
+    def on(self, message_type: type[M], handler: Callable[[M], Awaitable[None]], *, lane: str | None = None) -> None:
+        if event_type(message_type) in self.disabled:
+            logger.info(f"Handler of {event_type(message_type)} is disabled")
+            return
+        self._handlers.setdefault(message_type, []).append(handler)
+        if lane is not None:
+            self._lanes.setdefault(message_type, lane)
+
+    def off(self, message_type: type, handler: Handler) -> None:
+        handlers = self._handlers.get(message_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def ignore(self, *message_types: type) -> None:
+        """Message types that are expected and need no handler, not warned about."""
+        self._ignored.update(message_types)
+
+    def use(self, middleware: Middleware) -> None:
+        self._middlewares.append(middleware)
+
+    def load_plugins(self, agent: Any) -> None:
+        """Import the modules in AGENT_HANDLER_MODULES and call their `register(handlers, agent)`."""
+        for module_name in os.environ.get("AGENT_HANDLER_MODULES", "").split(","):
+            if module_name.strip():
+                importlib.import_module(module_name.strip()).register(self, agent)
+                logger.info(f"Loaded handlers from {module_name.strip()}")
+
+    def lane_of(self, message: ServerToClientMessage) -> str:
+        return self._lanes.get(type(message), TELEMETRY)
+
+    async def dispatch(self, message: ServerToClientMessage) -> None:
+        started = time.perf_counter()
+        try:
+            await self._call(message, 0)
+        finally:
+            name = event_type(type(message))
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _EventStats()
+            stats.record(time.perf_counter() - started)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Per event type dispatch statistics, the most expensive types first."""
+        ranked = sorted(self._stats.items(), key=lambda item: item[1].total_s, reverse=True)
+        return {name: stats.to_dict() for name, stats in ranked}
+
+    async def _call(self, message: ServerToClientMessage, index: int) -> None:
+        if index < len(self._middlewares):
+            await self._middlewares[index](message, lambda: self._call(message, index + 1))
+            return
+        handlers = self._handlers.get(type(message))
+        if handlers:
+            for handler in handlers:
+                await handler(message)
+        elif type(message) not in self._ignored and event_type(type(message)) not in self.disabled:
+            logger.warning(f"Unhandled message {message=}")
@@ -0,0 +1,215 @@
+import asyncio
+import bisect
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator
+
+import numpy as np
+
+from .logger import setup_logger
+from .realtime.struct import PCM_SAMPLE_RATE
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+SAMPLE_WIDTH = 2  # pcm16
+
+MIX = "mix"
+ACTIVE_SPEAKER = "active_speaker"
+
+
+class _Participant:
+    def __init__(self, uid: Any) -> None:
+        self.uid = uid
+        self.buffer = bytearray()
+        self.energy = 0.0
+        self.last_write = time.monotonic()
+
+
+class UplinkMixer:
+    """Combines the audio of several remote users into the single uplink the model expects.
+
+    Audio written per user is cut into `frame_ms` frames. A frame is produced
+    once every user that sent audio in the last `stale_ms` has a frame
+    buffered, or once one of them is `max_lag_frames` ahead (users lagging
+    behind are padded with silence), so the output is paced by the incoming
+    audio rather than a timer.
+
+    In "mix" mode the frames of all users are summed; in "active_speaker" mode
+    only the loudest user (by smoothed RMS energy) is passed through, and the
+    selection only switches after another user has been clearly louder for
+    `hold_ms`. The dominant speaker of every frame is kept on a timeline of
+    uplink offsets, matching the audio_start_ms / audio_end_ms the server
+    reports for input audio, to attribute transcripts to a speaker. Only
+    frames confirmed with `commit` advance the timeline, so frames that are
+    shed or dropped while muted do not move it ahead of the server.
+    """
+
+    def __init__(
+        self,
+        mode: str = MIX,
+        *,
+        sample_rate: int = PCM_SAMPLE_RATE,
+        frame_ms: int = 20,
+        stale_ms: int = 100,
+        max_lag_frames: int = 5,
+        silence_rms: float = 300.0,
+        switch_ratio: float = 2.0,
+        hold_ms: int = 300,
+        energy_smoothing: float = 0.3,
+    ) -> None:
+        if mode not in (MIX, ACTIVE_SPEAKER):
+            raise ValueError(f"Unsupported mixer mode: {mode}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * SAMPLE_WIDTH
+        self.stale_s = stale_ms / 1000
+        self.max_lag_bytes = max_lag_frames * self.frame_bytes
+        self.silence_rms = silence_rms
+        self.switch_ratio = switch_ratio
+        self.hold_frames = max(hold_ms // frame_ms, 1)
+        self.energy_smoothing = energy_smoothing
+        # frames with their dominant speaker
+        self.output: asyncio.Queue[tuple[bytes, Any] | None] = asyncio.Queue()
+        self.speaker: Any = None
+        self._participants: dict[Any, _Participant] = {}
+        self._candidate: Any = None
+        self._candidate_frames = 0
+        self._offset_ms = 0
+        # dominant speaker of the frame last returned by `frames`
+        self._frame_speaker: Any = None
+        # (uplink offset in ms, dominant speaker) at every change of speaker
+        self._timeline: deque[tuple[int, Any]] = deque(maxlen=4096)
+
+    @classmethod
+    def from_env(cls) -> "UplinkMixer | None":
+        mode = os.environ.get("AGENT_MULTI_PARTICIPANT_MODE", "")
+        if not mode:
+            return None
+        return cls(mode)
+
+    def __len__(self) -> int:
+        return len(self._participants)
+
+    def __contains__(self, uid: Any) -> bool:
+        return uid in self._participants
+
+    def add(self, uid: Any) -> None:
+        self._participants.setdefault(uid, _Participant(uid))
+
+    def remove(self, uid: Any) -> None:
+        self._participants.pop(uid, None)
+        if self.speaker == uid:
+            self.speaker = None
+        # the remaining users may be ready now
+        self._drain()
+
+    def write(self, uid: Any, data: bytes) -> None:
+        participant = self._participants.get(uid)
+        if participant is None:
+            return
+        participant.buffer.extend(data)
+        participant.last_write = time.monotonic()
+        self._drain()
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        while (item := await self.output.get()) is not None:
+            frame, self._frame_speaker = item
+            yield frame
+
+    def commit(self) -> None:
+        """The frame last returned by `frames` was sent to the model, add it to the speaker timeline."""
+        if not self._timeline or self._timeline[-1][1] != self._frame_speaker:
+            self._timeline.append((self._offset_ms, self._frame_speaker))
+        self._offset_ms += self.frame_ms
+
+    def close(self) -> None:
+        self.output.put_nowait(None)
+
+    def speaker_between(self, start_ms: int | None, end_ms: int | None) -> Any:
+        """The user that was the dominant speaker for most of the uplink between the offsets."""
+        if start_ms is None or not self._timeline:
+            return None
+        if end_ms is None or end_ms <= start_ms:
+            end_ms = start_ms + 1
+        offsets = [offset for offset, _ in self._timeline]
+        index = max(bisect.bisect_right(offsets, start_ms) - 1, 0)
+        durations: dict[Any, int] = {}
+        for position in range(index, len(self._timeline)):
+            offset, uid = self._timeline[position]
+            if offset >= end_ms:
+                break
+            next_offset = self._timeline[position + 1][0] if position + 1 < len(self._timeline) else end_ms
+            if uid is not None:
+                durations[uid] = durations.get(uid, 0) + min(next_offset, end_ms) - max(offset, start_ms)
+        return max(durations, key=durations.get, default=None)
+
+    def _ready(self) -> bool:
+        now = time.monotonic()
+        live = [p for p in self._participants.values() if p.buffer or now - p.last_write < self.stale_s]
+        if not live:
+            return False
+        if all(len(p.buffer) >= self.frame_bytes for p in live):
+            return True
+        return any(len(p.buffer) >= self.max_lag_bytes for p in live)
+
+    def _drain(self) -> None:
+        while self._ready():
+            self._produce()
+
+    def _produce(self) -> None:
+        samples = self.frame_bytes // SAMPLE_WIDTH
+        uids = []
+        frames = []
+        for participant in self._participants.values():
+            if not participant.buffer:
+                continue
+            chunk = bytes(participant.buffer[:self.frame_bytes])
+            del participant.buffer[:self.frame_bytes]
+            frame = np.zeros(samples, dtype=np.int16)
+            frame[:len(chunk) // SAMPLE_WIDTH] = np.frombuffer(chunk, dtype=np.int16, count=len(chunk) // SAMPLE_WIDTH)
+            uids.append(participant.uid)
+            frames.append(frame)
+
+        stacked = np.stack(frames)
+        rms = np.sqrt(np.mean(np.square(stacked, dtype=np.float32), axis=1))
+        for uid, energy in zip(uids, rms):
+            participant = self._participants[uid]
+            participant.energy += self.energy_smoothing * (float(energy) - participant.energy)
+
+        if self.mode == MIX:
+            mixed = np.clip(stacked.sum(axis=0, dtype=np.int32), -32768, 32767).astype(np.int16)
+            loudest = max(self._participants.values(), key=lambda p: p.energy)
+            dominant = loudest.uid if loudest.energy >= self.silence_rms else None
+            self._set_speaker(dominant)
+        else:
+            self._select_speaker()
+            mixed = frames[uids.index(self.speaker)] if self.speaker in uids else np.zeros(samples, dtype=np.int16)
+            dominant = self.speaker if self.speaker is not None and self._participants[self.speaker].energy >= self.silence_rms else None
+
+        self.output.put_nowait((mixed.tobytes(), dominant))
+
+    def _select_speaker(self) -> None:
+        loudest = max(self._participants.values(), key=lambda p: p.energy)
+        current = self._participants.get(self.speaker)
+        if current is None:
+            self._set_speaker(loudest.uid)
+            return
+        if loudest is current or loudest.energy < max(self.silence_rms, current.energy * self.switch_ratio):
+            self._candidate, self._candidate_frames = None, 0
+            return
+        # switch only once the other user has been clearly louder for a while
+        if self._candidate != loudest.uid:
+            self._candidate, self._candidate_frames = loudest.uid, 0
+        self._candidate_frames += 1
+        if self._candidate_frames >= self.hold_frames:
+            self._set_speaker(loudest.uid)
+            self._candidate, self._candidate_frames = None, 0
+
+    def _set_speaker(self, uid: Any) -> None:
+        if uid != self.speaker and self.mode == ACTIVE_SPEAKER:
+            logger.info(f"Active speaker: {uid}")
+        self.speaker = uid
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any
+
+from .logger import setup_logger
+from .realtime.struct import RateLimitDetails, Usage
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+REQUESTS = "requests"
+TOKENS = "tokens"
+
+
+class _Limit:
+    def __init__(self, details: RateLimitDetails) -> None:
+        self.name = details.name
+        self.limit = details.limit
+        self.remaining = details.remaining
+        # wall clock, the reset time is shared with the server process
+        self.reset_at = time.time() + details.reset_seconds
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.reset_at
+
+    @property
+    def fraction(self) -> float:
+        return self.remaining / self.limit if self.limit else 1.0
+
+
+class RateLimitBudget:
+    """Request and token budget of the API key, fed by rate_limits.updated and the response usage.
+
+    The server reports the remaining requests and tokens of the key after
+    every response; the key is shared by all the sessions using it, so the
+    numbers reflect the load of every agent. Responses created by the agent
+    are paced: while a limit has less than `reserve_ratio` of its capacity
+    left, `wait_for_capacity` waits for the window to reset (at most
+    `max_wait_s`). Once the remaining tokens fall below `trim_ratio`, or the
+    session nears `session_max_tokens`, the output tokens of responses are
+    reduced proportionally, down to `min_output_tokens`.
+    """
+
+    def __init__(
+        self,
+        *,
+        reserve_ratio: float = 0.05,
+        trim_ratio: float = 0.2,
+        base_output_tokens: int = 4096,
+        min_output_tokens: int = 256,
+        session_max_tokens: int | None = None,
+        max_wait_s: float = 5.0,
+    ) -> None:
+        self.reserve_ratio = reserve_ratio
+        self.trim_ratio = trim_ratio
+        self.base_output_tokens = base_output_tokens
+        self.min_output_tokens = min_output_tokens
+        self.session_max_tokens = session_max_tokens
+        self.max_wait_s = max_wait_s
+        self.session_tokens = 0
+        self.paced_s = 0.0
+        self._limits: dict[str, _Limit] = {}
+
+    @classmethod
+    def from_env(cls) -> "RateLimitBudget":
+        return cls(
+            reserve_ratio=float(os.environ.get("RATE_LIMIT_RESERVE_RATIO", "0.05")),
+            trim_ratio=float(os.environ.get("RATE_LIMIT_TRIM_RATIO", "0.2")),
+            base_output_tokens=int(os.environ.get("RATE_LIMIT_BASE_OUTPUT_TOKENS", "4096")),
+            min_output_tokens=int(os.environ.get("RATE_LIMIT_MIN_OUTPUT_TOKENS", "256")),
+            session_max_tokens=int(os.environ.get("AGENT_SESSION_MAX_TOKENS", "0")) or None,
+            max_wait_s=float(os.environ.get("RATE_LIMIT_MAX_WAIT_S", "5")),
+        )
+
+    def update(self, rate_limits: list[RateLimitDetails]) -> None:
+        for details in rate_limits:
+            self._limits[details.name] = _Limit(details)
+
+    def record_usage(self, usage: Usage | None) -> None:
+        if usage:
+            self.session_tokens += usage.total_tokens
+
+    async def wait_for_capacity(self) -> None:
+        """Wait until the key has capacity for another response, counts the response against it."""
+        started = time.monotonic()
+        while (limit := self._exhausted()) is not None:
+            wait_s = min(limit.reset_at - time.time(), self.max_wait_s - (time.monotonic() - started))
+            if wait_s <= 0:
+                logger.warning(f"Rate limit {limit.name} is nearly exhausted, creating the response anyway")
+                break
+            logger.info(f"Rate limit {limit.name} has {limit.remaining} left, waiting {wait_s:.1f}s for it to reset")
+            await asyncio.sleep(wait_s)
+        self.paced_s += time.monotonic() - started
+        requests = self._limits.get(REQUESTS)
+        if requests and not requests.expired:
+            requests.remaining = max(requests.remaining - 1, 0)
+
+    def output_token_limit(self) -> int | None:
+        """Max output tokens of the next response, None when it does not need to be limited."""
+        limit = None
+        tokens = self._limits.get(TOKENS)
+        if tokens and not tokens.expired and tokens.fraction < self.trim_ratio:
+            limit = int(self.base_output_tokens * tokens.fraction / self.trim_ratio)
+        if self.session_max_tokens is not None:
+            left = self.session_max_tokens - self.session_tokens
+            if left < self.base_output_tokens:
+                limit = left if limit is None else min(limit, left)
+        return None if limit is None else max(limit, self.min_output_tokens)
+
+    def headroom(self) -> float:
+        """Smallest fraction left of the current rate limit windows, 1.0 if unknown."""
+        return min((limit.fraction for limit in self._limits.values() if not limit.expired), default=1.0)
+
+    def status(self) -> dict[str, Any]:
+        limits = [limit for limit in self._limits.values() if not limit.expired]
+        return {
+            "headroom": self.headroom(),
+            "reset_at": max((limit.reset_at for limit in limits), default=time.time()),
+            "session_tokens": self.session_tokens,
+            "limits": {limit.name: {"limit": limit.limit, "remaining": limit.remaining} for limit in limits},
+        }
+
+    def _exhausted(self) -> _Limit | None:
+        for limit in self._limits.values():
+            if not limit.expired and limit.remaining <= max(limit.limit * self.reserve_ratio, 1 if limit.name == REQUESTS else 0):
+                return limit
+        return None
@@ -3,10 +3,13 @@ import base64
 import json
 import logging
 import os
+import random
+from collections import deque
 import aiohttp
 
-from typing import Any, AsyncGenerator
-from .struct import InputAudioBufferAppend, ClientToServerMessage, ServerToClientMessage, parse_server_message, to_json
+from typing import Any, AsyncGenerator, Callable
+from .struct import PCM_SAMPLE_RATE, ErrorMessage, InputAudioBufferAppend, ClientToServerMessage, ServerToClientMessage, SessionUpdate, SessionUpdated, parse_server_message, to_json
+from .connection_manager import get_connection_manager
 from ..logger import setup_logger
 
 # Set up the logger with color and timestamp support
@@ -41,6 +44,12 @@ class RealtimeApiConnection:
         path: str = "/v1/realtime",
         verbose: bool = False,
         model: str = DEFAULT_VIRTUAL_MODEL,
+        reconnect_attempts: int = 0,
+        reconnect_base_delay: float = 0.5,
+        reconnect_max_delay: float = 8.0,
+        uplink_buffer_ms: int = 2000,
+        replay: Callable[[], list[ClientToServerMessage]] | None = None,
+        session: aiohttp.ClientSession | None = None,
     ):
         
         self.url = f"{base_uri}{path}"
@@ -50,7 +59,24 @@ class RealtimeApiConnection:
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         self.websocket: aiohttp.ClientWebSocketResponse | None = None
         self.verbose = verbose
-        self.session = aiohttp.ClientSession()
+        # defaults to the process-wide shared session, resolved on connect
+        self.session = session
+
+        # reconnect state: the last session.update is re-sent after a drop and
+        # `replay` provides the conversation items to re-create on the new session
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.replay = replay
+        self._session_update: SessionUpdate | None = None
+        self._closing = False
+        self._reconnecting = False
+        self._connected = asyncio.Event()
+
+        # uplink audio received while reconnecting, bounded to `uplink_buffer_ms`
+        self._uplink_buffer: deque[bytes] = deque()
+        self._uplink_buffer_size = 0
+        self._uplink_buffer_limit = PCM_SAMPLE_RATE * 2 * uplink_buffer_ms // 1000
 
     async def __aenter__(self) -> "RealtimeApiConnection":
         await self.connect()
@@ -65,42 +91,158 @@ class RealtimeApiConnection:
 
         headers = {"OpenAI-Beta": "realtime=v1"}
 
-        self.websocket = await self.session.ws_connect(
+        session = self.session or get_connection_manager().session
+        self.websocket = await session.ws_connect(
             url=self.url,
             auth=auth,
             headers=headers,
         )
+        if not self._reconnecting:
+            # while reconnecting, senders are released once the session is restored
+            self._connected.set()
 
     async def send_audio_data(self, audio_data: bytes):
         """audio_data is assumed to be pcm16 24kHz mono little-endian"""
+        if self._reconnecting or (self.reconnect_attempts and self.websocket and not self.is_healthy):
+            self._buffer_uplink_audio(audio_data)
+            return
         base64_audio_data = base64.b64encode(audio_data).decode("utf-8")
         message = InputAudioBufferAppend(audio=base64_audio_data)
-        await self.send_request(message)
+        try:
+            await self.send_request(message, wait_for_reconnect=False)
+        except (ConnectionError, aiohttp.ClientError):
+            if not self.reconnect_attempts or self._closing:
+                raise
+            # the socket dropped before listen() noticed, the audio is sent once it reconnected
+            self._buffer_uplink_audio(audio_data)
 
-    async def send_request(self, message: ClientToServerMessage):
-        assert self.websocket is not None
+    async def send_request(self, message: ClientToServerMessage, wait_for_reconnect: bool = True):
+        if isinstance(message, SessionUpdate):
+            self._session_update = message
+        if self._reconnecting:
+            await self._connected.wait()
+        if self.websocket is None:
+            raise ConnectionError("Realtime API connection is closed")
+        websocket = self.websocket
+        try:
+            await self._send(message)
+        except (ConnectionError, aiohttp.ClientError):
+            if not wait_for_reconnect or not self.reconnect_attempts or self._closing:
+                raise
+            logger.warning(f"Failed to send {message.type}, waiting for the connection to be restored")
+            await self._wait_for_reconnect(websocket)
+            if self.websocket is None:
+                raise ConnectionError("Realtime API connection is closed")
+            if not isinstance(message, SessionUpdate):
+                # the session.update is re-sent by the restore
+                await self._send(message)
+
+    async def _wait_for_reconnect(self, websocket: aiohttp.ClientWebSocketResponse, timeout: float = 30.0) -> None:
+        """Wait for listen() to replace the dropped `websocket` and restore the session."""
+        async with asyncio.timeout(timeout):
+            while self.websocket is websocket and not self._reconnecting:
+                await asyncio.sleep(0.05)
+            await self._connected.wait()
+
+    async def _send(self, message: ClientToServerMessage):
         message_str = to_json(message)
         if self.verbose:
             logger.info(f"-> {smart_str(message_str)}")
         await self.websocket.send_str(message_str)
 
-    
+    async def configure(self, session_update: SessionUpdate, timeout: float = 10.0) -> SessionUpdated | ErrorMessage:
+        """Send a session.update and wait for the server to acknowledge (or reject) it."""
+        await self.send_request(session_update)
+        async with asyncio.timeout(timeout):
+            while True:
+                msg = await self.websocket.receive()
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    raise ConnectionError(f"Realtime API connection closed while configuring session: {msg.type}")
+                if self.verbose:
+                    logger.info(f"<- {smart_str(msg.data)}")
+                message = self.handle_server_message(msg.data)
+                if isinstance(message, (SessionUpdated, ErrorMessage)):
+                    return message
+
+    def write_buffer_size(self) -> int:
+        """Bytes queued on the websocket transport but not sent yet, 0 if unknown."""
+        # aiohttp does not expose the transport of a client websocket
+        transport = getattr(getattr(self.websocket, "_writer", None), "transport", None)
+        return transport.get_write_buffer_size() if transport else 0
+
+    @property
+    def is_healthy(self) -> bool:
+        return self.websocket is not None and not self.websocket.closed and self.websocket.exception() is None
+
+    def _buffer_uplink_audio(self, audio_data: bytes):
+        self._uplink_buffer.append(audio_data)
+        self._uplink_buffer_size += len(audio_data)
+        # keep only the most recent audio within the buffer window
+        while self._uplink_buffer_size > self._uplink_buffer_limit and self._uplink_buffer:
+            self._uplink_buffer_size -= len(self._uplink_buffer.popleft())
+
+    async def _reconnect(self) -> bool:
+        """Re-establish the websocket with exponential backoff and restore the session."""
+        self._reconnecting = True
+        self._connected.clear()
+        delay = self.reconnect_base_delay
+        try:
+            for attempt in range(1, self.reconnect_attempts + 1):
+                logger.info(f"Reconnecting to Realtime API (attempt {attempt}/{self.reconnect_attempts}) in {delay:.2f}s")
+                await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+                delay = min(delay * 2, self.reconnect_max_delay)
+                try:
+                    if self.websocket:
+                        await self.websocket.close()
+                    await self.connect()
+                    if self._session_update:
+                        await self._send(self._session_update)
+                    for message in self.replay() if self.replay else []:
+                        await self._send(message)
+                    while self._uplink_buffer:
+                        audio_data = self._uplink_buffer.popleft()
+                        await self._send(InputAudioBufferAppend(audio=base64.b64encode(audio_data).decode("utf-8")))
+                    self._uplink_buffer_size = 0
+                    logger.info("Reconnected to Realtime API")
+                    return True
+                except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                    logger.error(f"Reconnect attempt {attempt} failed: {e}")
+
+            logger.error("Giving up reconnecting to Realtime API")
+            self.websocket = None
+            return False
+        finally:
+            self._uplink_buffer.clear()
+            self._uplink_buffer_size = 0
+            self._reconnecting = False
+            # release senders waiting for the connection, they fail fast if it is gone
+            self._connected.set()
 
     async def listen(self) -> AsyncGenerator[ServerToClientMessage, None]:
         assert self.websocket is not None
         if self.verbose:
             logger.info("Listening for realtimeapi messages")
-        try:
-            async for msg in self.websocket:
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    if self.verbose:
-                        logger.info(f"<- {smart_str(msg.data)}")
-                    yield self.handle_server_message(msg.data)
-                elif msg.type == aiohttp.WSMsgType.ERROR:
-                    logger.error("Error during receive: %s", self.websocket.exception())
-                    break
-        except asyncio.CancelledError:
-            logger.info("Receive messages task cancelled")
+        while True:
+            try:
+                async for msg in self.websocket:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        if self.verbose:
+                            logger.info(f"<- {smart_str(msg.data)}")
+                        yield self.handle_server_message(msg.data)
+                    elif msg.type == aiohttp.WSMsgType.ERROR:
+                        logger.error("Error during receive: %s", self.websocket.exception())
+                        break
+            except asyncio.CancelledError:
+                logger.info("Receive messages task cancelled")
+                return
+            except aiohttp.ClientError as e:
+                logger.error(f"Error during receive: {e}")
+
+            if self._closing or not self.reconnect_attempts:
+                return
+            logger.warning("Realtime API connection dropped")
+            if not await self._reconnect():
+                return
 
     def handle_server_message(self, message: str) -> ServerToClientMessage:
         try:
@@ -110,6 +252,7 @@ class RealtimeApiConnection:
             #raise e
 
     async def close(self):
+        self._closing = True
         # Close the websocket connection if it exists
         if self.websocket:
             await self.websocket.close()
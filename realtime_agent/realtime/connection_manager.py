@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+import ssl
+
+import aiohttp
+
+from ..logger import setup_logger
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+
+class ConnectionManager:
+    """Process-wide aiohttp client session shared by all outgoing connections.
+
+    All connections go through one TCPConnector, so DNS results are cached
+    and one SSLContext is reused for every TLS handshake, which loads the CA
+    store once. Every websocket still does a full handshake, asyncio does not
+    resume TLS sessions on the client side. The session is bound to the event loop it
+    was created on and is recreated if used from a new loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        dns_cache_ttl_s: int = 300,
+        keepalive_timeout_s: float = 15.0,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl_s = dns_cache_ttl_s
+        self.keepalive_timeout_s = keepalive_timeout_s
+        self.ssl_context = ssl.create_default_context()
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @classmethod
+    def from_env(cls) -> "ConnectionManager":
+        return cls(
+            limit=int(os.environ.get("HTTP_CONNECTION_LIMIT", "100")),
+            limit_per_host=int(os.environ.get("HTTP_CONNECTION_LIMIT_PER_HOST", "0")),
+            dns_cache_ttl_s=int(os.environ.get("HTTP_DNS_CACHE_TTL_S", "300")),
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl_s,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout_s,
+                ssl=self.ssl_context,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+
+_connection_manager: ConnectionManager | None = None
+
+
+def get_connection_manager() -> ConnectionManager:
+    global _connection_manager
+    if _connection_manager is None:
+        _connection_manager = ConnectionManager.from_env()
+    return _connection_manager
+
+
+async def close_connection_manager() -> None:
+    """Close the shared session, call before the event loop of the process exits."""
+    if _connection_manager:
+        await _connection_manager.close()
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable
+
+import aiohttp
+
+from .connection import RealtimeApiConnection
+from .struct import ErrorMessage, SessionUpdate
+from ..logger import setup_logger
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+
+class _PooledConnection:
+    def __init__(self, connection: RealtimeApiConnection, expires_at: float | None) -> None:
+        self.connection = connection
+        self.created_at = time.monotonic()
+        # wall clock expiry of the server-side session, if reported
+        self.expires_at = expires_at
+        # reads the idle websocket, so a close by the server is noticed before the connection is handed out
+        self.watcher: asyncio.Task[None] | None = None
+
+
+class RealtimeConnectionPool:
+    """Pool of pre-connected Realtime API websockets with a session already configured.
+
+    Every pooled connection has completed the TLS / websocket handshake and has
+    had `session_update` acknowledged by the server, so a call can start
+    streaming as soon as it takes one. Idle connections are read by a watcher
+    task, so one closed by the server is retired right away, are health
+    checked, retired after `max_idle_s` and refilled in the background.
+    """
+
+    def __init__(
+        self,
+        *,
+        connection_factory: Callable[[], RealtimeApiConnection],
+        session_update: SessionUpdate,
+        size: int = 1,
+        max_idle_s: float = 300.0,
+        health_check_interval_s: float = 15.0,
+        configure_timeout_s: float = 10.0,
+    ) -> None:
+        self.connection_factory = connection_factory
+        self.session_update = session_update
+        self.size = size
+        self.max_idle_s = max_idle_s
+        self.health_check_interval_s = health_check_interval_s
+        self.configure_timeout_s = configure_timeout_s
+        self._idle: list[_PooledConnection] = []
+        self._refill_needed = asyncio.Event()
+        self._tasks: list[asyncio.Task[Any]] = []
+        self._closed = False
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    async def start(self, wait: bool = True) -> None:
+        """Start the background refill and health check tasks, optionally waiting for the first fill."""
+        self._tasks.append(asyncio.create_task(self._refill_loop()))
+        self._tasks.append(asyncio.create_task(self._health_check_loop()))
+        self._refill_needed.set()
+        if wait:
+            await self._fill()
+
+    async def acquire(self) -> RealtimeApiConnection:
+        """Take a ready connection from the pool, or open one if the pool is empty."""
+        while self._idle:
+            pooled = self._idle.pop()
+            self._refill_needed.set()
+            # the caller reads the websocket from now on
+            await self._stop_watching(pooled)
+            if self._is_usable(pooled):
+                logger.info(f"Using pooled Realtime API connection, {len(self._idle)} left idle")
+                return pooled.connection
+            await self._discard(pooled)
+
+        logger.info("Realtime API connection pool empty, connecting on demand")
+        self._refill_needed.set()
+        return (await self._open()).connection
+
+    async def stop_refill(self) -> None:
+        """Stop the background tasks, idle connections remain available to `acquire`."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def close(self) -> None:
+        self._closed = True
+        await self.stop_refill()
+        idle, self._idle = self._idle, []
+        for pooled in idle:
+            await self._discard(pooled)
+
+    async def _open(self) -> _PooledConnection:
+        connection = self.connection_factory()
+        try:
+            await connection.connect()
+            message = await connection.configure(self.session_update, timeout=self.configure_timeout_s)
+        except BaseException:
+            await connection.close()
+            raise
+        if isinstance(message, ErrorMessage):
+            await connection.close()
+            raise ConnectionError(f"Failed to configure pooled session: {message.error}")
+        return _PooledConnection(connection, expires_at=message.session.expires_at)
+
+    def _is_usable(self, pooled: _PooledConnection) -> bool:
+        if not pooled.connection.is_healthy:
+            return False
+        if time.monotonic() - pooled.created_at > self.max_idle_s:
+            return False
+        # leave headroom so the session does not expire shortly into the call
+        if pooled.expires_at and pooled.expires_at - time.time() < self.max_idle_s:
+            return False
+        return True
+
+    async def _watch(self, pooled: _PooledConnection) -> None:
+        websocket = pooled.connection.websocket
+        while True:
+            msg = await websocket.receive()
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            logger.debug(f"Ignoring message on idle pooled connection: {msg.data}")
+
+        if pooled in self._idle:
+            logger.info(f"Pooled Realtime API connection closed while idle: {msg.type}")
+            self._idle.remove(pooled)
+            await self._discard(pooled)
+            self._refill_needed.set()
+
+    async def _stop_watching(self, pooled: _PooledConnection) -> None:
+        watcher, pooled.watcher = pooled.watcher, None
+        if watcher and watcher is not asyncio.current_task():
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+
+    async def _discard(self, pooled: _PooledConnection) -> None:
+        await self._stop_watching(pooled)
+        try:
+            await pooled.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled connection: {e}")
+
+    async def _fill(self) -> None:
+        while not self._closed and len(self._idle) < self.size:
+            pooled = await self._open()
+            pooled.watcher = asyncio.create_task(self._watch(pooled))
+            self._idle.append(pooled)
+
+    async def _refill_loop(self) -> None:
+        delay = 1.0
+        while not self._closed:
+            await self._refill_needed.wait()
+            self._refill_needed.clear()
+            try:
+                await self._fill()
+                delay = 1.0
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError, ConnectionError) as e:
+                logger.error(f"Failed to refill Realtime API connection pool: {e}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                self._refill_needed.set()
+
+    async def _health_check_loop(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval_s)
+            for pooled in list(self._idle):
+                healthy = self._is_usable(pooled)
+                if healthy:
+                    try:
+                        await pooled.connection.websocket.ping()
+                    except (aiohttp.ClientError, ConnectionError, RuntimeError):
+                        healthy = False
+                if not healthy and pooled in self._idle:
+                    logger.info("Retiring stale pooled Realtime API connection")
+                    self._idle.remove(pooled)
+                    await self._discard(pooled)
+                    self._refill_needed.set()
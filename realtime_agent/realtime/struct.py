@@ -572,8 +572,8 @@ class ItemDelete(ClientToServerMessage):
     
 @dataclass
 class ResponseCreateParams:
-    commit: bool = True  # Whether the generated messages should be appended to the conversation
-    cancel_previous: bool = True  # Whether to cancel the previous pending generation
+    commit: Optional[bool] = None  # Whether the generated messages should be appended to the conversation
+    cancel_previous: Optional[bool] = None  # Whether to cancel the previous pending generation
     append_input_items: Optional[List[ItemParam]] = None  # Messages to append before response generation
     input_items: Optional[List[ItemParam]] = None  # Initial messages to use for generation
     modalities: Optional[Set[str]] = None  # Allowed modalities (e.g., "text", "audio")
@@ -619,6 +619,12 @@ class SessionUpdate(ClientToServerMessage):
     type: str = EventType.SESSION_UPDATE
 
 
+@dataclass
+class SerializedSessionUpdate(SessionUpdate):
+    # `session` encoded ahead of time, sent as is instead of re-encoding `session`
+    session_json: str = field(default="null", repr=False, compare=False)
+
+
 # Union of all client-to-server message types
 ClientToServerMessages = Union[
     InputAudioBufferAppend,
@@ -703,7 +709,11 @@ def parse_server_message(unparsed_string: str) -> ServerToClientMessage:
     elif data["type"] == EventType.RESPONSE_CREATED:
         return from_dict(ResponseCreated, data)
     elif data["type"] == EventType.RESPONSE_DONE:
-        return from_dict(ResponseDone, data)
+        message = from_dict(ResponseDone, data)
+        # from_dict keeps Optional fields as dicts, the usage is read as attributes
+        if isinstance(message.response.usage, dict):
+            message.response.usage = from_dict(Usage, message.response.usage)
+        return message
     elif data["type"] == EventType.RESPONSE_TEXT_DELTA:
         return from_dict(ResponseTextDelta, data)
     elif data["type"] == EventType.RESPONSE_TEXT_DONE:
@@ -740,4 +750,11 @@ def parse_server_message(unparsed_string: str) -> ServerToClientMessage:
     raise ValueError(f"Unknown message type: {data['type']}")
     
 def to_json(obj: Union[ClientToServerMessage, ServerToClientMessage]) -> str:
+    if isinstance(obj, SerializedSessionUpdate):
+        return f'{{"event_id": {json.dumps(obj.event_id)}, "type": {json.dumps(obj.type)}, "session": {obj.session_json}}}'
+    if isinstance(obj, ResponseCreate) and obj.response is not None:
+        # unset response parameters default to the session's, they are left out
+        data = asdict(obj)
+        data["response"] = {key: value for key, value in data["response"].items() if value is not None}
+        return json.dumps(data)
     return json.dumps(asdict(obj))
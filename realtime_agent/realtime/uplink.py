@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any
+
+import numpy as np
+
+from ..logger import setup_logger
+from .connection import RealtimeApiConnection
+from .struct import PCM_SAMPLE_RATE
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+SAMPLE_WIDTH = 2  # pcm16
+
+# Shedding policies for audio older than the staleness bound
+DROP = "drop"
+COMPRESS = "compress"
+
+
+class UplinkSender:
+    """Sends the user audio to the model, shedding audio that is too late to be useful.
+
+    The lag of a frame is how far behind real time it is sent, measured
+    against an audio clock: the time since the clock started minus the
+    duration of the audio received since. Frames pile up in the RTC stream
+    while sends are slow, and are then read faster than real time, which
+    shows as a growing lag. A pause of more than `max_gap_ms` between
+    frames while no send was in progress means the stream itself paused
+    (muted or unpublished microphone, network stall): the frames after it
+    are fresh, so the clock restarts instead of counting the pause as lag.
+
+    While the websocket write buffer is above `high_water_bytes` no audio
+    is sent until it has drained below `low_water_bytes`. Frames lagging
+    more than `max_staleness_ms` are shed: all of them with the "drop"
+    policy, only the silent ones with "compress", which shortens pauses
+    to catch up without losing speech; with "compress" frames lagging more
+    than `max_lag_ms` are dropped too.
+    """
+
+    def __init__(
+        self,
+        connection: RealtimeApiConnection,
+        *,
+        high_water_bytes: int = 256 * 1024,
+        low_water_bytes: int = 64 * 1024,
+        max_staleness_ms: int = 500,
+        max_lag_ms: int = 2000,
+        policy: str = COMPRESS,
+        silence_rms: float = 300.0,
+        max_gap_ms: int = 200,
+        sample_rate: int = PCM_SAMPLE_RATE,
+    ) -> None:
+        if policy not in (DROP, COMPRESS):
+            raise ValueError(f"Unsupported uplink shedding policy: {policy}")
+        self.connection = connection
+        self.high_water_bytes = high_water_bytes
+        self.low_water_bytes = low_water_bytes
+        self.max_staleness_s = max_staleness_ms / 1000 if max_staleness_ms > 0 else None
+        self.max_lag_s = max_lag_ms / 1000
+        self.policy = policy
+        self.silence_rms = silence_rms
+        self.max_gap_s = max_gap_ms / 1000
+        self.bytes_per_s = sample_rate * SAMPLE_WIDTH
+        self._clock_start: float | None = None
+        self._received_s = 0.0
+        # when the previous send returned, the reader was waiting for the stream since
+        self._idle_since: float | None = None
+        self.gaps = 0
+        # counters of this session
+        self.sent_frames = 0
+        self.sent_ms = 0.0
+        self.shed_frames = 0
+        self.shed_ms = 0.0
+        self.congestions = 0
+        self.congested_s = 0.0
+        self.max_lag_seen_s = 0.0
+        self._send_total_s = 0.0
+        self.max_send_s = 0.0
+
+    @classmethod
+    def from_env(cls, connection: RealtimeApiConnection) -> "UplinkSender":
+        return cls(
+            connection,
+            high_water_bytes=int(os.environ.get("REALTIME_UPLINK_HIGH_WATER_BYTES", str(256 * 1024))),
+            low_water_bytes=int(os.environ.get("REALTIME_UPLINK_LOW_WATER_BYTES", str(64 * 1024))),
+            max_staleness_ms=int(os.environ.get("REALTIME_UPLINK_MAX_STALENESS_MS", "500")),
+            max_lag_ms=int(os.environ.get("REALTIME_UPLINK_MAX_LAG_MS", "2000")),
+            policy=os.environ.get("REALTIME_UPLINK_SHED_POLICY", COMPRESS),
+            max_gap_ms=int(os.environ.get("REALTIME_UPLINK_MAX_GAP_MS", "200")),
+        )
+
+    def reset_clock(self) -> None:
+        """Restart the audio clock, e.g. when a new stream starts."""
+        self._clock_start = None
+
+    async def send(self, data: bytes) -> bool:
+        """Send a frame of audio unless it is shed, returns whether it was sent."""
+        try:
+            return await self._send(data)
+        finally:
+            self._idle_since = time.monotonic()
+
+    async def _send(self, data: bytes) -> bool:
+        duration_s = len(data) / self.bytes_per_s
+        if self._idle_since is not None and time.monotonic() - self._idle_since > self.max_gap_s:
+            # the stream paused, not the sends: the audio after the pause is not late
+            self.gaps += 1
+            self.reset_clock()
+        lag_s = self._lag(duration_s)
+
+        if self.connection.write_buffer_size() > self.high_water_bytes:
+            await self._wait_for_drain()
+            lag_s = self._lag(0.0)
+
+        if self._should_shed(data, lag_s):
+            self.shed_frames += 1
+            self.shed_ms += duration_s * 1000
+            return False
+
+        started = time.monotonic()
+        await self.connection.send_audio_data(data)
+        send_s = time.monotonic() - started
+        self.sent_frames += 1
+        self.sent_ms += duration_s * 1000
+        self._send_total_s += send_s
+        self.max_send_s = max(self.max_send_s, send_s)
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sent_frames": self.sent_frames,
+            "sent_ms": round(self.sent_ms),
+            "shed_frames": self.shed_frames,
+            "shed_ms": round(self.shed_ms),
+            "congestions": self.congestions,
+            "gaps": self.gaps,
+            "congested_ms": round(self.congested_s * 1000),
+            "max_lag_ms": round(self.max_lag_seen_s * 1000, 1),
+            "mean_send_ms": round(self._send_total_s / self.sent_frames * 1000, 3) if self.sent_frames else 0.0,
+            "max_send_ms": round(self.max_send_s * 1000, 3),
+        }
+
+    def _lag(self, duration_s: float) -> float:
+        now = time.monotonic()
+        if self._clock_start is None:
+            self._clock_start, self._received_s = now, 0.0
+        self._received_s += duration_s
+        lag_s = now - (self._clock_start + self._received_s)
+        if lag_s < 0:
+            # the stream paused, e.g. no audio while stopping; restart the clock from here
+            self._clock_start, lag_s = now - self._received_s, 0.0
+        self.max_lag_seen_s = max(self.max_lag_seen_s, lag_s)
+        return lag_s
+
+    async def _wait_for_drain(self) -> None:
+        self.congestions += 1
+        started = time.monotonic()
+        logger.warning(f"Uplink congested, {self.connection.write_buffer_size()} bytes buffered")
+        while self.connection.write_buffer_size() > self.low_water_bytes and self.connection.is_healthy:
+            await asyncio.sleep(0.01)
+        self.congested_s += time.monotonic() - started
+
+    def _should_shed(self, data: bytes, lag_s: float) -> bool:
+        if self.max_staleness_s is None or lag_s <= self.max_staleness_s:
+            return False
+        if self.policy == DROP or lag_s > self.max_lag_s:
+            return True
+        samples = np.frombuffer(data, dtype=np.int16, count=len(data) // SAMPLE_WIDTH)
+        return not samples.size or float(np.sqrt(np.mean(np.square(samples, dtype=np.float32)))) < self.silence_rms
@@ -0,0 +1,270 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .logger import setup_logger
+from .realtime.struct import PCM_SAMPLE_RATE
+from .utils import generate_file_name
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+SAMPLE_WIDTH = 2  # pcm16
+
+# Compression of finished segments is CPU bound and shared by all recorders
+_compress_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recording-compress")
+
+
+def compress_file(file_name: str) -> None:
+    """Gzip a finished recording segment and remove the original."""
+    with open(file_name, "rb") as src, gzip.open(f"{file_name}.gz", "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(file_name)
+
+
+class _SegmentWriter:
+    """Writes WAV segments, rotating by size / duration. Only used from the recorder's writer thread."""
+
+    def __init__(
+        self,
+        prefix: str,
+        channels: int,
+        sample_rate: int,
+        rotate_bytes: int | None,
+        rotate_s: float | None,
+        compress: bool,
+    ) -> None:
+        self.prefix = prefix
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.rotate_bytes = rotate_bytes
+        self.rotate_s = rotate_s
+        self.compress = compress
+        self.segment = 0
+        self.file_name: str | None = None
+        self._wav: wave.Wave_write | None = None
+        self._bytes_written = 0
+        self._opened_at = 0.0
+
+    def _open(self) -> None:
+        self.segment += 1
+        self.file_name = generate_file_name(f"{self.prefix}_{self.segment:03d}", extension="wav")
+        self._wav = wave.open(self.file_name, "wb")
+        self._wav.setnchannels(self.channels)
+        self._wav.setsampwidth(SAMPLE_WIDTH)
+        self._wav.setframerate(self.sample_rate)
+        self._bytes_written = 0
+        self._opened_at = time.monotonic()
+
+    def write(self, data: bytearray) -> None:
+        if self._wav is None:
+            self._open()
+        # `writeframes` patches the header sizes after every write, so a segment
+        # stays playable even if the process dies without closing it
+        self._wav.writeframes(data)
+        self._bytes_written += len(data)
+
+        if (self.rotate_bytes and self._bytes_written >= self.rotate_bytes) or (
+            self.rotate_s and time.monotonic() - self._opened_at >= self.rotate_s
+        ):
+            self.close()
+
+    def close(self) -> None:
+        if self._wav is None:
+            return
+        self._wav.close()
+        self._wav = None
+        if self.compress and self.file_name:
+            _compress_executor.submit(compress_file, self.file_name)
+
+
+class Recorder:
+    """Asynchronous WAV recorder for a single audio stream.
+
+    Audio is accumulated in one of two buffers; when it is full the buffers
+    are swapped and the full one is written by a dedicated writer thread that
+    owns the file handle, so the event loop neither copies the audio nor
+    waits for disk I/O unless the writer falls a whole buffer behind.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        *,
+        channels: int = 1,
+        sample_rate: int = PCM_SAMPLE_RATE,
+        buffer_size: int = 1024 * 64,
+        rotate_bytes: int | None = None,
+        rotate_s: float | None = None,
+        compress: bool = False,
+    ) -> None:
+        self.buffer_size = buffer_size
+        self._active = bytearray()
+        self._spare = bytearray()
+        self._pending: asyncio.Future[None] | None = None
+        self._closed = False
+        self._writer = _SegmentWriter(prefix, channels, sample_rate, rotate_bytes, rotate_s, compress)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"recording-{prefix}")
+
+    async def write(self, data: bytes) -> None:
+        """Accumulate data into the active buffer and hand it to the writer when full."""
+        if self._closed:
+            return
+
+        self._active.extend(data)
+        if len(self._active) >= self.buffer_size:
+            await self._swap()
+
+    async def flush(self) -> None:
+        if self._active:
+            await self._swap()
+        if self._pending:
+            await self._pending
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        await self.flush()
+        self._closed = True
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._writer.close)
+        self._executor.shutdown(wait=False)
+
+    async def _swap(self) -> None:
+        # the spare buffer is only reusable once the previous write completed
+        if self._pending:
+            await self._pending
+        self._active, self._spare = self._spare, self._active
+        self._pending = asyncio.get_running_loop().run_in_executor(self._executor, self._write_spare)
+
+    def _write_spare(self) -> None:
+        try:
+            self._writer.write(self._spare)
+        except OSError as e:
+            logger.error(f"Failed to write recording {self._writer.file_name}: {e}")
+        finally:
+            self._spare.clear()
+
+
+class CallRecorder:
+    """Records both directions of a call, time-aligned in one stereo file or as two mono files.
+
+    The left channel is the uplink (remote user to model) and the right
+    channel the downlink (model to remote user). Each direction keeps a sample
+    cursor on a shared clock; when a direction falls behind the clock by more
+    than `jitter_ms` (e.g. the model is not speaking) it is padded with
+    silence so both channels stay aligned. Uplink audio is placed when it was
+    captured, ending at the time it is written. Downlink audio arrives faster
+    than real time and is queued by the RTC SDK, so it is placed when it is
+    played: right after the downlink audio written before it, or now if that
+    has been played already. `clear_downlink` drops the audio that was not
+    played when the SDK's buffer is cleared.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        *,
+        stereo: bool = True,
+        sample_rate: int = PCM_SAMPLE_RATE,
+        jitter_ms: int = 200,
+        **recorder_options,
+    ) -> None:
+        self.stereo = stereo
+        self.sample_rate = sample_rate
+        self.jitter_samples = sample_rate * jitter_ms // 1000
+        self._started_at = time.monotonic()
+        if stereo:
+            self._stereo = Recorder(prefix, channels=2, sample_rate=sample_rate, **recorder_options)
+            self._pending = [bytearray(), bytearray()]
+            self._cursors = [0, 0]
+        else:
+            self._mono = [
+                Recorder(f"{prefix}_rtc_to_model", sample_rate=sample_rate, **recorder_options),
+                Recorder(f"{prefix}_model_to_rtc", sample_rate=sample_rate, **recorder_options),
+            ]
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "CallRecorder":
+        rotate_mb = float(os.environ.get("RECORDING_ROTATE_MB", "0"))
+        rotate_s = float(os.environ.get("RECORDING_ROTATE_S", "0"))
+        directory = os.environ.get("RECORDING_DIR", "")
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            prefix = os.path.join(directory, prefix)
+        return cls(
+            prefix,
+            stereo=os.environ.get("RECORDING_STEREO", "true") == "true",
+            rotate_bytes=int(rotate_mb * 1024 * 1024) or None,
+            rotate_s=rotate_s or None,
+            compress=os.environ.get("RECORDING_COMPRESS", "false") == "true",
+        )
+
+    async def write_uplink(self, data: bytes) -> None:
+        await self._write(0, data)
+
+    async def write_downlink(self, data: bytes) -> None:
+        await self._write(1, data)
+
+    def clear_downlink(self) -> None:
+        """Drop the downlink audio that is queued for playout but not played yet."""
+        if not self.stereo:
+            return
+        unplayed = min(self._cursors[1] - self._now(), len(self._pending[1]) // SAMPLE_WIDTH)
+        if unplayed > 0:
+            del self._pending[1][-unplayed * SAMPLE_WIDTH:]
+            self._cursors[1] -= unplayed
+
+    async def close(self) -> None:
+        if self.stereo:
+            # pad the shorter direction so the tail of the call is kept
+            longest = max(len(pending) for pending in self._pending)
+            for pending in self._pending:
+                pending.extend(bytes(longest - len(pending)))
+            await self._drain()
+            await self._stereo.close()
+        else:
+            for recorder in self._mono:
+                await recorder.close()
+
+    async def _write(self, direction: int, data: bytes) -> None:
+        if not self.stereo:
+            await self._mono[direction].write(data)
+            return
+
+        now = self._now()
+        samples = len(data) // SAMPLE_WIDTH
+        # an uplink chunk ends at `now`, a downlink chunk starts playing at `now` at the earliest
+        starts = [now - samples, now - self.jitter_samples] if direction == 0 else [now - self.jitter_samples, now]
+        for index, start in enumerate(starts):
+            behind = start - self._cursors[index]
+            if behind > 0:
+                self._pending[index].extend(bytes(behind * SAMPLE_WIDTH))
+                self._cursors[index] += behind
+
+        self._pending[direction].extend(data)
+        self._cursors[direction] += samples
+        await self._drain()
+
+    def _now(self) -> int:
+        return int((time.monotonic() - self._started_at) * self.sample_rate)
+
+    async def _drain(self) -> None:
+        frames = min(len(pending) for pending in self._pending) // SAMPLE_WIDTH
+        if not frames:
+            return
+        left = np.frombuffer(self._pending[0], dtype=np.int16, count=frames)
+        right = np.frombuffer(self._pending[1], dtype=np.int16, count=frames)
+        interleaved = np.empty(frames * 2, dtype=np.int16)
+        interleaved[0::2] = left
+        interleaved[1::2] = right
+        del left, right  # release the buffer exports before resizing
+        for pending in self._pending:
+            del pending[:frames * SAMPLE_WIDTH]
+        await self._stereo.write(interleaved.data)
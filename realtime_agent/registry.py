@@ -0,0 +1,232 @@
+import abc
+import fnmatch
+import json
+import logging
+import time
+from typing import Any, AsyncIterator
+
+from attr import dataclass
+
+from .logger import setup_logger
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+# Compare-and-renew and compare-and-delete of a lease, run atomically by Redis.
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass(frozen=True, kw_only=True)
+class NodeInfo:
+    """Capacity advertised by a server node through the registry."""
+
+    node_id: str
+    url: str
+    active_sessions: int
+    max_sessions: int | None = None
+    draining: bool = False
+
+    @property
+    def has_capacity(self) -> bool:
+        if self.draining:
+            return False
+        return self.max_sessions is None or self.active_sessions < self.max_sessions
+
+    @property
+    def load(self) -> float:
+        if not self.max_sessions:
+            return float(self.active_sessions)
+        return self.active_sessions / self.max_sessions
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "node_id": self.node_id,
+                "url": self.url,
+                "active_sessions": self.active_sessions,
+                "max_sessions": self.max_sessions,
+                "draining": self.draining,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> "NodeInfo":
+        return cls(**json.loads(data))
+
+
+class SessionRegistry(abc.ABC):
+    """Cluster-wide map of channel name to the node running its agent, with expiring leases."""
+
+    @abc.abstractmethod
+    async def create(self, channel_name: str, node_id: str, ttl_s: float) -> str | None:
+        """Take the lease of a channel nobody holds; None on success, otherwise the owner, which may be `node_id`."""
+
+    @abc.abstractmethod
+    async def acquire(self, channel_name: str, node_id: str, ttl_s: float) -> str:
+        """Claim the channel for `node_id`; returns the owner, which is `node_id` on success."""
+
+    @abc.abstractmethod
+    async def renew(self, channel_name: str, node_id: str, ttl_s: float) -> bool:
+        """Extend a lease held by `node_id`; False if the lease was lost."""
+
+    @abc.abstractmethod
+    async def release(self, channel_name: str, node_id: str) -> None:
+        """Drop the lease if it is still held by `node_id`."""
+
+    @abc.abstractmethod
+    async def owner(self, channel_name: str) -> str | None:
+        pass
+
+    @abc.abstractmethod
+    async def publish_node(self, info: NodeInfo, ttl_s: float) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def nodes(self) -> list[NodeInfo]:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemoryRedis:
+    """Process-local stand-in implementing the subset of the redis.asyncio client used here."""
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[str, float | None]] = {}
+
+    def _live(self, key: str) -> str | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: str, nx: bool = False, px: int | None = None) -> bool | None:
+        if nx and self._live(key) is not None:
+            return None
+        self._data[key] = (value, time.monotonic() + px / 1000 if px else None)
+        return True
+
+    async def get(self, key: str) -> str | None:
+        return self._live(key)
+
+    async def mget(self, keys: list[str]) -> list[str | None]:
+        return [self._live(key) for key in keys]
+
+    async def delete(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    async def pexpire(self, key: str, px: int) -> bool:
+        value = self._live(key)
+        if value is None:
+            return False
+        self._data[key] = (value, time.monotonic() + px / 1000)
+        return True
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args: Any) -> int:
+        # Only the lease scripts of this module are understood.
+        key, node_id, *args = keys_and_args
+        if self._live(key) != node_id:
+            return 0
+        if script == _RENEW_SCRIPT:
+            return int(await self.pexpire(key, int(args[0])))
+        if script == _RELEASE_SCRIPT:
+            return await self.delete(key)
+        raise NotImplementedError("InMemoryRedis only runs the session registry scripts")
+
+    async def scan_iter(self, match: str) -> AsyncIterator[str]:
+        for key in list(self._data):
+            if fnmatch.fnmatchcase(key, match) and self._live(key) is not None:
+                yield key
+
+    async def aclose(self) -> None:
+        self._data.clear()
+
+
+class RedisSessionRegistry(SessionRegistry):
+    """Registry on top of a redis.asyncio client (created with decode_responses=True).
+
+    Leases are keys with a TTL set with SET NX PX. Renew and release compare
+    the owner and update the key in one Lua script, so a lease that expired
+    and was taken by another node is never extended or deleted.
+    """
+
+    def __init__(self, client: Any, prefix: str = "realtime_agent") -> None:
+        self.client = client
+        self.prefix = prefix
+
+    def _session_key(self, channel_name: str) -> str:
+        return f"{self.prefix}:session:{channel_name}"
+
+    def _node_key(self, node_id: str) -> str:
+        return f"{self.prefix}:node:{node_id}"
+
+    async def create(self, channel_name: str, node_id: str, ttl_s: float) -> str | None:
+        key = self._session_key(channel_name)
+        while not await self.client.set(key, node_id, nx=True, px=int(ttl_s * 1000)):
+            owner = await self.client.get(key)
+            if owner is not None:
+                return owner
+            # expired between the two calls
+        return None
+
+    async def acquire(self, channel_name: str, node_id: str, ttl_s: float) -> str:
+        owner = await self.create(channel_name, node_id, ttl_s)
+        if owner is None:
+            return node_id
+        if owner == node_id:
+            await self.renew(channel_name, node_id, ttl_s)
+        return owner
+
+    async def renew(self, channel_name: str, node_id: str, ttl_s: float) -> bool:
+        key = self._session_key(channel_name)
+        return bool(await self.client.eval(_RENEW_SCRIPT, 1, key, node_id, int(ttl_s * 1000)))
+
+    async def release(self, channel_name: str, node_id: str) -> None:
+        await self.client.eval(_RELEASE_SCRIPT, 1, self._session_key(channel_name), node_id)
+
+    async def owner(self, channel_name: str) -> str | None:
+        return await self.client.get(self._session_key(channel_name))
+
+    async def publish_node(self, info: NodeInfo, ttl_s: float) -> None:
+        await self.client.set(self._node_key(info.node_id), info.to_json(), px=int(ttl_s * 1000))
+
+    async def nodes(self) -> list[NodeInfo]:
+        keys = [key async for key in self.client.scan_iter(match=self._node_key("*"))]
+        if not keys:
+            return []
+        return [NodeInfo.from_json(value) for value in await self.client.mget(keys) if value]
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_session_registry(url: str | None) -> SessionRegistry:
+    """Registry for `url` (redis:// or rediss://), or a process-local one if no url is given."""
+    if not url:
+        return RedisSessionRegistry(InMemoryRedis())
+
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis.asyncio
+        except ImportError as e:
+            raise ValueError("SESSION_REGISTRY_URL requires the `redis` package to be installed.") from e
+        logger.info("Using Redis session registry")
+        return RedisSessionRegistry(redis.asyncio.from_url(url, decode_responses=True))
+
+    raise ValueError(f"Unsupported SESSION_REGISTRY_URL: {url}")
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Any
+
+from agora_realtime_ai_api.rtc import AudioStream, Channel
+
+from .logger import setup_logger
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+# Agora remote audio subscribe state
+AUDIO_SUBSCRIBED = 3
+
+# Agora user offline reasons
+USER_OFFLINE_QUIT = 0
+USER_OFFLINE_DROPPED = 1
+
+
+class RemoteAudio:
+    """Event-driven readiness of the remote users of a channel and of their audio streams.
+
+    Must be created before joining the channel so no event is missed. Waiters
+    are woken up by the channel's user_joined / audio_subscribe_state_changed
+    events instead of polling; a user that leaves and rejoins gets a new
+    audio stream, which `audio_stream` waits for.
+    """
+
+    def __init__(self, channel: Channel) -> None:
+        self.channel = channel
+        self._user_joined = asyncio.Event()
+        self._streams: dict[Any, asyncio.Future[AudioStream]] = {}
+        # registered after the channel's own handlers, so the channel already
+        # updated its remote users / audio streams when these run
+        channel.on("user_joined", self._on_user_joined)
+        channel.on("user_left", self._on_user_left)
+        channel.on("audio_subscribe_state_changed", self._on_audio_subscribe_state_changed)
+
+    async def wait_for_user(self, uid: Any = None, timeout: float | None = None) -> Any:
+        """Wait until `uid`, or any remote user if it is None, is in the channel; returns its uid."""
+        async with asyncio.timeout(timeout):
+            while True:
+                if uid is None and self.channel.remote_users:
+                    return next(iter(self.channel.remote_users))
+                if uid is not None and uid in self.channel.remote_users:
+                    return uid
+                self._user_joined.clear()
+                await self._user_joined.wait()
+
+    async def subscribe(self, uid: Any, timeout: float | None = None) -> AudioStream:
+        """Subscribe to the audio of `uid`, returns its stream once frames can be read from it."""
+        stream = self._stream_future(uid)
+        if not stream.done():
+            self.channel.local_user.subscribe_audio(uid)
+        async with asyncio.timeout(timeout):
+            return await asyncio.shield(stream)
+
+    async def audio_stream(self, uid: Any) -> AudioStream:
+        """The current audio stream of `uid`, waits for the user to be (re)subscribed."""
+        return await asyncio.shield(self._stream_future(uid))
+
+    def close(self) -> None:
+        self.channel.off("user_joined", self._on_user_joined)
+        self.channel.off("user_left", self._on_user_left)
+        self.channel.off("audio_subscribe_state_changed", self._on_audio_subscribe_state_changed)
+
+    def _stream_future(self, uid: Any) -> asyncio.Future[AudioStream]:
+        if uid not in self._streams:
+            self._streams[uid] = asyncio.get_running_loop().create_future()
+        return self._streams[uid]
+
+    def _on_user_joined(self, agora_rtc_conn, user_id) -> None:
+        self._user_joined.set()
+
+    def _on_user_left(self, agora_rtc_conn, user_id, reason) -> None:
+        # the channel ended the user's stream, waiters keep waiting for a rejoin
+        stream = self._streams.get(user_id)
+        if stream is not None and stream.done():
+            del self._streams[user_id]
+
+    def _on_audio_subscribe_state_changed(
+        self, agora_local_user, channel, user_id, old_state, new_state, elapse_since_last_state
+    ) -> None:
+        if new_state != AUDIO_SUBSCRIBED:
+            return
+        audio_frames = self.channel.get_audio_frames(user_id)
+        if audio_frames is None:
+            return
+        stream = self._streams.get(user_id)
+        if stream is None or stream.done():
+            stream = self._streams[user_id] = asyncio.get_running_loop().create_future()
+        stream.set_result(audio_frames)
+        logger.info(f"Audio of user {user_id} is available")
@@ -0,0 +1,185 @@
+import re
+from typing import Any, Callable
+
+# Compiles the subset of JSON schema used for function tool parameters into
+# plain Python closures, so validating arguments does not walk the schema.
+
+Validator = Callable[[Any, str], None]
+
+
+class SchemaValidationError(ValueError):
+    def __init__(self, path: str, message: str) -> None:
+        super().__init__(f"{path or '$'}: {message}")
+        self.path = path
+
+
+_TYPE_CHECKS: dict[str, Callable[[Any], bool]] = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    # bool is a subclass of int but not a JSON number
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+
+def compile_schema(schema: dict[str, Any]) -> Validator:
+    """Compile `schema` into a function raising SchemaValidationError for invalid values."""
+    checks: list[Validator] = []
+
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        unknown = [t for t in types if t not in _TYPE_CHECKS]
+        if unknown:
+            raise ValueError(f"Unsupported schema type: {unknown}")
+        type_checks = [_TYPE_CHECKS[t] for t in types]
+        expected = " or ".join(types)
+
+        def check_type(value: Any, path: str) -> None:
+            if not any(check(value) for check in type_checks):
+                raise SchemaValidationError(path, f"expected {expected}, got {type(value).__name__}")
+
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value: Any, path: str) -> None:
+            if value not in allowed:
+                raise SchemaValidationError(path, f"must be one of {allowed}")
+
+        checks.append(check_enum)
+
+    if "const" in schema:
+        const = schema["const"]
+
+        def check_const(value: Any, path: str) -> None:
+            if value != const:
+                raise SchemaValidationError(path, f"must be {const!r}")
+
+        checks.append(check_const)
+
+    checks += _compile_object(schema) + _compile_array(schema) + _compile_string(schema) + _compile_number(schema)
+
+    if "anyOf" in schema:
+        any_of = [compile_schema(option) for option in schema["anyOf"]]
+
+        def check_any_of(value: Any, path: str) -> None:
+            if not any(_matches(option, value, path) for option in any_of):
+                raise SchemaValidationError(path, "does not match any of the allowed schemas")
+
+        checks.append(check_any_of)
+
+    if "oneOf" in schema:
+        one_of = [compile_schema(option) for option in schema["oneOf"]]
+
+        def check_one_of(value: Any, path: str) -> None:
+            matched = sum(_matches(option, value, path) for option in one_of)
+            if matched != 1:
+                raise SchemaValidationError(path, f"must match exactly one of the allowed schemas, matches {matched}")
+
+        checks.append(check_one_of)
+
+    def validate(value: Any, path: str = "") -> None:
+        for check in checks:
+            check(value, path)
+
+    return validate
+
+
+def _matches(validator: Validator, value: Any, path: str) -> bool:
+    try:
+        validator(value, path)
+        return True
+    except SchemaValidationError:
+        return False
+
+
+def _compile_object(schema: dict[str, Any]) -> list[Validator]:
+    properties = {name: compile_schema(prop) for name, prop in schema.get("properties", {}).items()}
+    required = list(schema.get("required", []))
+    additional = schema.get("additionalProperties", True)
+    additional_validator = compile_schema(additional) if isinstance(additional, dict) else None
+    if not properties and not required and additional is True:
+        return []
+
+    def check_object(value: Any, path: str) -> None:
+        if not isinstance(value, dict):
+            return
+        for name in required:
+            if name not in value:
+                raise SchemaValidationError(path, f"missing required property {name!r}")
+        for name, item in value.items():
+            validator = properties.get(name)
+            if validator is not None:
+                validator(item, f"{path}.{name}")
+            elif additional is False:
+                raise SchemaValidationError(path, f"unexpected property {name!r}")
+            elif additional_validator is not None:
+                additional_validator(item, f"{path}.{name}")
+
+    return [check_object]
+
+
+def _compile_array(schema: dict[str, Any]) -> list[Validator]:
+    items = compile_schema(schema["items"]) if isinstance(schema.get("items"), dict) else None
+    min_items = schema.get("minItems")
+    max_items = schema.get("maxItems")
+    if items is None and min_items is None and max_items is None:
+        return []
+
+    def check_array(value: Any, path: str) -> None:
+        if not isinstance(value, list):
+            return
+        if min_items is not None and len(value) < min_items:
+            raise SchemaValidationError(path, f"expected at least {min_items} items")
+        if max_items is not None and len(value) > max_items:
+            raise SchemaValidationError(path, f"expected at most {max_items} items")
+        if items is not None:
+            for index, item in enumerate(value):
+                items(item, f"{path}[{index}]")
+
+    return [check_array]
+
+
+def _compile_string(schema: dict[str, Any]) -> list[Validator]:
+    min_length = schema.get("minLength")
+    max_length = schema.get("maxLength")
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+    if min_length is None and max_length is None and pattern is None:
+        return []
+
+    def check_string(value: Any, path: str) -> None:
+        if not isinstance(value, str):
+            return
+        if min_length is not None and len(value) < min_length:
+            raise SchemaValidationError(path, f"shorter than {min_length} characters")
+        if max_length is not None and len(value) > max_length:
+            raise SchemaValidationError(path, f"longer than {max_length} characters")
+        if pattern is not None and not pattern.search(value):
+            raise SchemaValidationError(path, f"does not match {pattern.pattern!r}")
+
+    return [check_string]
+
+
+def _compile_number(schema: dict[str, Any]) -> list[Validator]:
+    bounds = [
+        (schema.get("minimum"), lambda value, bound: value >= bound, "at least"),
+        (schema.get("maximum"), lambda value, bound: value <= bound, "at most"),
+        (schema.get("exclusiveMinimum"), lambda value, bound: value > bound, "greater than"),
+        (schema.get("exclusiveMaximum"), lambda value, bound: value < bound, "less than"),
+    ]
+    bounds = [(bound, check, text) for bound, check, text in bounds if bound is not None]
+    if not bounds:
+        return []
+
+    def check_number(value: Any, path: str) -> None:
+        if not _TYPE_CHECKS["number"](value):
+            return
+        for bound, check, text in bounds:
+            if not check(value, bound):
+                raise SchemaValidationError(path, f"must be {text} {bound}")
+
+    return [check_number]
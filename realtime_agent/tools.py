@@ -1,12 +1,17 @@
 import abc
+import importlib
 import json
 import logging
-from typing import Any, Callable, assert_never
+import os
+import sys
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, assert_never
 
 from attr import dataclass
 from pydantic import BaseModel
 
 from .logger import setup_logger
+from .schema import SchemaValidationError, Validator, compile_schema
 
 # Set up the logger with color and timestamp support
 logger = setup_logger(name=__name__, log_level=logging.INFO)
@@ -20,6 +25,7 @@ class LocalFunctionToolDeclaration:
     description: str
     parameters: dict[str, Any]
     function: Callable[..., Any]
+    validate: Validator
 
     def model_description(self) -> dict[str, Any]:
         return {
@@ -37,6 +43,7 @@ class PassThroughFunctionToolDeclaration:
     name: str
     description: str
     parameters: dict[str, Any]
+    validate: Validator
 
     def model_description(self) -> dict[str, Any]:
         return {
@@ -64,11 +71,40 @@ ExecuteToolCallResult = LocalToolCallExecuted | ShouldPassThroughToolCall
 
 
 class ToolContext(abc.ABC):
+    """Registry of the tools available to the model.
+
+    The `parameters` schema of a tool is compiled into a validator when the
+    tool is registered, and calls with invalid arguments are rejected
+    without running the tool. Tools can also come from modules defining
+    `register(tools: ToolContext)`, which can be reloaded at runtime;
+    listeners added with `add_listener` are called whenever the set of tools
+    changes, e.g. to update the live session.
+    """
+
     _tool_declarations: dict[str, ToolDeclaration]
 
     def __init__(self) -> None:
         # TODO should be an ordered dict
         self._tool_declarations = {}
+        self._model_description: list[dict[str, Any]] | None = None
+        self._model_description_json: str | None = None
+        self._listeners: list[Callable[[], None]] = []
+        self._module_tools: dict[str, set[str]] = {}
+        self._loading_module: str | None = None
+        self._batching = 0
+        self._changed = False
+
+    @classmethod
+    def from_env(cls) -> "ToolContext | None":
+        """Tools from the modules listed in AGENT_TOOL_MODULES (comma separated), None if there are none."""
+        modules = [name.strip() for name in os.environ.get("AGENT_TOOL_MODULES", "").split(",") if name.strip()]
+        if not modules:
+            return None
+        tools = cls()
+        with tools.changes():
+            for module_name in modules:
+                tools.load_module(module_name)
+        return tools
 
     def register_function(
         self,
@@ -79,8 +115,10 @@ class ToolContext(abc.ABC):
         fn: Callable[..., Any],
     ) -> None:
         self._tool_declarations[name] = LocalFunctionToolDeclaration(
-            name=name, description=description, parameters=parameters, function=fn
+            name=name, description=description, parameters=parameters, function=fn,
+            validate=compile_schema(parameters),
         )
+        self._tools_changed(name)
 
     def register_client_function(
         self,
@@ -90,8 +128,74 @@ class ToolContext(abc.ABC):
         parameters: dict[str, Any],
     ) -> None:
         self._tool_declarations[name] = PassThroughFunctionToolDeclaration(
-            name=name, description=description, parameters=parameters
+            name=name, description=description, parameters=parameters,
+            validate=compile_schema(parameters),
         )
+        self._tools_changed(name)
+
+    def unregister(self, name: str) -> None:
+        if self._tool_declarations.pop(name, None) is not None:
+            self._tools_changed()
+
+    def load_module(self, module_name: str) -> None:
+        """Import (or re-import) a tool module and replace the tools it registered before."""
+        with self.changes():
+            for name in self._module_tools.pop(module_name, set()):
+                self._tool_declarations.pop(name, None)
+            self._tools_changed()
+            module = sys.modules.get(module_name)
+            module = importlib.reload(module) if module else importlib.import_module(module_name)
+            self._module_tools[module_name] = set()
+            self._loading_module = module_name
+            try:
+                module.register(self)
+            finally:
+                self._loading_module = None
+        logger.info(f"Loaded tools {sorted(self._module_tools[module_name])} from {module_name}")
+
+    def reload_modules(self) -> None:
+        """Reload all tool modules, a module that fails to load keeps its previous tools."""
+        with self.changes():
+            for module_name in list(self._module_tools):
+                previous = {name: self._tool_declarations[name] for name in self._module_tools[module_name]}
+                try:
+                    self.load_module(module_name)
+                except Exception as e:
+                    logger.error(f"Failed to reload tool module {module_name}: {e}")
+                    for name in self._module_tools.get(module_name, set()):
+                        self._tool_declarations.pop(name, None)
+                    self._tool_declarations.update(previous)
+                    self._module_tools[module_name] = set(previous)
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    @contextmanager
+    def changes(self) -> Iterator[None]:
+        """Group changes so listeners are notified once, after the last one."""
+        self._batching += 1
+        try:
+            yield
+        finally:
+            self._batching -= 1
+            if not self._batching and self._changed:
+                self._changed = False
+                for listener in list(self._listeners):
+                    listener()
+
+    def _tools_changed(self, name: str | None = None) -> None:
+        if name and self._loading_module:
+            self._module_tools[self._loading_module].add(name)
+        self._model_description = None
+        self._model_description_json = None
+        self._changed = True
+        if not self._batching:
+            with self.changes():
+                pass
 
     async def execute_tool(
         self, tool_name: str, encoded_function_args: str
@@ -100,8 +204,17 @@ class ToolContext(abc.ABC):
         if not tool:
             return None
 
-        args = json.loads(encoded_function_args)
-        assert isinstance(args, dict)
+        try:
+            args = json.loads(encoded_function_args)
+            if not isinstance(args, dict):
+                raise SchemaValidationError("", "expected an object")
+            tool.validate(args)
+        except (json.JSONDecodeError, SchemaValidationError) as e:
+            # let the model correct the call instead of running the tool
+            logger.warning(f"Rejected call of tool {tool_name}: {e}")
+            return LocalToolCallExecuted(
+                json_encoded_output=json.dumps({"status": "error", "message": f"Invalid arguments: {e}"})
+            )
 
         if isinstance(tool, LocalFunctionToolDeclaration):
             logger.info(f"Executing tool {tool_name} with args {args}")
@@ -115,7 +228,15 @@ class ToolContext(abc.ABC):
         assert_never(tool)
 
     def model_description(self) -> list[dict[str, Any]]:
-        return [v.model_description() for v in self._tool_declarations.values()]
+        # built once, the declarations only change when a tool is registered
+        if self._model_description is None:
+            self._model_description = [v.model_description() for v in self._tool_declarations.values()]
+        return self._model_description
+
+    def model_description_json(self) -> str:
+        if self._model_description_json is None:
+            self._model_description_json = json.dumps(self.model_description())
+        return self._model_description_json
 
 
 class ClientToolCallResponse(BaseModel):
@@ -1,49 +1,43 @@
-import asyncio
-import functools
+import contextlib
+import time
 from datetime import datetime
+from typing import Iterator
 
 
-def write_pcm_to_file(buffer: bytearray, file_name: str) -> None:
-    """Helper function to write PCM data to a file."""
-    with open(file_name, "ab") as f:  # append to file
-        f.write(buffer)
-
-
-def generate_file_name(prefix: str) -> str:
+def generate_file_name(prefix: str, extension: str = "pcm") -> str:
     # Create a timestamp for the file name
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return f"{prefix}_{timestamp}.pcm"
-
-
-class PCMWriter:
-    def __init__(self, prefix: str, write_pcm: bool, buffer_size: int = 1024 * 64):
-        self.write_pcm = write_pcm
-        self.buffer = bytearray()
-        self.buffer_size = buffer_size
-        self.file_name = generate_file_name(prefix) if write_pcm else None
-        self.loop = asyncio.get_event_loop()
-
-    async def write(self, data: bytes) -> None:
-        """Accumulate data into the buffer and write to file when necessary."""
-        if not self.write_pcm:
-            return
-
-        self.buffer.extend(data)
-
-        # Write to file if buffer is full
-        if len(self.buffer) >= self.buffer_size:
-            await self._flush()
-
-    async def flush(self) -> None:
-        """Write any remaining data in the buffer to the file."""
-        if self.write_pcm and self.buffer:
-            await self._flush()
-
-    async def _flush(self) -> None:
-        """Helper method to write the buffer to the file."""
-        if self.file_name:
-            await self.loop.run_in_executor(
-                None,
-                functools.partial(write_pcm_to_file, self.buffer[:], self.file_name),
-            )
-        self.buffer.clear()
+    return f"{prefix}_{timestamp}.{extension}"
+
+
+class StartupTimings:
+    """Records the start offset and duration of each (possibly concurrent) startup phase."""
+
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.phases: dict[str, tuple[float, float]] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            self.phases[name] = (start - self.started_at, end - start)
+
+    @property
+    def total(self) -> float:
+        return max((offset + duration for offset, duration in self.phases.values()), default=0.0)
+
+    def as_dict(self) -> dict[str, float]:
+        """Phase durations in milliseconds, plus the overall critical path as `total`."""
+        timings = {name: round(duration * 1000, 1) for name, (_, duration) in self.phases.items()}
+        timings["total"] = round(self.total * 1000, 1)
+        return timings
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{name}=+{offset * 1000:.0f}ms/{duration * 1000:.0f}ms"
+            for name, (offset, duration) in self.phases.items()
+        ) + f", total={self.total * 1000:.0f}ms"
@@ -0,0 +1,132 @@
+# Entry points of the agent processes, preloaded by the forkserver with everything an agent imports
+import asyncio
+import logging
+import os
+import signal
+from multiprocessing.connection import Connection
+
+from agora_realtime_ai_api.rtc import RtcEngine, RtcOptions
+
+from .realtime.struct import PCM_CHANNELS, PCM_SAMPLE_RATE
+
+from . import event_loop
+from .agent import RealtimeKitAgent, build_session_update, create_realtime_connection, session_voice
+from .clips import get_clip_cache
+from .config import InferenceConfig, default_inference_config
+from .control import ControlChannel
+from .logger import setup_logger
+from .realtime.connection_manager import close_connection_manager
+from .realtime.pool import RealtimeConnectionPool
+from .tools import ToolContext
+
+# Set up the logger with color and timestamp support
+logger = setup_logger(name=__name__, log_level=logging.INFO)
+
+
+def handle_agent_proc_signal(signum, frame):
+    logger.info(f"Agent process received signal {signal.strsignal(signum)}. Exiting...")
+    os._exit(0)
+
+
+def _rtc_options(channel_name: str, uid: int) -> RtcOptions:
+    return RtcOptions(
+        channel_name=channel_name,
+        uid=uid,
+        sample_rate=PCM_SAMPLE_RATE,
+        channels=PCM_CHANNELS,
+        enable_pcm_dump= os.environ.get("WRITE_RTC_PCM", "false") == "true"
+    )
+
+
+def run_agent_in_process(
+    engine_app_id: str,
+    engine_app_cert: str,
+    channel_name: str,
+    uid: int,
+    inference_config: InferenceConfig,
+    control: Connection | None = None,
+):  # Set up signal forwarding in the child process
+    # Until the agent runs and installs its graceful stop handlers
+    signal.signal(signal.SIGINT, handle_agent_proc_signal)  # Forward SIGINT
+    signal.signal(signal.SIGTERM, handle_agent_proc_signal)  # Forward SIGTERM
+    event_loop.run(_run_agent(engine_app_id, engine_app_cert, channel_name, uid, inference_config, control))
+
+
+async def _run_agent(
+    engine_app_id: str,
+    engine_app_cert: str,
+    channel_name: str,
+    uid: int,
+    inference_config: InferenceConfig,
+    control: Connection | None,
+) -> None:
+    control_channel = ControlChannel(control) if control else None
+    try:
+        await RealtimeKitAgent.setup_and_run_agent(
+            engine=RtcEngine(appid=engine_app_id, appcert=engine_app_cert),
+            options=_rtc_options(channel_name, uid),
+            inference_config=inference_config,
+            tools=ToolContext.from_env(),
+            # tools=AgentTools() # tools example, replace with this line
+            control=control_channel,
+        )
+    finally:
+        if control_channel:
+            control_channel.close()
+        await close_connection_manager()
+
+
+async def _run_warm_agent(engine_app_id: str, engine_app_cert: str, control: Connection) -> None:
+    # Everything that does not depend on the call is set up before it is assigned:
+    # the RTC engine and a Realtime API session configured with the defaults
+    engine = RtcEngine(appid=engine_app_id, appcert=engine_app_cert)
+    tools = ToolContext.from_env()
+    pool = RealtimeConnectionPool(
+        connection_factory=create_realtime_connection,
+        session_update=build_session_update(default_inference_config(), tools),
+        size=1,
+        max_idle_s=float(os.environ.get("REALTIME_POOL_MAX_IDLE_S", "300")),
+    )
+
+    control_channel = ControlChannel(control)
+    assignment = asyncio.get_running_loop().create_future()
+
+    def on_control_message(message):
+        if message["type"] in ("assign", "stop") and not assignment.done():
+            assignment.set_result(message)
+        elif message["type"] == "reload_tools" and tools:
+            tools.reload_modules()
+
+    control_channel.start(on_control_message)
+    await pool.start(wait=False)
+    # load (or generate) the clips of the default voice while waiting for a call
+    clips = get_clip_cache()
+    if clips:
+        asyncio.create_task(clips.prepare(session_voice(default_inference_config())))
+    try:
+        message = await assignment
+        if message["type"] == "stop":
+            logger.info("Warm agent stopped before being assigned a call")
+            return
+
+        logger.info(f"Warm agent assigned to channel {message['channel_name']}")
+        # this worker serves a single call, do not open a replacement connection
+        await pool.stop_refill()
+        await RealtimeKitAgent.setup_and_run_agent(
+            engine=engine,
+            options=_rtc_options(message["channel_name"], message["uid"]),
+            inference_config=message["inference_config"],
+            tools=tools,
+            connection_pool=pool,
+            control=control_channel,
+        )
+    finally:
+        control_channel.close()
+        await pool.close()
+        await close_connection_manager()
+
+
+def run_warm_agent_in_process(engine_app_id: str, engine_app_cert: str, control: Connection):
+    signal.signal(signal.SIGINT, handle_agent_proc_signal)  # Forward SIGINT
+    signal.signal(signal.SIGTERM, handle_agent_proc_signal)  # Forward SIGTERM
+    event_loop.run(_run_warm_agent(engine_app_id, engine_app_cert, control))
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def response_done_payload() -> str:
+    """A response.done as sent by the Realtime API."""
+    return json.dumps(
+        {
+            "type": "response.done",
+            "event_id": "event_AB12",
+            "response": {
+                "object": "realtime.response",
+                "id": "resp_001",
+                "status": "completed",
+                "status_details": None,
+                "output": [],
+                "usage": {
+                    "total_tokens": 253,
+                    "input_tokens": 132,
+                    "output_tokens": 121,
+                    "input_token_details": {
+                        "cached_tokens": 64,
+                        "text_tokens": 119,
+                        "audio_tokens": 13,
+                        "cached_tokens_details": {"text_tokens": 64, "audio_tokens": 0},
+                    },
+                    "output_token_details": {"text_tokens": 30, "audio_tokens": 91},
+                },
+            },
+        }
+    )
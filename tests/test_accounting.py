@@ -0,0 +1,73 @@
+import asyncio
+
+from realtime_agent.accounting import SessionUsage, UsageExporter, UsageLedger
+from realtime_agent.realtime.struct import parse_server_message
+
+
+class MemoryExporter(UsageExporter):
+    def __init__(self) -> None:
+        self.batches = []
+
+    async def export(self, records):
+        self.batches.append(records)
+
+
+def test_record_response_counts_the_tokens_of_a_parsed_response_done(response_done_payload):
+    usage = SessionUsage("channel", tenant="acme")
+    usage.record_response(parse_server_message(response_done_payload).response)
+    usage.add_uplink(b"\0" * 48_000)
+
+    record = usage.to_dict()
+
+    assert record["responses"] == 1
+    assert record["total_tokens"] == 253
+    assert record["input_text_tokens"] == 119
+    assert record["input_cached_tokens"] == 64
+    assert record["output_audio_tokens"] == 91
+    assert record["uplink_s"] == 1.0
+    assert record["input_tokens_per_response"] == 132
+
+
+def test_cost_bills_cached_input_at_the_cached_price(response_done_payload):
+    usage = SessionUsage("channel")
+    usage.record_response(parse_server_message(response_done_payload).response)
+
+    record = usage.to_dict({"text_input": 1_000_000, "cached_input": 0})
+
+    assert record["cost"] == 119 - 64
+
+
+def test_ledger_exports_sessions_with_tenant_totals(response_done_payload):
+    exporter = MemoryExporter()
+    ledger = UsageLedger(exporter, batch_size=10)
+    for tenant in ("acme", "acme", "globex"):
+        usage = SessionUsage("channel", tenant=tenant)
+        usage.record_response(parse_server_message(response_done_payload).response)
+        ledger.record(usage.to_dict())
+
+    asyncio.run(ledger.close())
+
+    (batch,) = exporter.batches
+    tenants = {record["tenant"]: record for record in batch if record["kind"] == "tenant"}
+    assert len(batch) == 5
+    assert tenants["acme"]["sessions"] == 2
+    assert tenants["acme"]["total_tokens"] == 506
+    assert tenants["globex"]["total_tokens"] == 253
+
+
+def test_full_batch_is_flushed_without_waiting_for_the_interval(response_done_payload):
+    exporter = MemoryExporter()
+
+    async def run():
+        ledger = UsageLedger(exporter, batch_size=2, flush_interval_s=3600)
+        ledger.start()
+        for _ in range(2):
+            usage = SessionUsage("channel")
+            usage.record_response(parse_server_message(response_done_payload).response)
+            ledger.record(usage.to_dict())
+        await asyncio.sleep(0)
+        exported = len(exporter.batches)
+        await ledger.close()
+        return exported
+
+    assert asyncio.run(run()) == 1
@@ -0,0 +1,28 @@
+import asyncio
+import wave
+
+from realtime_agent.audio_capture import AudioRingBuffer, SessionAudioCapture
+
+
+def test_ring_buffer_keeps_the_most_recent_audio() -> None:
+    ring = AudioRingBuffer(8)
+    ring.write(b"abcdef")
+    ring.write(b"ghij")
+    assert ring.snapshot() == b"cdefghij"
+    ring.write(b"0123456789")
+    assert ring.snapshot() == b"23456789"
+    ring.close()
+
+
+def test_export_writes_both_directions(tmp_path) -> None:
+    capture = SessionAudioCapture(1, sample_rate=1000, directory=str(tmp_path))
+    capture.write_uplink(bytes(600))
+    capture.write_downlink(bytes(3000))
+    file_names = asyncio.run(capture.export(prefix="capture"))
+    capture.close()
+
+    frames = []
+    for file_name in file_names:
+        with wave.open(file_name, "rb") as wav:
+            frames.append(wav.getnframes())
+    assert frames == [300, 1000]
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("agora_realtime_ai_api")
+
+from realtime_agent.clips import GREETING, ClipCache  # noqa: E402
+
+
+def test_failed_voice_is_prepared_again(tmp_path):
+    cache = ClipCache(str(tmp_path), {GREETING: ["Hi"]})
+    calls = []
+
+    async def synthesize(voice: str, text: str) -> bytes:
+        calls.append(text)
+        if len(calls) == 1:
+            raise ConnectionError("unavailable")
+        return b"\x01\x00" * 10
+
+    cache._synthesize = synthesize
+
+    async def run():
+        await cache.prepare("alloy")
+        assert cache.get("alloy", GREETING) is None
+        await cache.prepare("alloy")
+        assert cache.get("alloy", GREETING) == b"\x01\x00" * 10
+        # complete, not generated again
+        await cache.prepare("alloy")
+
+    asyncio.run(run())
+    assert calls == ["Hi", "Hi"]
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+from realtime_agent.realtime.connection import RealtimeApiConnection
+from realtime_agent.realtime.struct import ItemCreate, ResponseCreate, SessionUpdate, SessionUpdateParams, UserMessageItemParam
+
+
+class FakeWebSocket:
+    def __init__(self, sent: list[str], fail: bool = False) -> None:
+        self.sent = sent
+        self.fail = fail
+        self.closed = False
+
+    async def send_str(self, data: str) -> None:
+        if self.fail:
+            raise ConnectionResetError("Cannot write to closing transport")
+        # writes can yield to other tasks, e.g. when draining
+        await asyncio.sleep(0)
+        self.sent.append(json.loads(data)["type"])
+
+    async def close(self) -> None:
+        self.closed = True
+
+    def exception(self) -> None:
+        return None
+
+
+class FakeSession:
+    def __init__(self, sent: list[str]) -> None:
+        self.sent = sent
+
+    async def ws_connect(self, **kwargs) -> FakeWebSocket:
+        await asyncio.sleep(0.01)
+        return FakeWebSocket(self.sent)
+
+
+def connection(sent: list[str], **kwargs) -> RealtimeApiConnection:
+    return RealtimeApiConnection(
+        base_uri="wss://example.invalid",
+        api_key="key",
+        reconnect_attempts=2,
+        reconnect_base_delay=0.001,
+        session=FakeSession(sent),
+        **kwargs,
+    )
+
+
+def test_senders_wait_for_the_session_to_be_restored():
+    sent: list[str] = []
+    replay = [ItemCreate(item=UserMessageItemParam(content=[{"type": "input_text", "text": "hi"}]))]
+    conn = connection(sent, replay=lambda: replay)
+
+    async def run() -> None:
+        await conn.connect()
+        await conn.send_request(SessionUpdate(session=SessionUpdateParams()))
+        sent.clear()
+
+        reconnect = asyncio.create_task(conn._reconnect())
+        await asyncio.sleep(0)
+        await conn.send_audio_data(b"\0" * 480)
+        await conn.send_request(ResponseCreate())
+        assert await reconnect
+
+    asyncio.run(run())
+
+    assert sent == ["session.update", "conversation.item.create", "input_audio_buffer.append", "response.create"]
+
+
+def test_audio_sent_on_a_dropped_socket_is_buffered_until_reconnected():
+    sent: list[str] = []
+    conn = connection(sent)
+
+    async def run() -> None:
+        await conn.connect()
+        conn.websocket.fail = True
+        # listen() has not noticed the drop yet
+        await conn.send_audio_data(b"\0" * 480)
+        await conn.send_audio_data(b"\0" * 480)
+        assert await conn._reconnect()
+
+    asyncio.run(run())
+
+    assert sent == ["input_audio_buffer.append", "input_audio_buffer.append"]
+
+
+def test_request_on_a_dropped_socket_is_sent_after_the_reconnect():
+    sent: list[str] = []
+    conn = connection(sent)
+
+    async def run() -> None:
+        await conn.connect()
+        conn.websocket.fail = True
+        request = asyncio.create_task(conn.send_request(ResponseCreate()))
+        await asyncio.sleep(0.06)
+        assert not request.done()
+        assert await conn._reconnect()
+        await request
+
+    asyncio.run(run())
+
+    assert sent == ["response.create"]
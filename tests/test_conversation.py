@@ -0,0 +1,132 @@
+from realtime_agent import conversation
+from realtime_agent.conversation import ConversationStore
+
+
+def _user_item(item_id: str) -> dict:
+    return {"id": item_id, "type": "message", "role": "user", "content": [{"type": "input_audio", "transcript": None}]}
+
+
+def test_transcript_before_item_created_is_kept() -> None:
+    store = ConversationStore()
+    store.on_speech_started("item_1", 1200)
+    store.on_speech_stopped("item_1", 2400)
+    # the transcript lane ran ahead of the control lane
+    store.set_transcript("item_1", "hello there")
+    assert store.audio_span("item_1") == (1200, 2400)
+
+    store.on_item_created(_user_item("item_1"))
+    item = store.get("item_1")
+    assert item.text == "hello there"
+    assert (item.audio_start_ms, item.audio_end_ms) == (1200, 2400)
+
+
+def test_transcript_after_item_created() -> None:
+    store = ConversationStore()
+    store.on_item_created(_user_item("item_1"))
+    store.set_transcript("item_1", "hello there")
+    assert store.get("item_1").text == "hello there"
+
+
+def test_pending_transcript_dropped_with_deleted_item() -> None:
+    store = ConversationStore()
+    store.set_transcript("item_1", "hello there")
+    store.on_item_deleted("item_1")
+    store.on_item_created(_user_item("item_1"))
+    assert store.get("item_1").text == ""
+
+
+def _assistant_item(item_id: str, text: str) -> dict:
+    return {"id": item_id, "type": "message", "role": "assistant", "content": [{"type": "audio", "transcript": text}]}
+
+
+def _store_with_turns(store: ConversationStore, turns: int) -> None:
+    for index in range(turns):
+        store.on_item_created({**_user_item(f"user_{index}"), "content": [{"type": "input_text", "text": f"q{index}"}]})
+        store.on_response_created(f"resp_{index}")
+        store.on_output_item_done(f"resp_{index}", _assistant_item(f"assistant_{index}", f"a{index}"))
+        store.on_response_done(f"resp_{index}")
+
+
+def test_items_are_indexed_by_response() -> None:
+    store = ConversationStore()
+    store.on_output_item_added("resp_1", {"id": "call_1", "type": "function_call", "name": "lookup", "status": "in_progress"})
+    store.on_output_item_done("resp_1", _assistant_item("assistant_1", "done"))
+
+    assert [item.item_id for item in store.items_for_response("resp_1")] == ["call_1", "assistant_1"]
+    assert store.get("call_1").text == "lookup()"
+    assert store.get("assistant_1").status == "completed"
+
+    store.on_item_deleted("call_1")
+    assert [item.item_id for item in store.items_for_response("resp_1")] == ["assistant_1"]
+
+
+def test_evicts_the_oldest_items_over_the_size_bound() -> None:
+    store = ConversationStore(max_items=3)
+    _store_with_turns(store, 3)
+
+    assert store.evict() == ["user_0", "assistant_0", "user_1"]
+    # selected once, dropped when the server confirms the deletion
+    assert store.evict() == []
+    assert len(store) == 6
+    for item_id in ("user_0", "assistant_0", "user_1"):
+        store.on_item_deleted(item_id)
+    assert [item.item_id for item in store.items()] == ["assistant_1", "user_2", "assistant_2"]
+
+
+def test_eviction_stops_at_a_response_in_progress() -> None:
+    store = ConversationStore(max_age_s=60)
+    _store_with_turns(store, 2)
+    store.on_response_created("resp_0")
+
+    assert store.evict(now=store.get("assistant_1").created_at + 120) == ["user_0"]
+
+
+def test_replay_summarizes_the_older_messages() -> None:
+    store = ConversationStore()
+    _store_with_turns(store, 3)
+    replay = store.replay_items(max_items=2)
+
+    assert len(store) == 0
+    assert [item.type for item in replay] == ["message"] * 3
+    assert replay[0].role == "system"
+    assert replay[0].content[0]["text"] == "Summary of the earlier conversation: user: q0 assistant: a0 user: q1 assistant: a1"
+    assert [(item.role, item.content[0]["text"]) for item in replay[1:]] == [("user", "q2"), ("assistant", "a2")]
+
+
+def test_rejected_or_unconfirmed_deletes_are_selected_again() -> None:
+    store = ConversationStore(max_items=3, delete_timeout_s=10)
+    _store_with_turns(store, 3)
+    now = store.get("assistant_2").created_at
+
+    evicted = store.evict(now=now)
+    assert evicted == ["user_0", "assistant_0", "user_1"]
+    for index, item_id in enumerate(evicted):
+        store.on_delete_sent(item_id, f"event_{index}")
+
+    assert not store.on_error("event_other")
+    assert store.on_error("event_0")
+    assert store.evict(now=now + 1) == ["user_0"]
+
+    store.on_item_deleted("user_0")
+    store.on_item_deleted("assistant_0")
+    # the delete of user_1 is never confirmed
+    assert store.evict(now=now + 5) == []
+    assert store.evict(now=now + 12) == ["user_1"]
+
+
+def test_pending_values_expire_and_are_capped(monkeypatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(conversation.time, "monotonic", lambda: now[0])
+    store = ConversationStore(pending_ttl_s=60, max_pending=2)
+
+    store.set_transcript("item_1", "never created")
+    now[0] = 170.0
+    store.on_speech_started("item_2", 100)
+    assert store.audio_span("item_1") == (None, None)
+    store.on_item_created(_user_item("item_1"))
+    assert store.get("item_1").text == ""
+
+    store.on_speech_started("item_3", 200)
+    store.on_speech_started("item_4", 300)
+    assert store.audio_span("item_2") == (None, None)
+    assert store.audio_span("item_4") == (300, None)
@@ -0,0 +1,122 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from realtime_agent import datastream
+from realtime_agent.datastream import (
+    CancelResponse,
+    ChunkAssembler,
+    DataStreamError,
+    SetMuted,
+    TextBatcher,
+    TextInput,
+    UpdateSession,
+    parse_message,
+)
+from realtime_agent.realtime.struct import Voices
+
+
+def _parts(msg_id: str, payload: str, size: int) -> list[str]:
+    encoded = base64.b64encode(payload.encode("utf-8")).decode("ascii")
+    chunks = [encoded[start:start + size] for start in range(0, len(encoded), size)]
+    return [f"{msg_id}|{index}|{len(chunks)}|{chunk}" for index, chunk in enumerate(chunks, 1)]
+
+
+def test_parse_messages() -> None:
+    assert parse_message('{"type": "text", "text": "hi"}') == TextInput(text="hi")
+    assert parse_message('{"type": "cancel"}') == CancelResponse()
+    assert parse_message('{"type": "mute"}') == SetMuted(muted=True)
+    assert parse_message('{"type": "session", "voice": "echo"}') == UpdateSession(voice=Voices.Echo)
+
+
+@pytest.mark.parametrize(
+    "payload",
+    ["not json", "[]", '{"type": "text", "text": " "}', '{"type": "mute", "muted": "no"}',
+     '{"type": "session"}', '{"type": "output", "output": "video"}', '{"type": "dance"}'],
+)
+def test_parse_invalid_messages(payload: str) -> None:
+    with pytest.raises(DataStreamError):
+        parse_message(payload)
+
+
+def test_assembles_parts_in_any_order() -> None:
+    payload = json.dumps({"type": "text", "text": "héllo " * 20})
+    parts = _parts("m1", payload, 16)
+    assembler = ChunkAssembler()
+
+    assert assembler.add(payload.encode("utf-8")) == payload
+    assert all(assembler.add(part) is None for part in parts[:0:-1])
+    assert assembler.add(parts[0].encode("utf-8")) == payload
+
+
+def test_incomplete_messages_expire(monkeypatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(datastream.time, "monotonic", lambda: now[0])
+    assembler = ChunkAssembler(timeout_s=5, max_pending=1)
+    first, second = _parts("m1", '{"type": "cancel"}', 8)[:2]
+
+    assert assembler.add(first) is None
+    with pytest.raises(DataStreamError, match="Too many"):
+        assembler.add(_parts("m2", '{"type": "cancel"}', 8)[0])
+
+    now[0] = 106.0
+    # m1 was dropped, its late part starts a new incomplete message
+    assert assembler.add(second) is None
+    with pytest.raises(DataStreamError):
+        assembler.add("m3|2|1|abc")
+
+
+def test_text_batcher_debounces_and_caps_the_wait() -> None:
+    async def run() -> list[tuple[float, list[str]]]:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        flushed: list[tuple[float, list[str]]] = []
+
+        async def flush(texts: list[str]) -> None:
+            flushed.append((loop.time() - started, texts))
+
+        batcher = TextBatcher(flush, debounce_ms=100, max_wait_ms=250)
+        batcher.add("a")
+        await asyncio.sleep(0.05)
+        batcher.add("b")
+        await asyncio.sleep(0.25)
+        # keeps arriving faster than the debounce, flushed at the max wait
+        for text in "cdefg":
+            batcher.add(text)
+            await asyncio.sleep(0.07)
+        await asyncio.sleep(0.15)
+        batcher.close()
+        return flushed
+
+    flushed = asyncio.run(run())
+    assert [texts for _, texts in flushed] == [["a", "b"], ["c", "d", "e", "f"], ["g"]]
+    assert 0.14 <= flushed[0][0] < 0.22
+
+
+def test_text_batcher_close_cancels_running_flush():
+    async def run():
+        started = asyncio.Event()
+        cancelled = []
+
+        async def flush(texts: list[str]) -> None:
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(texts)
+                raise
+
+        batcher = TextBatcher(flush, debounce_ms=10, max_wait_ms=10)
+        batcher.add("a")
+        await started.wait()
+        assert len(batcher._flushes) == 1
+        batcher.close()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return cancelled, batcher._flushes
+
+    cancelled, flushes = asyncio.run(run())
+    assert cancelled == [["a"]]
+    assert not flushes
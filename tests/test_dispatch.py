@@ -0,0 +1,76 @@
+import asyncio
+
+from realtime_agent.dispatch import AUDIO, CONTROL, TRANSCRIPT, LaneDispatcher
+
+
+def test_lanes_keep_order_and_do_not_block_each_other() -> None:
+    async def run() -> dict[str, list[str]]:
+        handled: dict[str, list[str]] = {AUDIO: [], CONTROL: [], TRANSCRIPT: []}
+        transcript_released = asyncio.Event()
+
+        def handler(lane: str):
+            async def handle(message: tuple[str, str]) -> None:
+                if lane == TRANSCRIPT:
+                    await transcript_released.wait()
+                handled[lane].append(message[1])
+            return handle
+
+        dispatcher = LaneDispatcher(lambda message: message[0], {lane: handler(lane) for lane in handled})
+        dispatcher.start()
+        for index in range(3):
+            dispatcher.put((TRANSCRIPT, f"t{index}"))
+            dispatcher.put((CONTROL, f"c{index}"))
+            dispatcher.put((AUDIO, f"a{index}"))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # a stuck transcript handler does not hold back the other lanes
+        assert handled[AUDIO] == ["a0", "a1", "a2"]
+        assert handled[CONTROL] == ["c0", "c1", "c2"]
+        assert handled[TRANSCRIPT] == []
+
+        transcript_released.set()
+        await dispatcher.close()
+        return handled
+
+    assert asyncio.run(run())[TRANSCRIPT] == ["t0", "t1", "t2"]
+
+
+def test_clear_drops_waiting_messages() -> None:
+    async def run() -> tuple[int, list[str], dict]:
+        handled: list[str] = []
+
+        async def handle(message: str) -> None:
+            handled.append(message)
+
+        dispatcher = LaneDispatcher(lambda message: AUDIO, {AUDIO: handle})
+        dispatcher.start()
+        for index in range(4):
+            dispatcher.put(f"a{index}")
+        dropped = dispatcher.clear(AUDIO)
+        await dispatcher.close()
+        return dropped, handled, dispatcher.stats()[AUDIO]
+
+    dropped, handled, stats = asyncio.run(run())
+    assert dropped == 4
+    assert handled == []
+    assert stats["dropped"] == 4
+    assert stats["max_depth"] == 4
+
+
+def test_handler_errors_do_not_stop_the_lane() -> None:
+    async def run() -> list[int]:
+        handled: list[int] = []
+
+        async def handle(message: int) -> None:
+            if message == 1:
+                raise RuntimeError("boom")
+            handled.append(message)
+
+        dispatcher = LaneDispatcher(lambda message: CONTROL, {CONTROL: handle})
+        dispatcher.start()
+        for message in range(3):
+            dispatcher.put(message)
+        await dispatcher.close()
+        return handled
+
+    assert asyncio.run(run()) == [0, 2]
@@ -0,0 +1,49 @@
+import numpy as np
+
+from realtime_agent.endpointer import Endpointer, EndpointEvent
+
+SAMPLES_PER_MS = 24
+
+
+def _audio(ms: int, amplitude: int) -> bytes:
+    return np.full(ms * SAMPLES_PER_MS, amplitude, dtype=np.int16).tobytes()
+
+
+def _feed(endpointer: Endpointer, audio: bytes, chunk_bytes: int = 1000) -> list[EndpointEvent]:
+    # chunks that do not line up with the frames
+    events = []
+    for start in range(0, len(audio), chunk_bytes):
+        events += endpointer.process(audio[start:start + chunk_bytes])
+    return events
+
+
+def test_turn_offsets() -> None:
+    endpointer = Endpointer()
+    events = _feed(endpointer, _audio(200, 0) + _audio(300, 3000) + _audio(400, 0))
+
+    assert events == [EndpointEvent.SPEECH_STARTED, EndpointEvent.SPEECH_ENDED]
+    assert endpointer.speech_start_ms == 200
+    assert endpointer.speech_end_ms == 500
+    assert not endpointer.in_speech
+
+
+def test_short_noise_does_not_start_a_turn() -> None:
+    endpointer = Endpointer()
+    assert _feed(endpointer, _audio(200, 0) + _audio(100, 3000) + _audio(400, 0)) == []
+
+
+def test_pause_shorter_than_silence_keeps_the_turn() -> None:
+    endpointer = Endpointer()
+    events = _feed(endpointer, _audio(200, 3000) + _audio(200, 0) + _audio(200, 3000))
+    assert events == [EndpointEvent.SPEECH_STARTED]
+    assert endpointer.in_speech
+
+
+def test_noise_floor_raises_the_speech_threshold() -> None:
+    endpointer = Endpointer()
+    # steady background noise below the absolute threshold
+    assert _feed(endpointer, _audio(2000, 400)) == []
+    assert endpointer.noise_floor > 350
+
+    assert _feed(endpointer, _audio(300, 1000)) == []
+    assert _feed(endpointer, _audio(300, 3000)) == [EndpointEvent.SPEECH_STARTED]
@@ -0,0 +1,19 @@
+import pytest
+
+from realtime_agent import event_loop
+
+
+def test_default_event_loop_unless_enabled(monkeypatch) -> None:
+    monkeypatch.delenv("AGENT_USE_UVLOOP", raising=False)
+    assert event_loop.event_loop_factory() is None
+
+
+def test_uvloop_when_enabled(monkeypatch) -> None:
+    uvloop = pytest.importorskip("uvloop")
+    monkeypatch.setenv("AGENT_USE_UVLOOP", "true")
+    assert event_loop.event_loop_factory() is uvloop.new_event_loop
+    assert event_loop.run(_answer()) == 42
+
+
+async def _answer() -> int:
+    return 42
@@ -0,0 +1,55 @@
+import asyncio
+
+import numpy as np
+
+from realtime_agent.mixer import ACTIVE_SPEAKER, MIX, UplinkMixer
+
+FRAME_SAMPLES = 480  # 20ms at 24kHz
+
+
+def _frame(amplitude: int) -> bytes:
+    return np.full(FRAME_SAMPLES, amplitude, dtype=np.int16).tobytes()
+
+
+async def _consume(mixer: UplinkMixer, count: int, sent) -> list[bytes]:
+    frames = []
+    iterator = mixer.frames()
+    for index in range(count):
+        frames.append(await anext(iterator))
+        if sent(index):
+            mixer.commit()
+    return frames
+
+
+def test_mix_sums_the_participants() -> None:
+    async def run() -> list[bytes]:
+        mixer = UplinkMixer(MIX)
+        mixer.add("a")
+        mixer.add("b")
+        mixer.write("a", _frame(1000))
+        mixer.write("b", _frame(2000))
+        return await _consume(mixer, 1, lambda index: True)
+
+    (frame,) = asyncio.run(run())
+    assert np.frombuffer(frame, dtype=np.int16).tolist() == [3000] * FRAME_SAMPLES
+
+
+def test_timeline_only_advances_for_sent_frames() -> None:
+    async def run() -> UplinkMixer:
+        mixer = UplinkMixer(ACTIVE_SPEAKER, hold_ms=20)
+        mixer.add("a")
+        mixer.add("b")
+        for _ in range(50):
+            mixer.write("a", _frame(3000))
+            mixer.write("b", _frame(0))
+        for _ in range(50):
+            mixer.write("a", _frame(0))
+            mixer.write("b", _frame(3000))
+        # the second half of a's frames is shed by the uplink
+        await _consume(mixer, 100, lambda index: not 25 <= index < 50)
+        return mixer
+
+    mixer = asyncio.run(run())
+    # the server received 500ms of a followed by 1000ms of b
+    assert mixer.speaker_between(0, 500) == "a"
+    assert mixer.speaker_between(600, 900) == "b"
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+
+from realtime_agent.realtime.pool import RealtimeConnectionPool
+from realtime_agent.realtime.struct import SessionUpdate, SessionUpdateParams
+
+CLOSE = aiohttp.WSMessage(aiohttp.WSMsgType.CLOSE, 1001, None)
+
+
+class FakeWebSocket:
+    def __init__(self) -> None:
+        self.messages: asyncio.Queue[aiohttp.WSMessage] = asyncio.Queue()
+        self.closed = False
+        self.waiting = False
+
+    async def receive(self) -> aiohttp.WSMessage:
+        self.waiting = True
+        try:
+            return await self.messages.get()
+        finally:
+            self.waiting = False
+
+    def exception(self) -> None:
+        return None
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.websocket = FakeWebSocket()
+
+    @property
+    def is_healthy(self) -> bool:
+        return not self.websocket.closed
+
+    async def connect(self) -> None:
+        pass
+
+    async def configure(self, session_update: SessionUpdate, timeout: float) -> SimpleNamespace:
+        return SimpleNamespace(session=SimpleNamespace(expires_at=None))
+
+    async def close(self) -> None:
+        self.websocket.closed = True
+
+
+def _pool(opened: list[FakeConnection]) -> RealtimeConnectionPool:
+    def factory() -> FakeConnection:
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    return RealtimeConnectionPool(
+        connection_factory=factory,
+        session_update=SessionUpdate(session=SessionUpdateParams()),
+        health_check_interval_s=3600,
+    )
+
+
+def test_idle_connection_closed_by_server_is_replaced() -> None:
+    async def run() -> tuple[list[FakeConnection], int]:
+        opened: list[FakeConnection] = []
+        pool = _pool(opened)
+        await pool.start()
+        opened[0].websocket.messages.put_nowait(CLOSE)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        idle = pool.idle_count
+        await pool.close()
+        return opened, idle
+
+    opened, idle = asyncio.run(run())
+    assert len(opened) == 2
+    assert opened[0].websocket.closed
+    assert idle == 1
+
+
+def test_acquire_stops_reading_the_websocket() -> None:
+    async def run() -> tuple[FakeConnection, FakeConnection, bool]:
+        opened: list[FakeConnection] = []
+        pool = _pool(opened)
+        await pool.start()
+        await asyncio.sleep(0)
+        connection = await pool.acquire()
+        waiting = connection.websocket.waiting
+        await pool.close()
+        return opened[0], connection, waiting
+
+    pooled, connection, waiting = asyncio.run(run())
+    assert connection is pooled
+    assert not connection.websocket.closed
+    assert not waiting
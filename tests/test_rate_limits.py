@@ -0,0 +1,77 @@
+import asyncio
+
+from realtime_agent.rate_limits import RateLimitBudget
+from realtime_agent.realtime.struct import RateLimitDetails, ResponseDone, parse_server_message
+
+
+def limits(requests: int, tokens: int, reset_seconds: float = 60.0) -> list[RateLimitDetails]:
+    return [
+        RateLimitDetails(name="requests", limit=1000, remaining=requests, reset_seconds=reset_seconds),
+        RateLimitDetails(name="tokens", limit=100_000, remaining=tokens, reset_seconds=reset_seconds),
+    ]
+
+
+def test_record_usage_of_parsed_response_done(response_done_payload):
+    message = parse_server_message(response_done_payload)
+    assert isinstance(message, ResponseDone)
+
+    budget = RateLimitBudget()
+    budget.record_usage(message.response.usage)
+    budget.record_usage(message.response.usage)
+
+    assert budget.session_tokens == 506
+
+
+def test_output_token_limit_follows_remaining_tokens():
+    budget = RateLimitBudget(trim_ratio=0.2, base_output_tokens=4096, min_output_tokens=256)
+    assert budget.output_token_limit() is None
+
+    budget.update(limits(requests=900, tokens=50_000))
+    assert budget.output_token_limit() is None
+
+    budget.update(limits(requests=900, tokens=10_000))
+    assert budget.output_token_limit() == 2048
+
+    budget.update(limits(requests=900, tokens=100))
+    assert budget.output_token_limit() == 256
+
+
+def test_output_token_limit_follows_session_budget(response_done_payload):
+    budget = RateLimitBudget(base_output_tokens=4096, min_output_tokens=100, session_max_tokens=3000)
+    budget.record_usage(parse_server_message(response_done_payload).response.usage)
+
+    assert budget.output_token_limit() == 3000 - 253
+
+
+def test_wait_for_capacity_waits_for_the_reset():
+    budget = RateLimitBudget(reserve_ratio=0.05, max_wait_s=1.0)
+    budget.update(limits(requests=10, tokens=50_000, reset_seconds=0.05))
+
+    started = asyncio.run(_timed(budget.wait_for_capacity()))
+
+    assert 0.04 <= started < 0.5
+    assert budget.paced_s > 0
+
+
+def test_wait_for_capacity_gives_up_after_max_wait():
+    budget = RateLimitBudget(reserve_ratio=0.05, max_wait_s=0.05)
+    budget.update(limits(requests=10, tokens=50_000, reset_seconds=60))
+
+    assert asyncio.run(_timed(budget.wait_for_capacity())) < 0.5
+
+
+def test_status_reports_the_smallest_headroom():
+    budget = RateLimitBudget()
+    budget.update(limits(requests=500, tokens=10_000))
+
+    status = budget.status()
+
+    assert status["headroom"] == 0.1
+    assert status["limits"]["requests"] == {"limit": 1000, "remaining": 500}
+
+
+async def _timed(coroutine) -> float:
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await coroutine
+    return loop.time() - started
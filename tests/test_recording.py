@@ -0,0 +1,63 @@
+import asyncio
+import glob
+import wave
+
+import numpy as np
+
+from realtime_agent import recording
+from realtime_agent.recording import CallRecorder, _SegmentWriter
+
+
+def test_unclosed_segment_has_a_valid_header(tmp_path) -> None:
+    writer = _SegmentWriter(str(tmp_path / "call"), 1, 24000, None, None, False)
+    writer.write(bytearray(4800))
+    writer.write(bytearray(4800))
+    writer._wav._file.flush()
+
+    # read while the segment is still open, as after a crash
+    with wave.open(writer.file_name, "rb") as wav:
+        assert wav.getnframes() == 4800
+    writer.close()
+
+
+def test_segments_rotate_by_size(tmp_path) -> None:
+    writer = _SegmentWriter(str(tmp_path / "call"), 1, 24000, 4800, None, False)
+    writer.write(bytearray(4800))
+    first = writer.file_name
+    writer.write(bytearray(2400))
+    writer.close()
+
+    assert writer.segment == 2
+    with wave.open(first, "rb") as wav:
+        assert wav.getnframes() == 2400
+    with wave.open(writer.file_name, "rb") as wav:
+        assert wav.getnframes() == 1200
+
+
+def test_stereo_downlink_is_placed_at_playout(tmp_path, monkeypatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(recording.time, "monotonic", lambda: now[0])
+
+    async def run() -> None:
+        recorder = CallRecorder(str(tmp_path / "call"), sample_rate=1000)
+        uplink = np.ones(10, dtype=np.int16).tobytes()
+        for tick in range(300):
+            now[0] = 100.0 + (tick + 1) / 100
+            await recorder.write_uplink(uplink)
+            if tick == 49:
+                # the model sends 2s of audio at once, faster than it is played
+                for _ in range(20):
+                    await recorder.write_downlink(np.full(100, 2, dtype=np.int16).tobytes())
+            if tick == 149:
+                # barge-in, the SDK buffer is cleared after 1s of playout
+                recorder.clear_downlink()
+        await recorder.close()
+
+    asyncio.run(run())
+    (file_name,) = glob.glob(str(tmp_path / "call_*.wav"))
+    with wave.open(file_name, "rb") as wav:
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16).reshape(-1, 2)
+
+    assert len(samples) == 3000
+    assert (samples[:, 0] == 1).all()
+    assert np.flatnonzero(samples[:, 1]).tolist() == list(range(500, 1500))
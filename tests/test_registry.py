@@ -0,0 +1,24 @@
+import asyncio
+
+from realtime_agent.registry import InMemoryRedis, RedisSessionRegistry
+
+
+def test_lease_taken_over_after_expiry_is_not_renewed_or_released(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("realtime_agent.registry.time.monotonic", lambda: now[0])
+    registry = RedisSessionRegistry(InMemoryRedis())
+
+    async def run():
+        assert await registry.acquire("ch", "a", ttl_s=1.0) == "a"
+        assert await registry.renew("ch", "a", ttl_s=1.0)
+        now[0] = 2.0
+        assert await registry.acquire("ch", "b", ttl_s=1.0) == "b"
+        assert not await registry.renew("ch", "a", ttl_s=10.0)
+        await registry.release("ch", "a")
+        assert await registry.owner("ch") == "b"
+        now[0] = 2.9
+        assert await registry.owner("ch") == "b"
+        await registry.release("ch", "b")
+        assert await registry.owner("ch") is None
+
+    asyncio.run(run())
@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+from realtime_agent.schema import SchemaValidationError, compile_schema
+from realtime_agent.tools import LocalToolCallExecuted, ToolContext
+
+WEATHER = {
+    "type": "object",
+    "properties": {
+        "city": {"type": "string", "minLength": 1},
+        "days": {"type": "integer", "minimum": 1, "maximum": 7},
+        "unit": {"enum": ["celsius", "fahrenheit"]},
+        "tags": {"type": "array", "items": {"type": "string"}, "maxItems": 2},
+    },
+    "required": ["city"],
+    "additionalProperties": False,
+}
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"city": "Oslo"},
+        {"city": "Oslo", "days": 7, "unit": "celsius", "tags": ["rain"]},
+    ],
+)
+def test_valid_values(value) -> None:
+    compile_schema(WEATHER)(value)
+
+
+@pytest.mark.parametrize(
+    "value, message",
+    [
+        ({}, "$: missing required property 'city'"),
+        ({"city": ""}, ".city: shorter than 1 characters"),
+        ({"city": "Oslo", "days": True}, ".days: expected integer, got bool"),
+        ({"city": "Oslo", "days": 8}, ".days: must be at most 7"),
+        ({"city": "Oslo", "unit": "kelvin"}, ".unit: must be one of ['celsius', 'fahrenheit']"),
+        ({"city": "Oslo", "tags": ["a", 1]}, ".tags[1]: expected string, got int"),
+        ({"city": "Oslo", "tags": ["a", "b", "c"]}, ".tags: expected at most 2 items"),
+        ({"city": "Oslo", "country": "NO"}, "$: unexpected property 'country'"),
+    ],
+)
+def test_invalid_values(value, message) -> None:
+    with pytest.raises(SchemaValidationError) as error:
+        compile_schema(WEATHER)(value)
+    assert str(error.value) == message
+
+
+def test_any_of_and_nullable_types() -> None:
+    validate = compile_schema({"anyOf": [{"type": "string", "pattern": "^[a-z]+$"}, {"type": ["integer", "null"]}]})
+    for value in ("abc", 3, None):
+        validate(value)
+    for value in ("ABC", 1.5):
+        with pytest.raises(SchemaValidationError):
+            validate(value)
+
+
+def test_unsupported_type_fails_at_compile_time() -> None:
+    with pytest.raises(ValueError, match="Unsupported schema type"):
+        compile_schema({"type": "date"})
+
+
+def test_tool_call_with_invalid_arguments_is_not_executed() -> None:
+    calls = []
+
+    async def get_weather(**kwargs) -> dict:
+        calls.append(kwargs)
+        return {"temperature": 12}
+
+    tools = ToolContext()
+    tools.register_function(name="get_weather", parameters=WEATHER, fn=get_weather)
+
+    rejected = asyncio.run(tools.execute_tool("get_weather", json.dumps({"city": "Oslo", "days": 0})))
+    assert isinstance(rejected, LocalToolCallExecuted)
+    assert json.loads(rejected.json_encoded_output)["status"] == "error"
+    assert calls == []
+
+    executed = asyncio.run(tools.execute_tool("get_weather", json.dumps({"city": "Oslo"})))
+    assert json.loads(executed.json_encoded_output) == {"temperature": 12}
+    assert calls == [{"city": "Oslo"}]
+
+
+def test_one_of_requires_exactly_one_match() -> None:
+    validate = compile_schema({"oneOf": [{"type": "integer"}, {"type": "number", "minimum": 10}]})
+    validate(3)
+    validate(10.5)
+    # an integer of at least 10 matches both options
+    with pytest.raises(SchemaValidationError, match="exactly one"):
+        validate(12)
+    with pytest.raises(SchemaValidationError, match="exactly one"):
+        validate("3")
+
+
+def test_any_of_and_one_of_both_apply() -> None:
+    validate = compile_schema({
+        "anyOf": [{"type": "string"}, {"type": "integer"}],
+        "oneOf": [{"type": "integer", "minimum": 0}, {"type": "integer", "maximum": 0}, {"type": "string"}],
+    })
+    validate("text")
+    validate(5)
+    with pytest.raises(SchemaValidationError, match="exactly one"):
+        validate(0)
+    with pytest.raises(SchemaValidationError, match="any of"):
+        validate(None)
@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+
+from realtime_agent import main
+from realtime_agent.admission import AdmissionDecision
+from realtime_agent.cluster import ClusterNode
+from realtime_agent.registry import InMemoryRedis, RedisSessionRegistry
+
+
+class FakeRequest:
+    headers: dict[str, str] = {}
+
+    def __init__(self, body: dict) -> None:
+        self.body = body
+
+    async def json(self) -> dict:
+        return self.body
+
+
+class QueuedAdmission:
+    """Admits every request after it waited in the queue."""
+
+    waiting = 0
+
+    def check(self, active_sessions: int, pids: list[int]) -> AdmissionDecision:
+        return AdmissionDecision(admitted=True)
+
+    async def admit(self, active_sessions, pids) -> AdmissionDecision:
+        await asyncio.sleep(0.01)
+        return AdmissionDecision(admitted=True)
+
+    def release(self) -> None:
+        pass
+
+
+class FakeWorker:
+    pid = 1
+
+    def is_alive(self) -> bool:
+        return True
+
+
+@pytest.fixture
+def server(monkeypatch) -> list[FakeWorker]:
+    started: list[FakeWorker] = []
+
+    def start_worker(entry_point: str, *args) -> FakeWorker:
+        started.append(FakeWorker())
+        return started[-1]
+
+    async def monitor_process(channel_name: str, worker: FakeWorker) -> None:
+        pass
+
+    monkeypatch.setattr(main, "cluster", ClusterNode(RedisSessionRegistry(InMemoryRedis()), node_id="a", url="http://a"), raising=False)
+    monkeypatch.setattr(main, "admission", QueuedAdmission(), raising=False)
+    monkeypatch.setattr(main, "active_processes", {})
+    monkeypatch.setattr(main, "start_worker", start_worker)
+    monkeypatch.setattr(main, "take_warm_worker", lambda *args: None)
+    monkeypatch.setattr(main, "monitor_process", monitor_process)
+    return started
+
+
+def _start(channel_name: str) -> FakeRequest:
+    return FakeRequest({"channel_name": channel_name, "uid": 123})
+
+
+def test_concurrent_starts_for_a_channel_start_one_agent(server: list[FakeWorker]) -> None:
+    async def run() -> list[int]:
+        responses = await asyncio.gather(main.start_agent(_start("room")), main.start_agent(_start("room")))
+        return sorted(response.status for response in responses)
+
+    assert asyncio.run(run()) == [200, 400]
+    assert len(server) == 1
+    assert main.starting_channels == set()
+
+
+def test_lease_held_by_this_node_is_a_conflict(server: list[FakeWorker]) -> None:
+    async def run():
+        # e.g. the agent of the channel is stopping and has not released its lease yet
+        await main.cluster.claim("room")
+        return await main.start_agent(_start("room"))
+
+    response = asyncio.run(run())
+    assert response.status == 400
+    assert json.loads(response.text)["node_id"] == "a"
+    assert server == []
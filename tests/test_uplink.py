@@ -0,0 +1,99 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from realtime_agent.realtime import uplink
+from realtime_agent.realtime.uplink import COMPRESS, DROP, UplinkSender
+
+FRAME_S = 0.01
+SPEECH = np.full(240, 3000, dtype=np.int16).tobytes()
+SILENCE = np.zeros(240, dtype=np.int16).tobytes()
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeConnection:
+    is_healthy = True
+
+    def __init__(self, clock: FakeClock) -> None:
+        self.clock = clock
+        self.sent = 0
+        # seconds the next send blocks for
+        self.stall_s = 0.0
+
+    def write_buffer_size(self) -> int:
+        return 0
+
+    async def send_audio_data(self, data: bytes) -> None:
+        self.clock.now += self.stall_s
+        self.stall_s = 0.0
+        self.sent += 1
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(uplink, "time", clock)
+    return clock
+
+
+def stream(sender: UplinkSender, clock: FakeClock, frames: list[bytes], real_time: bool = True) -> list[bool]:
+    async def run() -> list[bool]:
+        results = []
+        for frame in frames:
+            if real_time:
+                clock.now += FRAME_S
+            results.append(await sender.send(frame))
+        return results
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("policy", [DROP, COMPRESS])
+def test_pause_in_the_stream_is_not_lag(clock, policy):
+    connection = FakeConnection(clock)
+    sender = UplinkSender(connection, policy=policy, max_staleness_ms=500)
+
+    assert all(stream(sender, clock, [SPEECH] * 100))
+    # e.g. the remote microphone was muted for a second
+    clock.now += 1.0
+    after = stream(sender, clock, [SILENCE, SPEECH] * 500)
+
+    assert all(after)
+    assert sender.gaps == 1
+    assert sender.shed_frames == 0
+
+
+def test_backlog_after_a_stalled_send_is_shed(clock):
+    connection = FakeConnection(clock)
+    sender = UplinkSender(connection, policy=DROP, max_staleness_ms=500)
+    stream(sender, clock, [SPEECH] * 10)
+
+    # one send blocks for a second, the frames queued meanwhile are read at once
+    connection.stall_s = 1.0
+    stream(sender, clock, [SPEECH])
+    burst = stream(sender, clock, [SPEECH] * 100, real_time=False)
+
+    assert sender.gaps == 0
+    assert not burst[0]
+    assert burst[-1]
+    assert 40 <= sender.shed_frames <= 60
+
+
+def test_compress_sheds_only_silence_of_the_backlog(clock):
+    connection = FakeConnection(clock)
+    sender = UplinkSender(connection, policy=COMPRESS, max_staleness_ms=500, max_lag_ms=2000)
+    stream(sender, clock, [SPEECH] * 10)
+
+    connection.stall_s = 1.0
+    stream(sender, clock, [SPEECH])
+    burst = stream(sender, clock, [SPEECH, SILENCE] * 10, real_time=False)
+
+    assert burst == [True, False] * 10
@@ -0,0 +1,17 @@
+from realtime_agent import utils
+from realtime_agent.utils import StartupTimings
+
+
+def test_startup_timings_total_is_the_critical_path(monkeypatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(utils.time, "monotonic", lambda: now[0])
+    timings = StartupTimings()
+
+    # rtc_join and model_connect overlap
+    with timings.phase("rtc_join"):
+        now[0] = 100.3
+    now[0] = 100.1
+    with timings.phase("model_connect"):
+        now[0] = 100.5
+
+    assert timings.as_dict() == {"rtc_join": 300.0, "model_connect": 400.0, "total": 500.0}